@@ -0,0 +1,21 @@
+#!/usr/bin/env python
+"""API server, with API_WORKERS uvicorn worker processes.
+
+The metrics files of the previous run are removed before the workers start, as
+they all write theirs to PROMETHEUS_MULTIPROC_DIR.
+"""
+
+import os
+
+import uvicorn
+
+from app.metrics import clear_multiprocess_dir
+
+if __name__ == "__main__":
+    clear_multiprocess_dir()
+    uvicorn.run(
+        "app.main:app",
+        host="0.0.0.0",
+        port=80,
+        workers=int(os.getenv("API_WORKERS", "4")),
+    )
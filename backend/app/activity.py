@@ -0,0 +1,185 @@
+"""Write-behind buffer for activity timestamps.
+
+Every feed poll sets the user's `last_request`, and every click also the
+article's `updated`. With ACTIVITY_WRITE_BEHIND=1 these touches are buffered
+in Redis hashes instead, keeping the latest time per user and article, and
+`flush` writes each buffered row once, as a single UPDATE statement per
+table. Frozen users are still unfrozen right away by their callers.
+
+Freezing and the retention cleanups read these timestamps, so they flush the
+buffer first, waiting for a flush already running to finish. The touches that a flush merges into a later one of the same
+row are counted as absorbed writes.
+"""
+
+import os
+import time
+from datetime import datetime
+from typing import Any
+
+from loguru import logger
+from redis import Redis  # type: ignore
+from redis.exceptions import RedisError  # type: ignore
+from sqlalchemy import Engine, bindparam, update
+from sqlmodel import Session
+
+from .metrics import ACTIVITY_ABSORBED, ACTIVITY_FLUSHED, ACTIVITY_TOUCHES
+from .models.article import Article
+from .models.counter import increment_counters
+from .models.user import User
+from .writer import apply_intents, write, write_handler
+
+ACTIVITY_WRITE_BEHIND = bool(os.getenv("ACTIVITY_WRITE_BEHIND", False))
+ACTIVITY_KEY = "activity:{}"
+ACTIVITY_TOUCHES_KEY = "activity:touches"
+ACTIVITY_FLUSH_LOCK_KEY = "activity:flush"
+FLUSHING_SUFFIX = ":flushing"
+# Seconds a waiting flush polls for the lock of a running one
+ACTIVITY_FLUSH_WAIT = float(os.getenv("ACTIVITY_FLUSH_WAIT", "60"))
+ACTIVITY_FLUSH_POLL_INTERVAL = 0.1
+KINDS = ("user", "article")
+# Maximum number of ids in the IN clause of the unfreeze statements
+UNFREEZE_CHUNK_SIZE = 500
+
+redis_conn = Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379"))
+
+
+def touch(kind: str, row_id: str | int, at: datetime) -> bool:
+    """Buffer the activity of a user or an article at `at`.
+
+    Returns:
+        Whether the touch was buffered. If not, the caller must write it.
+    """
+    if ACTIVITY_WRITE_BEHIND:
+        try:
+            redis_conn.hset(ACTIVITY_KEY.format(kind), str(row_id), at.isoformat())
+            redis_conn.hincrby(ACTIVITY_TOUCHES_KEY, kind, 1)
+        except RedisError as e:
+            logger.warning(f"Failed to buffer {kind} {row_id} activity: {e}")
+        else:
+            ACTIVITY_TOUCHES.labels(kind=kind, outcome="buffered").inc()
+            return True
+    ACTIVITY_TOUCHES.labels(kind=kind, outcome="direct").inc()
+    return False
+
+
+def _take(key: str) -> dict[bytes, bytes]:
+    """Move the buffered hash `key` aside and return its content.
+
+    A hash left aside by a failed flush is returned again, so that its
+    touches are not lost, and the current buffer waits for the next flush.
+    """
+    flushing = key + FLUSHING_SUFFIX
+    if not redis_conn.exists(flushing):
+        if not redis_conn.exists(key):
+            return {}
+        redis_conn.rename(key, flushing)
+    return redis_conn.hgetall(flushing)
+
+
+def flush(engine: Engine, wait: bool = False) -> dict[str, int]:
+    """Write the buffered activity to the database.
+
+    Args:
+        engine: Database to write to.
+        wait: Apply it right away, even with the write pipeline, for callers
+            that read the timestamps next. A flush already running is waited
+            for up to ACTIVITY_FLUSH_WAIT seconds instead of skipped.
+
+    Returns:
+        Number of rows written per kind.
+
+    Raises:
+        TimeoutError: If `wait` and the running flush did not finish in time,
+            so that the caller does not read stale timestamps.
+    """
+    if not ACTIVITY_WRITE_BEHIND:
+        return {}
+    deadline = time.monotonic() + ACTIVITY_FLUSH_WAIT
+    while not redis_conn.set(ACTIVITY_FLUSH_LOCK_KEY, 1, nx=True, ex=300):
+        if not wait:
+            logger.info("Activity flush already running, skipping")
+            return {}
+        if time.monotonic() >= deadline:
+            raise TimeoutError(
+                f"Activity flush still running after {ACTIVITY_FLUSH_WAIT}s"
+            )
+        time.sleep(ACTIVITY_FLUSH_POLL_INTERVAL)
+    try:
+        touches = {
+            kind.decode(): int(count)
+            for kind, count in _take(ACTIVITY_TOUCHES_KEY).items()
+        }
+        payload = {
+            kind: {
+                row_id.decode(): at.decode()
+                for row_id, at in _take(ACTIVITY_KEY.format(kind)).items()
+            }
+            for kind in KINDS
+        }
+        if any(payload.values()):
+            if wait:
+                apply_intents(engine, [{"kind": "activity", **payload}])
+            else:
+                write(engine, "activity", payload)
+        redis_conn.delete(
+            ACTIVITY_TOUCHES_KEY + FLUSHING_SUFFIX,
+            *(ACTIVITY_KEY.format(kind) + FLUSHING_SUFFIX for kind in KINDS),
+        )
+    finally:
+        redis_conn.delete(ACTIVITY_FLUSH_LOCK_KEY)
+
+    flushed = {kind: len(rows) for kind, rows in payload.items()}
+    for kind in KINDS:
+        ACTIVITY_FLUSHED.labels(kind=kind).inc(flushed[kind])
+        ACTIVITY_ABSORBED.labels(kind=kind).inc(
+            max(touches.get(kind, 0) - flushed[kind], 0)
+        )
+    logger.info(f"Flushed activity of {flushed} rows for {touches} touches")
+    return flushed
+
+
+@write_handler("activity")
+def _store_activity(session: Session, intent: dict[str, Any]) -> None:
+    connection = session.connection()
+    users = [
+        {"b_id": user_id, "b_at": datetime.fromisoformat(at)}
+        for user_id, at in intent["user"].items()
+    ]
+    if users:
+        table = User.__table__  # type: ignore[attr-defined]
+        # Never move a timestamp back, a direct write may have been later
+        connection.execute(
+            update(table)
+            .where(table.c.id == bindparam("b_id"))
+            .where(table.c.last_request < bindparam("b_at"))
+            .values(last_request=bindparam("b_at")),
+            users,
+        )
+        # Users frozen between their touch and this flush
+        unfrozen = 0
+        for i in range(0, len(users), UNFREEZE_CHUNK_SIZE):
+            ids = [user["b_id"] for user in users[i : i + UNFREEZE_CHUNK_SIZE]]
+            unfrozen += connection.execute(
+                update(table)
+                .where(table.c.id.in_(ids))
+                .where(table.c.is_frozen.is_(True))
+                .where(table.c.last_request > table.c.frozen_at)
+                .values(is_frozen=False, frozen_at=None)
+            ).rowcount
+        if unfrozen:
+            increment_counters(session, {"users.frozen": -unfrozen})
+            logger.info(f"Auto-unfroze {unfrozen} users due to activity")
+
+    articles = [
+        {"b_id": int(article_id), "b_at": datetime.fromisoformat(at)}
+        for article_id, at in intent["article"].items()
+    ]
+    if articles:
+        table = Article.__table__  # type: ignore[attr-defined]
+        connection.execute(
+            update(table)
+            .where(table.c.id == bindparam("b_id"))
+            .where(table.c.updated < bindparam("b_at"))
+            .values(updated=bindparam("b_at")),
+            articles,
+        )
@@ -1,5 +1,6 @@
+import asyncio
 import typer
-from sqlmodel import create_engine, SQLModel
+from sqlmodel import Session, SQLModel, select
 import os
 from app.tasks import (
     fetch_all_feeds,
@@ -11,21 +12,24 @@ from app.tasks import (
     cleanup_inactive_users,
     vacuum_database,
     get_database_stats,
+    reconcile_database_stats,
     run_full_maintenance,
     unfreeze_user,
     retry_disabled_feeds,
+    flush_activity,
+    recompute_clusters_batch,
+    CLUSTERS_BATCH_SIZE,
 )
+from app.database import get_engine
+from app.loadtest import load_targets, run_load_test
+from app.synthetic import generate_corpus as generate_synthetic_corpus
 from app.models.article import Article
 from app.models.feed import Feed
 from app.models.user import User
 
 models = [Article, Feed, User]
 
-ENGINE = create_engine(
-    os.getenv("DATABASE_URL", "sqlite:///data/db.sqlite"),
-    echo=bool(os.getenv("DEBUG", False)),
-    connect_args={"check_same_thread": False},
-)
+ENGINE = get_engine()
 
 cli = typer.Typer(help="RSS Filter maintenance CLI")
 
@@ -72,6 +76,29 @@ def unfreeze(user_id: str) -> None:
         typer.echo(f"User {user_id} was not frozen or does not exist")
 
 
+@cli.command()
+def flush_activity_buffer() -> None:
+    """Write the buffered activity timestamps (ACTIVITY_WRITE_BEHIND)."""
+    flushed = flush_activity(wait=True)
+    typer.echo(
+        f"Flushed the activity of {flushed.get('user', 0)} users and "
+        f"{flushed.get('article', 0)} articles"
+    )
+
+
+@cli.command()
+def clusters(batch_size: int = CLUSTERS_BATCH_SIZE) -> None:
+    """Recompute the clusters of all users, in batches."""
+    with Session(ENGINE) as session:
+        user_ids = list(session.exec(select(User.id)).all())
+    typer.echo(f"Computing clusters for {len(user_ids)} users")
+    recomputed = sum(
+        recompute_clusters_batch(user_ids[i : i + batch_size])
+        for i in range(0, len(user_ids), batch_size)
+    )
+    typer.echo(f"Recomputed the clusters of {recomputed} users")
+
+
 @cli.command()
 def clean_articles(days: int = 180) -> None:
     """Delete old unread articles to free up space."""
@@ -97,10 +124,20 @@ def clean_users(days: int = 365) -> None:
 
 
 @cli.command()
-def vacuum() -> None:
-    """Run VACUUM and ANALYZE on the database."""
-    vacuum_database()
-    typer.echo("Database vacuumed and analyzed")
+def vacuum(full: bool = False) -> None:
+    """Reclaim free pages and optimize the database.
+
+    Uses incremental vacuum unless --full is given or the database is too
+    fragmented, in which case a full VACUUM is run.
+    """
+    result = vacuum_database(full=full)
+    if result["freelist_before"] is None:
+        typer.echo(f"Database vacuumed ({result['mode']})")
+        return
+    typer.echo(
+        f"Database vacuumed ({result['mode']}): freelist "
+        f"{result['freelist_before']} -> {result['freelist_after']} pages"
+    )
 
 
 @cli.command()
@@ -118,6 +155,25 @@ def stats() -> None:
     typer.echo(f"  - With embeddings: {stats['articles']['with_embeddings']}")
     typer.echo(f"User-Article Links: {stats['links']['user_article']}")
     typer.echo(f"User-Feed Links: {stats['links']['user_feed']}")
+    storage = stats["storage"]
+    file_size = (
+        f"{storage['file_size'] / 1024 / 1024:.1f} MB"
+        if storage["file_size"] is not None
+        else "n/a"
+    )
+    typer.echo(f"Database file size: {file_size}")
+    if storage["freelist_pages"] is not None:
+        typer.echo(
+            f"  - Freelist pages: {storage['freelist_pages']}/{storage['page_count']}"
+        )
+
+
+@cli.command()
+def reconcile_stats() -> None:
+    """Recount the stats counters exactly and correct any drift."""
+    drift = reconcile_database_stats()
+    drifted = {name: value for name, value in drift.items() if value}
+    typer.echo(f"Stats counters reconciled, corrected drift: {drifted or 'none'}")
 
 
 @cli.command()
@@ -132,7 +188,85 @@ def maintenance() -> None:
     typer.echo(f"Deleted articles: {results['deleted_articles']}")
     typer.echo(f"Orphan article links: {results['orphan_article_links']}")
     typer.echo(f"Orphan feed links: {results['orphan_feed_links']}")
-    typer.echo("Database vacuumed: Yes")
+    vacuum = results["vacuum"]
+    typer.echo(f"Database vacuum: {vacuum['mode'] if vacuum else 'skipped'}")
+
+
+@cli.command()
+def generate_corpus(
+    users: int = 1000,
+    feeds: int = 200,
+    articles_per_feed: int = 100,
+    feeds_per_user: int = 10,
+    clicks_per_user: int = 30,
+    embedding_dim: int = 1024,
+    seed: int = 0,
+) -> None:
+    """Fill the database with a synthetic dataset for load testing.
+
+    Use a different --seed to add more data to an already generated database.
+    """
+    created = generate_synthetic_corpus(
+        ENGINE,
+        users=users,
+        feeds=feeds,
+        articles_per_feed=articles_per_feed,
+        feeds_per_user=feeds_per_user,
+        clicks_per_user=clicks_per_user,
+        embedding_dim=embedding_dim,
+        seed=seed,
+    )
+    typer.echo(
+        ", ".join(
+            f"{count} {table.replace('_', ' ')}" for table, count in created.items()
+        )
+        + " created"
+    )
+
+
+@cli.command()
+def load_test(
+    base_url: str = "http://localhost:8000",
+    requests: int = 1000,
+    concurrency: int = 20,
+    log_ratio: float = 0.3,
+    users: int = 100,
+    metrics_url: list[str] = typer.Option(
+        None, help="Metrics endpoints to read lock retries from (default: the API's)"
+    ),
+) -> None:
+    """Replay concurrent feed and click requests and report latencies."""
+    targets = load_targets(ENGINE, users=users)
+    if not targets:
+        typer.echo("No subscriptions found, run generate-corpus first")
+        raise typer.Exit(1)
+
+    result = asyncio.run(
+        run_load_test(
+            base_url,
+            targets,
+            requests=requests,
+            concurrency=concurrency,
+            log_ratio=log_ratio,
+            metrics_urls=metrics_url or None,
+        )
+    )
+    typer.echo(
+        f"\n{result.requests} requests in {result.duration:.1f} s "
+        f"({result.requests / result.duration:.1f} req/s, concurrency {concurrency})"
+    )
+    typer.echo("-" * 40)
+    for kind in ("feed", "log"):
+        p = result.percentiles(kind)
+        typer.echo(
+            f"{kind:<5} n={len(result.latencies[kind]):<6} p50={p['p50']:.0f} ms "
+            f"p90={p['p90']:.0f} ms p99={p['p99']:.0f} ms max={p['max']:.0f} ms"
+        )
+    typer.echo(f"Statuses: {dict(result.statuses)}")
+    lock_retries = (
+        "n/a" if result.lock_retries is None else f"{result.lock_retries:.0f}"
+    )
+    typer.echo(f"'database is locked' retries: {lock_retries}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,95 @@
+"""Click URLs served in the feeds, pointing to the log endpoint.
+
+When CLICK_SIGNING_KEY is set, click URLs carry a short HMAC over the user,
+the article and the target URL, so the log endpoint can tell the links it
+issued apart from crawler hits and forged ids without touching the database:
+
+    /v1/log/{user_id}/{article_id}/{signature}/{target url}
+
+Without a key, the unsigned URLs are issued and every click is logged.
+"""
+
+import base64
+import hashlib
+import hmac
+import re
+from urllib.parse import quote
+
+from .constants import API_BASE_URL, CLICK_SIGNING_KEY, ROOT_PATH
+
+SIGNATURE_BYTES = 9
+# base64url of SIGNATURE_BYTES bytes, without padding
+SIGNATURE_RE = re.compile(r"[A-Za-z0-9_-]{12}")
+
+
+def sign_click(user_id: str, article_id: int | None, url: str) -> str:
+    assert CLICK_SIGNING_KEY is not None
+    digest = hmac.new(
+        CLICK_SIGNING_KEY.encode(),
+        f"{user_id}\n{article_id}\n{url}".encode(),
+        hashlib.sha256,
+    ).digest()[:SIGNATURE_BYTES]
+    return base64.urlsafe_b64encode(digest).decode().rstrip("=")
+
+
+def verify_click(user_id: str, article_id: int, url: str, signature: str) -> bool:
+    """Check the signature of a click in constant time."""
+    if CLICK_SIGNING_KEY is None:
+        return False
+    return hmac.compare_digest(sign_click(user_id, article_id, url), signature)
+
+
+def split_signature(path: str) -> tuple[str | None, str]:
+    """Split the `{signature}/{target url}` part of a click URL.
+
+    Returns:
+        The signature, or None for an unsigned click, and the target URL.
+    """
+    signature, _, url = path.partition("/")
+    if url and SIGNATURE_RE.fullmatch(signature):
+        return signature, url
+    return None, path
+
+
+def click_prefix(user_id: str, base_url: str | None = None) -> str:
+    """The start of the click URLs of `user_id`, up to the article id.
+
+    Args:
+        base_url: Base URL of the API, including the root path. By default the
+            one the API serves the feeds from.
+    """
+    if base_url is None:
+        base_url = f"{API_BASE_URL}/{ROOT_PATH}"
+    return f"{base_url}/v1/log/{user_id}"
+
+
+def quote_target(url: str, signed: bool) -> str:
+    """Quote `url` for the end of a signed or unsigned click URL."""
+    if not signed:
+        return quote(url, safe="")
+    # Keeping ':' and '/' makes the URLs shorter, '?' and '#' are still
+    # quoted so the target's query and fragment stay in the path
+    return quote(url, safe=":/")
+
+
+def click_target(user_id: str, article_id: int | None, url: str, quoted: str) -> str:
+    """The end of a click URL, after the article id.
+
+    Args:
+        quoted: `url` quoted by `quote_target`, which callers can cache, as
+            only the signature depends on the user.
+    """
+    if CLICK_SIGNING_KEY is None:
+        return quoted
+    return f"{sign_click(user_id, article_id, url)}/{quoted}"
+
+
+def click_url(
+    user_id: str, article_id: int | None, url: str, base_url: str | None = None
+) -> str:
+    """The log endpoint URL that records the click and redirects to `url`."""
+    quoted = quote_target(url, signed=CLICK_SIGNING_KEY is not None)
+    return (
+        f"{click_prefix(user_id, base_url)}/{article_id}/"
+        f"{click_target(user_id, article_id, url, quoted)}"
+    )
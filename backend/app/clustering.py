@@ -0,0 +1,91 @@
+"""Clustering of many users at once from a shared embedding matrix.
+
+Popular articles are read by many users, so `recompute_clusters_batch` (in
+`app.tasks`) decodes the union of the users' read-article embeddings once into
+a single matrix, and every user's clusters are fitted on a view of its rows.
+
+The fits run in a pool of CLUSTERING_PROCESSES forked processes, which inherit
+the matrix instead of getting it pickled, and are only sent the row indices of
+each user. Each process fits with a single thread, so that they don't compete
+for the cores.
+"""
+
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+import numpy as np
+
+from .recommend import cluster_distances, cluster_embeddings
+
+N_CLUSTERS = 10
+CLUSTERING_PROCESSES = int(os.getenv("CLUSTERING_PROCESSES", str(os.cpu_count())))
+
+# The matrix shared with the forked processes of the pool
+_embeddings: np.ndarray | None = None
+
+
+class UserClusters(NamedTuple):
+    centers: np.ndarray
+    # Cluster and distance to its center of each of the user's rows, in order
+    labels: np.ndarray
+    distances: np.ndarray
+    # Time spent fitting, in seconds
+    duration: float
+
+
+def fit_user_clusters(X: np.ndarray) -> UserClusters:
+    start = time.perf_counter()
+    kmeans = cluster_embeddings(X, N_CLUSTERS)
+    return UserClusters(
+        centers=kmeans.cluster_centers_,
+        labels=kmeans.labels_,
+        distances=cluster_distances(X, kmeans),
+        duration=time.perf_counter() - start,
+    )
+
+
+def _fit_shared_rows(rows: np.ndarray) -> UserClusters:
+    from threadpoolctl import threadpool_limits
+
+    assert _embeddings is not None
+    with threadpool_limits(limits=1):
+        return fit_user_clusters(_embeddings[rows])
+
+
+def fit_clusters(
+    embeddings: np.ndarray,
+    rows_by_user: dict[str, np.ndarray],
+    processes: int | None = None,
+) -> dict[str, UserClusters]:
+    """Fit the clusters of each user on its rows of `embeddings`.
+
+    Args:
+        embeddings: Embeddings of all the users' articles, one per row.
+        rows_by_user: Indices of each user's articles in `embeddings`.
+        processes: Size of the process pool, CLUSTERING_PROCESSES by default.
+            With a single process, or a single user, the fits run inline.
+    """
+    global _embeddings
+    processes = min(processes or CLUSTERING_PROCESSES, len(rows_by_user))
+    if processes <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+        return {
+            user_id: fit_user_clusters(embeddings[rows])
+            for user_id, rows in rows_by_user.items()
+        }
+
+    _embeddings = embeddings
+    try:
+        with ProcessPoolExecutor(
+            max_workers=processes, mp_context=multiprocessing.get_context("fork")
+        ) as pool:
+            results = pool.map(
+                _fit_shared_rows,
+                rows_by_user.values(),
+                chunksize=max(len(rows_by_user) // (processes * 4), 1),
+            )
+            return dict(zip(rows_by_user, results))
+    finally:
+        _embeddings = None
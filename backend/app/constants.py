@@ -4,3 +4,6 @@ API_BASE_URL = getenv("API_BASE_URL", "https://rssfilter.sgn.space/").rstrip("/"
 ROOT_PATH = getenv("ROOT_PATH", "/").lstrip("/").rstrip("/")
 
 WEB_URL = getenv("WEB_URL", "https://rssfilter.sgn.space/").rstrip("/")
+
+# Secret used to sign the click URLs in the feeds, see app/clicks.py
+CLICK_SIGNING_KEY = getenv("CLICK_SIGNING_KEY") or None
@@ -0,0 +1,222 @@
+"""Database engines for SQLite and PostgreSQL.
+
+DATABASE_URL selects the backend. SQLite (the default) is a single file on a
+shared volume, configured for concurrent access with WAL and a busy timeout.
+PostgreSQL lets the API and the workers run on several nodes; every process
+keeps its own connection pool, sized with DB_POOL_SIZE and DB_MAX_OVERFLOW so
+that the API processes (many concurrent requests) and the RQ workers (one job
+at a time) together stay below the server's max_connections.
+"""
+
+import os
+import time
+from functools import lru_cache, wraps
+from sqlite3 import OperationalError as SQLiteOperationalError
+from typing import Any, Callable, TypeVar
+
+from loguru import logger
+
+from sqlalchemy import Table, event, text
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Connection, Engine, make_url
+from sqlmodel import create_engine
+
+from .metrics import DB_LOCK_RETRIES
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///data/db.sqlite")
+# A read replica for the read-only engine, DATABASE_URL by default
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", str(DB_POOL_SIZE)))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# SQLSTATEs of transactions that PostgreSQL aborted and that succeed when retried
+POSTGRESQL_RETRYABLE_ERRORS = {
+    "40001",  # serialization_failure
+    "40P01",  # deadlock_detected
+    "55P03",  # lock_not_available
+}
+
+
+def set_sqlite_pragma(dbapi_connection, connection_record):  # type: ignore[no-untyped-def]
+    """Configure SQLite for better concurrency."""
+    cursor = dbapi_connection.cursor()
+    # Must come before journal_mode, which initialises a new database file.
+    # Existing databases only switch over after their next full VACUUM.
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA busy_timeout=30000")
+    cursor.close()
+
+
+def set_sqlite_read_only(dbapi_connection, connection_record):  # type: ignore[no-untyped-def]
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA query_only=ON")
+    cursor.execute("PRAGMA busy_timeout=30000")
+    cursor.close()
+
+
+def create_db_engine(url: str | None = None, **kwargs: Any) -> Engine:
+    """Create an engine configured for the backend of `url`.
+
+    Args:
+        url: Database URL, DATABASE_URL by default.
+        **kwargs: Extra arguments for `create_engine`, overriding the defaults.
+    """
+    url = url or DATABASE_URL
+    options: dict[str, Any] = {"echo": bool(os.getenv("DEBUG", False))}
+    if url.startswith("sqlite"):
+        options["connect_args"] = {"check_same_thread": False, "timeout": 30}
+    else:
+        options |= {
+            # The columns are timestamps without time zone, so aware datetimes
+            # must be converted to UTC, not to the server's time zone
+            "connect_args": {"options": "-c timezone=utc"},
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_timeout": DB_POOL_TIMEOUT,
+            # Connections are dropped by the server or a pooler after idling
+            "pool_pre_ping": True,
+            "pool_recycle": 1800,
+        }
+    engine = create_engine(url, **(options | kwargs))
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", set_sqlite_pragma)
+    else:
+        # RQ forks a work-horse per job, which must not reuse the parent's
+        # connections: they are dropped (not closed) in the child
+        os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
+    return engine
+
+
+def create_read_engine(url: str | None = None, **kwargs: Any) -> Engine:
+    """Create an engine whose connections can only read.
+
+    SQLite files are opened with `mode=ro` and `query_only`, so the readers
+    never take the write lock. Other backends get read-only transactions, on
+    a replica if DATABASE_READ_URL is set.
+
+    Args:
+        url: Database URL, DATABASE_READ_URL or DATABASE_URL by default.
+        **kwargs: Extra arguments for `create_engine`, overriding the defaults.
+    """
+    url_obj = make_url(url or DATABASE_READ_URL or DATABASE_URL)
+    if url_obj.get_backend_name() != "sqlite":
+        engine = create_db_engine(
+            url_obj.render_as_string(hide_password=False),
+            **({"pool_size": DB_READ_POOL_SIZE} | kwargs),
+        )
+        return engine.execution_options(postgresql_readonly=True)
+
+    options: dict[str, Any] = {
+        "echo": bool(os.getenv("DEBUG", False)),
+        "connect_args": {"check_same_thread": False, "timeout": 30},
+    }
+    database = url_obj.database
+    if database and database != ":memory:" and not database.startswith("file:"):
+        url_obj = url_obj.set(
+            database=f"file:{database}", query={"mode": "ro", "uri": "true"}
+        )
+    engine = create_engine(url_obj, **(options | kwargs))
+    event.listen(engine, "connect", set_sqlite_read_only)
+    return engine
+
+
+@lru_cache(maxsize=None)
+def get_engine() -> Engine:
+    """The engine shared by everything in this process."""
+    return create_db_engine()
+
+
+@lru_cache(maxsize=None)
+def get_read_engine() -> Engine:
+    """The read-only engine shared by the read paths of this process."""
+    return create_read_engine()
+
+
+def is_sqlite(bind: Engine | Connection) -> bool:
+    return bind.dialect.name == "sqlite"
+
+
+def is_retryable_error(e: Exception) -> bool:
+    """Whether `e` is a lock or serialization error that a retry can resolve."""
+    if "database is locked" in str(e) or isinstance(
+        e.__cause__, SQLiteOperationalError
+    ):
+        return True
+    orig = getattr(e, "orig", None)
+    # psycopg 3 and psycopg2 name the SQLSTATE differently
+    sqlstate = getattr(orig, "sqlstate", None) or getattr(orig, "pgcode", None)
+    return sqlstate in POSTGRESQL_RETRYABLE_ERRORS
+
+
+T = TypeVar("T")
+
+
+def with_db_retry(
+    max_retries: int = 3,
+    base_delay: float = 0.1,
+    max_delay: float = 2.0,
+) -> Callable[[Callable[..., T]], Callable[..., T]]:
+    """Decorator to retry database operations on lock errors with exponential backoff.
+
+    Retries SQLite's "database is locked" and the serialization failures and
+    deadlocks PostgreSQL aborts transactions with.
+    """
+
+    def decorator(func: Callable[..., T]) -> Callable[..., T]:
+        @wraps(func)
+        def wrapper(*args, **kwargs) -> T:  # type: ignore[no-untyped-def]
+            last_exception = None
+            for attempt in range(max_retries):
+                try:
+                    return func(*args, **kwargs)
+                except Exception as e:
+                    if is_retryable_error(e):
+                        last_exception = e
+                        DB_LOCK_RETRIES.labels(function=func.__name__).inc()
+                        delay = min(base_delay * (2**attempt), max_delay)
+                        logger.warning(
+                            f"Database locked on attempt {attempt + 1}/{max_retries} "
+                            f"for {func.__name__}, retrying in {delay:.2f}s"
+                        )
+                        time.sleep(delay)
+                    else:
+                        raise
+            logger.error(
+                f"Database still locked after {max_retries} retries for {func.__name__}"
+            )
+            raise last_exception  # type: ignore[misc]
+
+        return wrapper
+
+    return decorator
+
+
+def insert_ignore(bind: Engine | Connection, table: Table | type, *conflict: str):  # type: ignore[no-untyped-def]
+    """An INSERT that skips rows conflicting on the `conflict` columns.
+
+    Both SQLite and PostgreSQL support `INSERT ... ON CONFLICT DO NOTHING`,
+    which checks and inserts each row in one statement.
+    """
+    insert = postgresql_insert if bind.dialect.name == "postgresql" else sqlite_insert
+    return insert(table).on_conflict_do_nothing(index_elements=list(conflict))
+
+
+def sync_sequences(connection: Connection, *tables: str) -> None:
+    """Move PostgreSQL's id sequences past rows inserted with explicit ids.
+
+    SQLite picks the next rowid from the table itself, PostgreSQL from a
+    sequence that explicit ids don't advance.
+    """
+    if connection.dialect.name != "postgresql":
+        return
+    for table in tables:
+        connection.execute(
+            text(
+                f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), "
+                f'coalesce(max(id), 0) + 1, false) FROM "{table}"'
+            )
+        )
@@ -0,0 +1,175 @@
+"""Load driver replaying concurrent feed and click traffic against the API.
+
+Targets are sampled from the database (usually one filled by
+`app.synthetic.generate_corpus`), so every request is for a feed the user is
+subscribed to and every click is for an article of that feed. Clicks are
+signed with CLICK_SIGNING_KEY like the links of the served feeds, so the API
+must run with the same key for them to be logged.
+"""
+
+import asyncio
+import random
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+
+import aiohttp
+import numpy as np
+from loguru import logger
+from sqlalchemy import Engine
+from sqlmodel import Session, select
+
+from .clicks import click_url
+from .models.article import Article
+from .models.feed import Feed
+from .models.relations import UserFeedLink
+
+LOCK_RETRIES_METRIC = "rssfilter_db_lock_retries_total"
+
+
+@dataclass
+class Target:
+    user_id: str
+    feed_url: str
+    articles: list[tuple[int, str]]
+
+
+@dataclass
+class LoadTestResult:
+    duration: float
+    latencies: dict[str, list[float]] = field(default_factory=dict)
+    statuses: Counter = field(default_factory=Counter)
+    lock_retries: float | None = None
+
+    def percentiles(self, kind: str) -> dict[str, float]:
+        """Latency percentiles of the `kind` requests, in milliseconds."""
+        values = np.array(self.latencies.get(kind) or [0.0]) * 1000
+        return {
+            "p50": float(np.percentile(values, 50)),
+            "p90": float(np.percentile(values, 90)),
+            "p99": float(np.percentile(values, 99)),
+            "max": float(values.max()),
+        }
+
+    @property
+    def requests(self) -> int:
+        return sum(len(values) for values in self.latencies.values())
+
+
+def load_targets(engine: Engine, users: int = 100, seed: int = 0) -> list[Target]:
+    """Sample up to `users` users and their subscriptions from the database."""
+    with Session(engine) as session:
+        links = session.exec(
+            select(UserFeedLink.user_id, Feed.id, Feed.url).join(
+                Feed,
+                UserFeedLink.feed_id == Feed.id,  # type: ignore[arg-type]
+            )
+        ).all()
+        by_user: dict[str, list[tuple[int, str]]] = {}
+        for user_id, feed_id, feed_url in links:
+            assert feed_id is not None  # the primary key of a stored feed
+            by_user.setdefault(str(user_id), []).append((feed_id, feed_url))
+
+        sampled = random.Random(seed).sample(sorted(by_user), min(users, len(by_user)))
+        articles: dict[int, list[tuple[int, str]]] = {}
+        targets = []
+        for user_id in sampled:
+            for feed_id, feed_url in by_user[user_id]:
+                if feed_id not in articles:
+                    articles[feed_id] = [
+                        (article_id, url)
+                        for article_id, url in session.exec(
+                            select(Article.id, Article.url)
+                            .where(Article.feed_id == feed_id)
+                            .order_by(Article.pub_date.desc())  # type: ignore[union-attr]
+                            .limit(30)
+                        ).all()
+                        if article_id is not None
+                    ]
+                targets.append(Target(user_id, feed_url, articles[feed_id]))
+    return targets
+
+
+async def scrape_lock_retries(
+    session: aiohttp.ClientSession, metrics_urls: list[str]
+) -> float | None:
+    """Sum the 'database is locked' retries reported by the metrics endpoints."""
+    total = 0.0
+    for url in metrics_urls:
+        try:
+            async with session.get(url) as response:
+                text = await response.text()
+        except aiohttp.ClientError as e:
+            logger.warning(f"Could not scrape {url}: {e}")
+            return None
+        for line in text.splitlines():
+            if line.startswith(LOCK_RETRIES_METRIC):
+                total += float(line.rsplit(" ", 1)[1])
+    return total
+
+
+async def run_load_test(
+    base_url: str,
+    targets: list[Target],
+    requests: int = 1000,
+    concurrency: int = 20,
+    log_ratio: float = 0.3,
+    metrics_urls: list[str] | None = None,
+    seed: int = 0,
+) -> LoadTestResult:
+    """Send `requests` feed and click requests, `concurrency` at a time.
+
+    Args:
+        base_url: Base URL of the API, including the root path.
+        targets: Users and feeds to request, from `load_targets`.
+        requests: Total number of requests.
+        concurrency: Requests in flight at the same time.
+        log_ratio: Fraction of the requests that are clicks (`/v1/log`).
+        metrics_urls: Metrics endpoints to read the lock retries from before
+            and after the run (the API's and the workers').
+        seed: Seed for choosing the targets.
+    """
+    base_url = base_url.rstrip("/")
+    metrics_urls = metrics_urls if metrics_urls is not None else [f"{base_url}/metrics"]
+    rng = random.Random(seed)
+    plan = []
+    for _ in range(requests):
+        target = rng.choice(targets)
+        if target.articles and rng.random() < log_ratio:
+            article_id, url = rng.choice(target.articles)
+            plan.append(("log", click_url(target.user_id, article_id, url, base_url)))
+        else:
+            plan.append(
+                ("feed", f"{base_url}/v1/feed/{target.user_id}/{target.feed_url}")
+            )
+
+    result = LoadTestResult(duration=0.0, latencies={"feed": [], "log": []})
+    queue: asyncio.Queue[tuple[str, str]] = asyncio.Queue()
+    for item in plan:
+        queue.put_nowait(item)
+
+    async def worker(session: aiohttp.ClientSession) -> None:
+        while not queue.empty():
+            kind, url = queue.get_nowait()
+            start = time.perf_counter()
+            try:
+                async with session.get(url, allow_redirects=False) as response:
+                    await response.read()
+                    status = str(response.status)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                status = type(e).__name__
+            result.latencies[kind].append(time.perf_counter() - start)
+            result.statuses[f"{kind} {status}"] += 1
+
+    timeout = aiohttp.ClientTimeout(total=60)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        retries_before = await scrape_lock_retries(session, metrics_urls)
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+        result.duration = time.perf_counter() - start
+        retries_after = await scrape_lock_retries(session, metrics_urls)
+
+    if retries_before is not None and retries_after is not None:
+        result.lock_retries = retries_after - retries_before
+    return result
@@ -0,0 +1,108 @@
+"""Event loop lag and stall detection.
+
+A heartbeat task measures how late the event loop wakes it up (the loop
+lag), and a watchdog thread checks that the heartbeat keeps running. When
+the loop is blocked for longer than LOOP_STALL_THRESHOLD_MS, the watchdog
+logs the stack of the loop's thread, which shows the blocking call, and the
+task that was running.
+
+Enabled with LOOP_MONITOR=1. LOOP_MONITOR_SAMPLE_RATE is the fraction of
+stalls whose stack is captured and logged (stalls are always counted), to
+keep the overhead low in production.
+"""
+
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+import traceback
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+from loguru import logger
+
+from .metrics import EVENT_LOOP_LAG, EVENT_LOOP_STALLS
+
+LOOP_MONITOR_ENABLED = bool(os.getenv("LOOP_MONITOR", False))
+LOOP_STALL_THRESHOLD_MS = float(os.getenv("LOOP_STALL_THRESHOLD_MS", "100"))
+LOOP_MONITOR_SAMPLE_RATE = float(os.getenv("LOOP_MONITOR_SAMPLE_RATE", "1.0"))
+
+
+class Watchdog:
+    def __init__(
+        self, name: str, loop: asyncio.AbstractEventLoop, threshold: float
+    ) -> None:
+        self.name = name
+        self.loop = loop
+        self.loop_thread_id = threading.get_ident()
+        self.threshold = threshold
+        self.last_beat = time.monotonic()
+        self.stalled = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._watch, name=f"loop-watchdog-{name}", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def beat(self) -> None:
+        self.last_beat = time.monotonic()
+        self.stalled = False
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.threshold / 4):
+            blocked_for = time.monotonic() - self.last_beat
+            if blocked_for > self.threshold and not self.stalled:
+                # Reported once per stall, the next heartbeat rearms it
+                self.stalled = True
+                EVENT_LOOP_STALLS.labels(loop=self.name).inc()
+                if random.random() < LOOP_MONITOR_SAMPLE_RATE:
+                    self._report(blocked_for)
+
+    def _report(self, blocked_for: float) -> None:
+        frame = sys._current_frames().get(self.loop_thread_id)
+        stack = "".join(traceback.format_stack(frame)) if frame else "unknown"
+        task = asyncio.current_task(self.loop)
+        logger.bind(loop=self.name, blocked_ms=round(blocked_for * 1000)).warning(
+            f"Event loop {self.name} blocked for more than "
+            f"{blocked_for * 1000:.0f} ms, running {task!r}:\n{stack}"
+        )
+
+
+async def _heartbeat(name: str, watchdog: Watchdog, interval: float) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        watchdog.beat()
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(loop.time() - start - interval, 0.0)
+        EVENT_LOOP_LAG.labels(loop=name).observe(lag)
+
+
+@asynccontextmanager
+async def monitor_event_loop(name: str) -> AsyncIterator[None]:
+    """Monitor the running event loop while the block runs, if enabled.
+
+    Args:
+        name: Name of the loop in the metrics and logs (e.g. "api").
+    """
+    if not LOOP_MONITOR_ENABLED:
+        yield
+        return
+
+    threshold = LOOP_STALL_THRESHOLD_MS / 1000
+    watchdog = Watchdog(name, asyncio.get_running_loop(), threshold)
+    watchdog.start()
+    heartbeat = asyncio.create_task(_heartbeat(name, watchdog, threshold / 2))
+    try:
+        yield
+    finally:
+        heartbeat.cancel()
+        watchdog.stop()
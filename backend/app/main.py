@@ -1,11 +1,14 @@
 from os import getenv
 import time
 
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import feed, log, signup, user
+from app.routers import feed, log, signup, stats, user
 from app.constants import ROOT_PATH
+from app.metrics import CONTENT_TYPE_LATEST, REQUEST_LATENCY, generate_metrics
+from app.loopmonitor import monitor_event_loop
+from app.tracing import trace
 from loguru import logger
 from fastapi_cache import FastAPICache
 from fastapi_cache.backends.redis import RedisBackend
@@ -22,7 +25,8 @@ async def lifespan(app: FastAPI):
         FastAPICache.init(RedisBackend(redis), prefix="fastapi-cache")
     else:
         FastAPICache.init(InMemoryBackend(), prefix="fastapi-cache")
-    yield
+    async with monitor_event_loop("api"):
+        yield
 
 
 app = FastAPI(root_path=f"/{ROOT_PATH}" if ROOT_PATH else "", lifespan=lifespan)
@@ -31,21 +35,45 @@ logger.debug(f"Root path: {app.root_path}")
 app.include_router(feed.router, prefix="/v1/feed")
 app.include_router(log.router, prefix="/v1/log")
 app.include_router(signup.router, prefix="/v1/signup")
+app.include_router(stats.router, prefix="/v1/stats")
 app.include_router(user.router, prefix="/v1/user")
 
 
 @app.middleware("http")
 async def add_process_time_header(request: Request, call_next):
     start_time = time.time()
-    response = await call_next(request)
+    with trace(f"{request.method} {request.url.path}", log=False) as request_trace:
+        response = await call_next(request)
     process_time = time.time() - start_time
     response.headers["X-Process-Time"] = str(process_time)
-    logger.info(
-        f"Processed request in {round(process_time * 1000)} ms. {request.method} {request.url}"
-    )
+    # Label by route template, not by the raw path, to bound cardinality
+    route = request.scope.get("route")
+    REQUEST_LATENCY.labels(
+        method=request.method,
+        route=getattr(route, "path", "unmatched"),
+        status=response.status_code,
+    ).observe(process_time)
+    if request_trace is not None:
+        response.headers["Server-Timing"] = request_trace.server_timing()
+        logger.bind(stages=request_trace.breakdown()).info(
+            f"Processed request in {round(process_time * 1000)} ms. "
+            f"{request.method} {request.url} [{request_trace.server_timing()}]"
+        )
+    else:
+        logger.info(
+            f"Processed request in {round(process_time * 1000)} ms. {request.method} {request.url}"
+        )
     return response
 
 
+@app.get("/metrics", include_in_schema=False)
+def metrics() -> Response:
+    """Prometheus metrics, including the RQ queue depths."""
+    return Response(
+        content=generate_metrics(include_queues=True), media_type=CONTENT_TYPE_LATEST
+    )
+
+
 app.add_middleware(GZipMiddleware, minimum_size=1000)
 app.add_middleware(
     CORSMiddleware,
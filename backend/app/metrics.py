@@ -0,0 +1,288 @@
+"""Prometheus metrics for the API, the RQ workers and the scheduled jobs.
+
+When PROMETHEUS_MULTIPROC_DIR is set, samples are written to files in that
+directory, so values recorded by every uvicorn worker and by the forked RQ
+work-horses are aggregated at scrape time. Each service empties it when it
+starts (`clear_multiprocess_dir`), and the RQ workers fold the files of every
+work-horse into their own once it exits (`mark_process_dead`), so that it
+doesn't grow with every job.
+"""
+
+import glob
+import os
+import threading
+from datetime import datetime, timezone
+
+from loguru import logger
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+from prometheus_client.mmap_dict import MmapedDict
+from prometheus_client.core import GaugeMetricFamily
+from redis.exceptions import RedisError  # type: ignore
+
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+if PROMETHEUS_MULTIPROC_DIR:
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+
+# Held while the files of a dead process are merged, so that a scrape in the
+# same process never counts their samples twice (or not at all)
+_FILES_LOCK = threading.Lock()
+# Types of the samples that are summed over the processes
+_ACCUMULATED_TYPES = ("counter", "histogram", "summary")
+
+__all__ = [
+    "CONTENT_TYPE_LATEST",
+    "clear_multiprocess_dir",
+    "generate_metrics",
+    "mark_process_dead",
+    "start_metrics_server",
+]
+
+REQUEST_LATENCY = Histogram(
+    "rssfilter_http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+)
+
+FEED_FETCH_DURATION = Histogram(
+    "rssfilter_feed_fetch_duration_seconds",
+    "Time to fetch and parse a single upstream feed",
+    ["outcome"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30),
+)
+FEED_CREATIONS = Counter(
+    "rssfilter_feed_creations",
+    "Requests for unknown feeds by outcome (fetched, shared with a concurrent "
+    "request, or waited for another process)",
+    ["outcome"],
+)
+FEED_FETCH_BYTES = Counter(
+    "rssfilter_feed_fetch_bytes",
+    "Bytes downloaded from upstream feeds",
+)
+FEED_NEW_ARTICLES = Counter(
+    "rssfilter_feed_new_articles",
+    "New articles stored by fetch_feed_batch",
+)
+
+EMBEDDING_BATCH_SIZE = Histogram(
+    "rssfilter_embedding_batch_size",
+    "Number of articles embedded per compute_embeddings_batch job",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+EMBEDDING_DURATION = Histogram(
+    "rssfilter_embedding_duration_seconds",
+    "Time spent computing embeddings per compute_embeddings_batch job",
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+EMBEDDED_ARTICLES = Counter(
+    "rssfilter_embedded_articles",
+    "Articles embedded",
+)
+
+CLUSTERING_DURATION = Histogram(
+    "rssfilter_clustering_duration_seconds",
+    "Time spent fitting a user's clusters",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+CLUSTERING_BATCH_SIZE = Histogram(
+    "rssfilter_clustering_batch_size",
+    "Number of users clustered per recompute_clusters_batch job",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500),
+)
+
+CLICKS = Counter(
+    "rssfilter_clicks",
+    "Clicks on feed links by outcome (logged, duplicate, invalid or unsigned)",
+    ["outcome"],
+)
+
+EVENT_LOOP_LAG = Histogram(
+    "rssfilter_event_loop_lag_seconds",
+    "How late the event loop runs a scheduled callback",
+    ["loop"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+EVENT_LOOP_STALLS = Counter(
+    "rssfilter_event_loop_stalls",
+    "Times the event loop was blocked for longer than the stall threshold",
+    ["loop"],
+)
+
+DB_LOCK_RETRIES = Counter(
+    "rssfilter_db_lock_retries",
+    "Retries caused by 'database is locked' errors",
+    ["function"],
+)
+
+WRITE_INTENTS = Counter(
+    "rssfilter_write_intents",
+    "Write intents by kind and outcome (queued, applied, duplicate or failed)",
+    ["kind", "outcome"],
+)
+WRITE_BATCH_SIZE = Histogram(
+    "rssfilter_write_batch_size",
+    "Write intents committed per transaction",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500),
+)
+WRITE_LOCK_WAIT = Histogram(
+    "rssfilter_write_lock_wait_seconds",
+    "Time spent waiting for the database write lock",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+WRITE_COMMIT_DURATION = Histogram(
+    "rssfilter_write_commit_duration_seconds",
+    "Time to apply and commit a transaction of write intents",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+
+ACTIVITY_TOUCHES = Counter(
+    "rssfilter_activity_touches",
+    "Activity timestamp updates by kind (user or article) and outcome (buffered "
+    "or written)",
+    ["kind", "outcome"],
+)
+ACTIVITY_ABSORBED = Counter(
+    "rssfilter_activity_absorbed_writes",
+    "Buffered activity updates merged into a later update of the same row",
+    ["kind"],
+)
+ACTIVITY_FLUSHED = Counter(
+    "rssfilter_activity_flushed_rows",
+    "Rows written by activity buffer flushes",
+    ["kind"],
+)
+
+
+class QueueCollector:
+    """Report RQ queue depth and oldest job age, read from Redis at scrape time."""
+
+    def collect(self):  # type: ignore[no-untyped-def]
+        # imported here to avoid an import cycle
+        from app.tasks import QUEUES, redis_conn
+        from app.writer import WRITE_QUEUE_KEY
+
+        depth = GaugeMetricFamily(
+            "rssfilter_queue_depth", "Jobs waiting in the RQ queue", labels=["queue"]
+        )
+        oldest_age = GaugeMetricFamily(
+            "rssfilter_queue_oldest_job_age_seconds",
+            "Age of the oldest job waiting in the RQ queue",
+            labels=["queue"],
+        )
+        now = datetime.now(timezone.utc)
+        for queue in QUEUES:
+            try:
+                depth.add_metric([queue.name], queue.count)
+                job_ids = queue.get_job_ids(0, 1)
+                job = queue.fetch_job(job_ids[0]) if job_ids else None
+            except RedisError as e:
+                logger.warning(f"Could not read queue {queue.name} metrics: {e}")
+                continue
+            age = 0.0
+            if job is not None and job.enqueued_at is not None:
+                enqueued_at = job.enqueued_at
+                if enqueued_at.tzinfo is None:
+                    enqueued_at = enqueued_at.replace(tzinfo=timezone.utc)
+                age = max((now - enqueued_at).total_seconds(), 0.0)
+            oldest_age.add_metric([queue.name], age)
+        try:
+            depth.add_metric(["writes"], redis_conn.llen(WRITE_QUEUE_KEY))
+        except RedisError as e:
+            logger.warning(f"Could not read the write queue length: {e}")
+        yield depth
+        yield oldest_age
+
+
+class _LockedMultiProcessCollector:
+    """Read the samples files of all the processes, except during a merge."""
+
+    def __init__(self) -> None:
+        self._collector = multiprocess.MultiProcessCollector(  # type: ignore[no-untyped-call]
+            None, PROMETHEUS_MULTIPROC_DIR
+        )
+
+    def collect(self):  # type: ignore[no-untyped-def]
+        with _FILES_LOCK:
+            return list(self._collector.collect())
+
+
+_QUEUE_REGISTRY = CollectorRegistry(auto_describe=False)
+_QUEUE_REGISTRY.register(QueueCollector())  # type: ignore[arg-type]
+
+
+def _registry() -> CollectorRegistry:
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry(auto_describe=False)
+        registry.register(_LockedMultiProcessCollector())  # type: ignore[arg-type]
+        return registry
+    return REGISTRY
+
+
+def clear_multiprocess_dir() -> None:
+    """Remove the samples files left by a previous run of the service.
+
+    Call it once when the service starts, before any of its processes record
+    metrics.
+    """
+    if not PROMETHEUS_MULTIPROC_DIR:
+        return
+    paths = glob.glob(os.path.join(PROMETHEUS_MULTIPROC_DIR, "*.db"))
+    for path in paths:
+        os.remove(path)
+    logger.info(f"Removed {len(paths)} metrics files from {PROMETHEUS_MULTIPROC_DIR}")
+
+
+def mark_process_dead(pid: int) -> None:
+    """Fold the samples of the exited process `pid` into this process' files.
+
+    Counters and histograms keep their totals, in files of the calling process
+    that are reused for every process it folds, and the files of `pid` are
+    removed. Its live gauges are dropped.
+    """
+    if not PROMETHEUS_MULTIPROC_DIR:
+        return
+    with _FILES_LOCK:
+        multiprocess.mark_process_dead(pid, PROMETHEUS_MULTIPROC_DIR)  # type: ignore[no-untyped-call]
+        for typ in _ACCUMULATED_TYPES:
+            path = os.path.join(PROMETHEUS_MULTIPROC_DIR, f"{typ}_{pid}.db")
+            if not os.path.exists(path):
+                continue
+            merged = MmapedDict(
+                os.path.join(PROMETHEUS_MULTIPROC_DIR, f"{typ}_dead-{os.getpid()}.db")
+            )
+            try:
+                for key, value, timestamp, _ in MmapedDict.read_all_values_from_file(
+                    path
+                ):
+                    total, _ = merged.read_value(key)
+                    merged.write_value(key, total + value, timestamp)
+            finally:
+                merged.close()
+            os.remove(path)
+
+
+def generate_metrics(include_queues: bool = False) -> bytes:
+    """Render all metrics in the Prometheus text format.
+
+    Args:
+        include_queues: Also report RQ queue metrics, which queries Redis.
+    """
+    output = generate_latest(_registry())
+    if include_queues:
+        output += generate_latest(_QUEUE_REGISTRY)
+    return output
+
+
+def start_metrics_server(port: int) -> None:
+    """Serve the metrics on `port` from a background thread (for workers)."""
+    start_http_server(port, registry=_registry())
+    logger.info(f"Serving metrics on port {port}")
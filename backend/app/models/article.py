@@ -1,12 +1,24 @@
 from datetime import datetime, timezone
 
+from sqlalchemy import Index, column
 from sqlmodel import Field, Relationship, SQLModel, UniqueConstraint
 
 from .relations import UserArticleLink
 
 
 class Article(SQLModel, table=True):
-    __table_args__ = (UniqueConstraint("url", "feed_id"),)
+    __table_args__ = (
+        UniqueConstraint("url", "feed_id"),
+        # The latest articles of a feed
+        Index("ix_article_feed_id_pub_date", "feed_id", "pub_date"),
+        # Expiring the embeddings
+        Index(
+            "ix_article_updated_embedded",
+            "updated",
+            sqlite_where=column("embedding").is_not(None),
+            postgresql_where=column("embedding").is_not(None),
+        ),
+    )
 
     id: int | None = Field(default=None, primary_key=True)
     title: str
@@ -18,7 +30,7 @@ class Article(SQLModel, table=True):
         default_factory=lambda: datetime.now(timezone.utc), repr=False
     )
     embedding: str | None = Field(default=None, repr=False)
-    feed_id: int = Field(default=None, foreign_key="feed.id", index=True, repr=False)
+    feed_id: int = Field(default=None, foreign_key="feed.id", repr=False)
 
     users: list["User"] = Relationship(  # type: ignore # noqa: F821
         back_populates="articles", link_model=UserArticleLink
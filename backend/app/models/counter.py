@@ -0,0 +1,124 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func
+from sqlmodel import Field, Session, SQLModel, delete, select, update
+
+from .article import Article
+from .feed import Feed
+from .relations import UserArticleLink, UserFeedLink
+from .user import User
+
+
+class Counter(SQLModel, table=True):
+    """Incrementally maintained row counts, so stats don't need full scans."""
+
+    name: str = Field(primary_key=True)
+    value: int = Field(default=0)
+
+
+COUNTERS: tuple[str, ...] = (
+    "users.total",
+    "users.frozen",
+    "feeds.total",
+    "feeds.disabled",
+    "articles.total",
+    "articles.with_embeddings",
+    "links.user_article",
+    "links.user_feed",
+)
+
+
+def increment_counters(session: Session, deltas: dict[str, int]) -> None:
+    """Add `deltas` to the counters as part of the caller's transaction.
+
+    Counters that haven't been initialised yet are left alone, the next
+    reconciliation creates them with exact values.
+    """
+    for name, delta in deltas.items():
+        if delta:
+            session.exec(  # type: ignore[call-overload]
+                update(Counter)
+                .where(Counter.name == name)  # type: ignore[arg-type]
+                .values(value=Counter.value + delta)
+            )
+
+
+def read_counters(session: Session) -> dict[str, int]:
+    return {
+        counter.name: counter.value for counter in session.exec(select(Counter)).all()
+    }
+
+
+def count_exact(session: Session) -> dict[str, int]:
+    """Compute every counter with a full COUNT(*) query."""
+
+    def count(model: type, *conditions) -> int:  # type: ignore[no-untyped-def]
+        return session.exec(
+            select(func.count()).select_from(model).where(*conditions)
+        ).one()
+
+    return {
+        "users.total": count(User),
+        "users.frozen": count(User, User.is_frozen.is_(True)),  # type: ignore[attr-defined]
+        "feeds.total": count(Feed),
+        "feeds.disabled": count(Feed, Feed.is_disabled.is_(True)),  # type: ignore[attr-defined]
+        "articles.total": count(Article),
+        "articles.with_embeddings": count(
+            Article,
+            Article.embedding.isnot(None),  # type: ignore[union-attr]
+        ),
+        "links.user_article": count(UserArticleLink),
+        "links.user_feed": count(UserFeedLink),
+    }
+
+
+def reconcile_counters(session: Session) -> dict[str, int]:
+    """Overwrite the counters with exact values.
+
+    Returns:
+        The drift that was corrected for each counter (exact - stored).
+    """
+    stored = read_counters(session)
+    exact = count_exact(session)
+    session.exec(delete(Counter))  # type: ignore[call-overload]
+    session.add_all([Counter(name=name, value=value) for name, value in exact.items()])
+    session.commit()
+    return {name: value - stored.get(name, 0) for name, value in exact.items()}
+
+
+def read_stats(session: Session) -> dict | None:
+    """Return the database statistics from the counters.
+
+    Returns:
+        The statistics, or None if the counters haven't been reconciled yet.
+    """
+    counters = read_counters(session)
+    if any(name not in counters for name in COUNTERS):
+        return None
+
+    # Time based, so it can't be a counter. Served by ix_user_last_request.
+    active_30d = session.exec(
+        select(func.count())
+        .select_from(User)
+        .where(User.last_request > datetime.now(timezone.utc) - timedelta(days=30))
+    ).one()
+
+    return {
+        "users": {
+            "total": counters["users.total"],
+            "active_30d": active_30d,
+            "frozen": counters["users.frozen"],
+        },
+        "feeds": {
+            "total": counters["feeds.total"],
+            "disabled": counters["feeds.disabled"],
+        },
+        "articles": {
+            "total": counters["articles.total"],
+            "with_embeddings": counters["articles.with_embeddings"],
+        },
+        "links": {
+            "user_article": counters["links.user_article"],
+            "user_feed": counters["links.user_feed"],
+        },
+    }
@@ -11,21 +11,29 @@ import aiohttp
 from ipaddress import ip_address, IPv4Address, IPv6Address
 from socket import gaierror
 from contextlib import asynccontextmanager
+from functools import lru_cache, partial
+from typing import Callable
+from urllib.parse import parse_qsl, urlencode, urlsplit
 import os
 
 import re
 import dateparser
 import lxml.etree
-from urllib.parse import quote
+from email.utils import format_datetime
+from xml.sax.saxutils import escape
 
 from loguru import logger
 
 
+from sqlalchemy import Index, column, event
 from sqlmodel import Field, Relationship, SQLModel
 
 from .relations import UserFeedLink
 from .article import Article
 from ..constants import API_BASE_URL, ROOT_PATH
+from .. import clicks
+from ..clicks import click_prefix, click_target, click_url, quote_target
+from ..metrics import FEED_FETCH_BYTES
 
 # Proxy configuration for SSRF protection
 # When set, all feed requests go through this proxy, which should only allow external hosts
@@ -33,11 +41,23 @@ FEED_PROXY = os.getenv("FEED_PROXY")  # e.g., "http://gluetun:8888"
 
 
 class Feed(SQLModel, table=True):
+    __table_args__ = (
+        # Only the few disabled feeds
+        Index(
+            "ix_feed_disabled",
+            "id",
+            sqlite_where=column("is_disabled").is_(True),
+            postgresql_where=column("is_disabled").is_(True),
+        ),
+    )
+
     id: int | None = Field(default=None, primary_key=True)
     url: str = Field(unique=True)  # Canonical URL (may be updated after redirects)
     original_url: str | None = Field(
         default=None, index=True
     )  # Original URL user subscribed with (if different from url)
+    # canonical_feed_key(url), kept up to date on every flush
+    canonical_key: str | None = Field(default=None, unique=True, index=True, repr=False)
     title: str
     logo: str | None = Field(repr=False)
     description: str | None = Field(default=None, repr=False)
@@ -64,6 +84,38 @@ class Feed(SQLModel, table=True):
     )
 
 
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def canonical_feed_key(url: str) -> str:
+    """Identity of a feed URL, the same for the variants of a URL that serve
+    the same feed.
+
+    The scheme, a `www.` prefix, the default port, trailing slashes, the
+    fragment and the order of the query parameters are ignored:
+    `http://www.Example.com:80/rss/?b=2&a=1` and `https://example.com/rss?a=1&b=2`
+    both give `example.com/rss?a=1&b=2`.
+    """
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").removeprefix("www.")
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port is not None and port != DEFAULT_PORTS.get(parts.scheme.lower()):
+        host = f"{host}:{port}"
+    key = host + parts.path.rstrip("/")
+    if query := urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True))):
+        key += f"?{query}"
+    return key
+
+
+@event.listens_for(Feed, "before_insert")
+@event.listens_for(Feed, "before_update")
+def _set_canonical_key(mapper, connection, feed: Feed) -> None:  # type: ignore[no-untyped-def]
+    feed.canonical_key = canonical_feed_key(feed.url)
+
+
 def parse_feed_articles(feed_string) -> Iterator[Article]:
     """Parse the feed and return a list of articles.
 
@@ -131,9 +183,37 @@ def parse_feed_articles(feed_string) -> Iterator[Article]:
         yield article
 
 
+HREF_RE = re.compile(r'href="(.*?)"')
+# Characters that are not allowed in XML 1.0 documents
+INVALID_XML_CHARS_RE = re.compile(
+    r"[^\x09\x0a\x0d\x20-\ud7ff\ue000-\ufffd\U00010000-\U0010ffff]"
+)
+XML_DECLARATION = "<?xml version='1.0' encoding='UTF-8'?>"
+RSS_DOCS_URL = "http://www.rssboard.org/rss-specification"
+RSS_GENERATOR = "python-feedgen"
+# Number of rendered articles kept in memory, see `item_segments`
+FRAGMENT_CACHE_SIZE = int(os.getenv("FRAGMENT_CACHE_SIZE", "10000"))
+# Stands for the click URLs in cached items, a private use character can't
+# come from a feed's markup in practice
+LINK_PLACEHOLDER = "\ue000link\ue000"
+
+
+def feed_self_url(feed: Feed, user_id: str) -> str:
+    # TODO: doesn't work with empty ROOT_PATH
+    return f"{API_BASE_URL}/{ROOT_PATH}/v1/feed/{user_id}/{feed.url}"
+
+
+def rewrite_links(html: str, link: Callable[[str], str]) -> str:
+    """Replace every href in `html` with `link(href)`."""
+    return HREF_RE.sub(lambda a: f'href="{link(a.group(1))}"', html)
+
+
 def generate_feed(feed: Feed, articles: list[Article], user_id: str) -> str:
     """Get the modified feed with the links replaced by the log API endpoint links.
 
+    This is the reference implementation of `render_feed`, which is used to
+    serve feeds.
+
     Returns:
         str: The modified feed.
     """
@@ -143,36 +223,157 @@ def generate_feed(feed: Feed, articles: list[Article], user_id: str) -> str:
     fg.title(feed.title)
     fg.description(feed.description or feed.title)
     fg.logo(feed.logo)
-    fg.link(
-        # TODO: doesn't work with empty ROOT_PATH
-        href=f"{API_BASE_URL}/{ROOT_PATH}/v1/feed/{user_id}/{feed.url}",
-        rel="self",
-    )
+    fg.link(href=feed_self_url(feed, user_id), rel="self")
     fg.language(feed.language)
     for article in articles:
         logger.debug(f"Replacing links for article: {article}")
-        LOG_URL_PREFIX: str = (
-            f"{API_BASE_URL}/{ROOT_PATH}/v1/log/{user_id}/{article.id}"
-        )
+        link = partial(click_url, user_id, article.id)
         fe = fg.add_entry()
         fe.id(article.url)
         fe.title(article.title)
-        fe.link(href=f"{LOG_URL_PREFIX}/{quote(article.url, safe='')}")
-        fe.description(
-            re.sub(
-                r'href="(.*?)"',
-                lambda a: f'href="{LOG_URL_PREFIX}/{quote(a.group(1), safe="")}"',
-                article.description,
-            )
-        )
+        fe.link(href=link(article.url))
+        fe.description(rewrite_links(article.description, link))
         if article.comments_url:
-            fe.comments(f"{LOG_URL_PREFIX}/{quote(article.comments_url, safe='')}")
+            fe.comments(link(article.comments_url))
         if article.pub_date:
             fe.pubDate(article.pub_date.replace(tzinfo=timezone.utc))
 
     return fg.rss_str(pretty=True).decode("utf-8")
 
 
+def xml_text(value: str) -> str:
+    """Escape `value` for use as XML character data."""
+    return escape(INVALID_XML_CHARS_RE.sub("", value), {"\r": "&#13;"})
+
+
+def xml_attr(value: str) -> str:
+    """Escape `value` for use in a double quoted XML attribute."""
+    return escape(
+        INVALID_XML_CHARS_RE.sub("", value),
+        {'"': "&quot;", "\n": "&#10;", "\r": "&#13;", "\t": "&#9;"},
+    )
+
+
+def render_item(article: Article, user_id: str, prefix: str | None = None) -> str:
+    """Render the `<item>` of an article, with its links pointing to the log endpoint.
+
+    Args:
+        prefix: The XML escaped `click_prefix(user_id)`, for callers that
+            render many items for the same user.
+    """
+    if prefix is None:
+        prefix = xml_text(click_prefix(user_id))
+    segments, targets = item_segments(article)
+    parts = [segments[0]]
+    for (target, quoted), segment in zip(targets, segments[1:]):
+        parts.append(
+            f"{prefix}/{article.id}/{click_target(user_id, article.id, target, quoted)}"
+        )
+        parts.append(segment)
+    return "".join(parts)
+
+
+def item_segments(
+    article: Article,
+) -> tuple[tuple[str, ...], tuple[tuple[str, str], ...]]:
+    """The `<item>` of an article, split where the click URLs go.
+
+    Only the click URLs depend on the user, so the rest of the item is
+    rendered once per article and cached, along with the quoted and escaped
+    target URLs that end the click URLs.
+
+    Returns:
+        The item's segments, and the target URL of each click URL between
+        two consecutive segments, as is and as it ends the click URL.
+    """
+    return _item_segments(
+        article.title,
+        article.url,
+        article.description,
+        article.comments_url,
+        article.pub_date,
+        clicks.CLICK_SIGNING_KEY is not None,
+    )
+
+
+@lru_cache(maxsize=FRAGMENT_CACHE_SIZE)
+def _item_segments(
+    title: str,
+    url: str,
+    description: str,
+    comments_url: str | None,
+    pub_date: datetime | None,
+    signed: bool,
+) -> tuple[tuple[str, ...], tuple[tuple[str, str], ...]]:
+    targets: list[tuple[str, str]] = []
+
+    def link(target: str) -> str:
+        targets.append((target, xml_text(quote_target(target, signed))))
+        return LINK_PLACEHOLDER
+
+    parts = ["<item>"]
+    if title:
+        parts.append(f"<title>{xml_text(title)}</title>")
+    parts.append(f"<link>{link(url)}</link>")
+    if description:
+        parts.append(
+            f"<description>{xml_text(rewrite_links(description, link))}</description>"
+        )
+    if url:
+        parts.append(f'<guid isPermaLink="false">{xml_text(url)}</guid>')
+    if comments_url:
+        parts.append(f"<comments>{link(comments_url)}</comments>")
+    if pub_date:
+        parts.append(
+            f"<pubDate>{format_datetime(pub_date.replace(tzinfo=timezone.utc))}</pubDate>"
+        )
+    parts.append("</item>")
+    return tuple("".join(parts).split(LINK_PLACEHOLDER)), tuple(targets)
+
+
+def render_feed(feed: Feed, articles: list[Article], user_id: str) -> bytes:
+    """Render the feed for a user, with the links replaced by log endpoint links.
+
+    Writes the same document as `generate_feed`, without building an element
+    tree or pretty-printing it. Characters that can't be represented in XML
+    are dropped instead of failing the whole feed.
+
+    Returns:
+        The UTF-8 encoded feed.
+    """
+    self_url = feed_self_url(feed, user_id)
+    title = xml_text(feed.title)
+    parts = [
+        XML_DECLARATION,
+        '\n<rss xmlns:atom="http://www.w3.org/2005/Atom" '
+        'xmlns:content="http://purl.org/rss/1.0/modules/content/" version="2.0">'
+        "<channel>",
+        f"<title>{title}</title>",
+        f"<link>{xml_text(self_url)}</link>",
+        f"<description>{xml_text(feed.description or feed.title)}</description>",
+        f'<atom:link href="{xml_attr(self_url)}" rel="self"/>',
+        f"<docs>{RSS_DOCS_URL}</docs>",
+        f"<generator>{RSS_GENERATOR}</generator>",
+    ]
+    if feed.logo:
+        parts.append(
+            f"<image><url>{xml_text(feed.logo)}</url><title>{title}</title>"
+            f"<link>{xml_text(self_url)}</link></image>"
+        )
+    if feed.language:
+        parts.append(f"<language>{xml_text(feed.language)}</language>")
+    parts.append(
+        f"<lastBuildDate>{format_datetime(datetime.now(timezone.utc))}</lastBuildDate>"
+    )
+    # FeedGenerator prepends entries, so the items are written in reverse
+    prefix = xml_text(click_prefix(user_id))
+    parts.extend(
+        render_item(article, user_id, prefix) for article in reversed(articles)
+    )
+    parts.append("</channel></rss>\n")
+    return "".join(parts).encode("utf-8")
+
+
 class UpstreamError(Exception):
     pass
 
@@ -342,6 +543,8 @@ async def _fetch_url(
             final_url = str(response.url)
             validate_url_not_ip(final_url)
             response.raise_for_status()
+            # read() caches the body, so text() below doesn't download it again
+            FEED_FETCH_BYTES.inc(len(await response.read()))
             return await response.text(), final_url
     except aiohttp.TooManyRedirects:
         raise UpstreamError(f"Too many redirects (max {max_redirects})")
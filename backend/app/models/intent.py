@@ -0,0 +1,12 @@
+from datetime import datetime, timezone
+
+from sqlmodel import Field, SQLModel
+
+
+class AppliedIntent(SQLModel, table=True):
+    """Queued write intents already committed, so a redelivered one is skipped."""
+
+    id: str = Field(primary_key=True)
+    applied_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc), index=True
+    )
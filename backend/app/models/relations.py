@@ -1,19 +1,32 @@
+from sqlalchemy import Index
 from sqlmodel import Field, SQLModel, Relationship
 from datetime import datetime, timezone
 
 
 class UserArticleLink(SQLModel, table=True):
-    user_id: int | None = Field(default=None, foreign_key="user.id", primary_key=True)
+    __table_args__ = (
+        Index(
+            "ix_userarticlelink_user_id_cluster",
+            "user_id",
+            "cluster",
+            "cluster_distance",
+        ),
+    )
+
+    user_id: str | None = Field(default=None, foreign_key="user.id", primary_key=True)
     article_id: int | None = Field(
         default=None, foreign_key="article.id", primary_key=True
     )
     created_at: datetime = Field(
         default_factory=lambda: datetime.now(timezone.utc), primary_key=True
     )
+    # Set when the user's clusters are recomputed, for articles with embedding
+    cluster: int | None = Field(default=None)
+    cluster_distance: float | None = Field(default=None)
 
 
 class UserFeedLink(SQLModel, table=True):
-    user_id: int | None = Field(default=None, foreign_key="user.id", primary_key=True)
+    user_id: str | None = Field(default=None, foreign_key="user.id", primary_key=True)
     feed_id: int | None = Field(default=None, foreign_key="feed.id", primary_key=True)
     created_at: datetime = Field(
         default_factory=lambda: datetime.now(timezone.utc), primary_key=True
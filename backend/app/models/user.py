@@ -1,11 +1,17 @@
 from datetime import datetime, timezone
 
+from sqlalchemy import Index
 from sqlmodel import Field, Relationship, SQLModel
 
 from .relations import UserArticleLink, UserFeedLink
 
 
 class User(SQLModel, table=True):
+    # The active or dormant users that are not frozen
+    __table_args__ = (
+        Index("ix_user_is_frozen_last_request", "is_frozen", "last_request"),
+    )
+
     id: str = Field(primary_key=True)
     created_at: datetime = Field(
         default_factory=lambda: datetime.now(timezone.utc), repr=False
@@ -15,7 +21,7 @@ class User(SQLModel, table=True):
     )
     clusters: str | None = Field(default=None, repr=False)
     clusters_updated_at: datetime | None = Field(default=None, repr=False)
-    is_frozen: bool = Field(default=False, index=True)
+    is_frozen: bool = Field(default=False)
     frozen_at: datetime | None = Field(default=None, repr=False)
 
     articles: list["Article"] = Relationship(  # type: ignore  # noqa: F821
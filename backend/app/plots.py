@@ -0,0 +1,91 @@
+"""2D visualisation of a user's clusters, rendered in the background.
+
+The read articles' embeddings are projected to 2D with PCA and coloured by
+their closest cluster. `render_user_clusters_2d` (in `app.tasks`) caches both
+the points, as JSON for client-side plotting, and a PNG of them in Redis,
+keyed by the clusters' version, so that the endpoints only serve bytes and a
+recomputation of the clusters invalidates them.
+"""
+
+import json
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+
+from .constants import WEB_URL
+from .models.article import Article
+
+# Formats are "png" and "json"
+CLUSTERS_2D_KEY = "clusters_2d:{}:{}:{}"
+CLUSTERS_2D_PENDING_KEY = "clusters_2d:{}:{}:pending"
+# Set instead when none of the user's read articles has an embedding to plot
+CLUSTERS_2D_EMPTY_KEY = "clusters_2d:{}:{}:empty"
+# Users who looked at their clusters get them rendered again when they change
+CLUSTERS_2D_VIEWED_KEY = "clusters_2d:{}:viewed"
+CLUSTERS_2D_TTL = int(os.getenv("CLUSTERS_2D_TTL", str(7 * 24 * 3600)))
+CLUSTERS_2D_VIEWED_TTL = 30 * 24 * 3600
+# A render that takes longer is assumed lost and enqueued again
+CLUSTERS_2D_RENDER_TIMEOUT = 300
+MEDIA_TYPES = {"png": "image/png", "json": "application/json"}
+
+
+def clusters_version(updated_at: datetime | None) -> str:
+    """Cache version of clusters computed at `updated_at`."""
+    if updated_at is None:
+        return "0"
+    return f"{updated_at.replace(tzinfo=timezone.utc).timestamp():.6f}"
+
+
+def clusters_2d_points(
+    articles: list[Article], cluster_centers: list[list[float]]
+) -> list[dict]:
+    """Project the embedded `articles` to 2D and assign their closest cluster."""
+    # Only needed by the workers that render
+    from scipy.spatial.distance import cdist
+    from sklearn.decomposition import PCA
+
+    embedded = [article for article in articles if article.embedding]
+    if not embedded:
+        return []
+    embeddings = np.array([json.loads(article.embedding) for article in embedded])  # type: ignore[arg-type]
+    closest_clusters = np.argmin(
+        cdist(embeddings, cluster_centers, metric="cosine"), axis=1
+    )
+    if len(embedded) > 1:
+        points_2d = PCA(n_components=2).fit_transform(embeddings)
+    else:
+        points_2d = np.zeros((1, 2))
+    return [
+        {
+            "x": round(float(x), 5),
+            "y": round(float(y), 5),
+            "cluster": int(cluster),
+            "title": article.title,
+            "url": article.url,
+        }
+        for article, (x, y), cluster in zip(embedded, points_2d, closest_clusters)
+    ]
+
+
+def render_clusters_2d_png(points: list[dict]) -> bytes:
+    # Plotly and kaleido are only needed by the workers that render
+    import plotly.express as px
+
+    fig = px.scatter(
+        x=[point["x"] for point in points],
+        y=[point["y"] for point in points],
+        color=[f"Cluster {point['cluster']}" for point in points],
+        text=[point["title"] for point in points],
+        labels={"color": "Cluster"},
+        title=f"Clusters of your read articles: {WEB_URL}",
+    )
+
+    # labels top center
+    fig.update_traces(textposition="top center")
+
+    # remove axis labels
+    fig.update_xaxes(showticklabels=False)
+    fig.update_yaxes(showticklabels=False)
+
+    return fig.to_image(format="png", width=1000, height=1000)
@@ -1,18 +1,29 @@
+"""Embeddings, clustering and ranking of the articles.
+
+torch, transformers, scikit-learn and scipy are imported where they are used,
+so that importing this module (the API, the scheduler and the feed workers
+do, through `app.tasks`) doesn't load them.
+"""
+
+import functools
 import json
 import numpy as np
-import torch
 import random
-from transformers import AutoTokenizer, AutoModel
-from sklearn.cluster import KMeans
-from scipy.spatial.distance import cdist
-from rich.progress import track
+from typing import TYPE_CHECKING, Any
 
 from loguru import logger
 
 from .models.article import Article
 
+if TYPE_CHECKING:
+    from sklearn.cluster import KMeans
+
+EMBEDDING_MODEL = "intfloat/multilingual-e5-large-instruct"
+
 
 def _batch_compute_embeddings(articles, model, tokenizer):
+    import torch
+
     texts = [
         (article.title or "") + " " + (article.description or "")
         for article in articles
@@ -33,19 +44,34 @@ def _batch_compute_embeddings(articles, model, tokenizer):
         article.embedding = json.dumps(embeddings[i].tolist())
 
 
-def compute_embeddings(
-    articles: list[Article], model_name: str = "intfloat/multilingual-e5-large-instruct"
-) -> None:
+@functools.cache
+def load_model(model_name: str = EMBEDDING_MODEL) -> tuple[Any, Any]:
+    """Load the tokenizer and model once per process.
+
+    Workers that don't fork per job (see `app.workers`) reuse them across jobs.
+    """
+    import torch
+    from transformers import AutoTokenizer, AutoModel
+
+    logger.info(f"Loading embedding model {model_name}")
     tokenizer = AutoTokenizer.from_pretrained(model_name)
     model = AutoModel.from_pretrained(model_name)
 
     if torch.cuda.is_available():
         model.to("cuda")
+    return tokenizer, model
+
+
+def compute_embeddings(
+    articles: list[Article], model_name: str = EMBEDDING_MODEL
+) -> None:
+    from rich.progress import track
 
     articles_to_embed = [article for article in articles if article.embedding is None]
     if not articles_to_embed:
         logger.info("All articles already have embeddings.")
         return
+    tokenizer, model = load_model(model_name)
     batch_size = 32  # Adjust based on your GPU memory
 
     for i in track(
@@ -56,12 +82,26 @@ def compute_embeddings(
         _batch_compute_embeddings(batch_articles, model, tokenizer)
 
 
-def cluster_articles(articles: list[Article], n_clusters: int = 10) -> KMeans:
-    X = np.array(
+def embedding_matrix(articles: list[Article]) -> np.ndarray:
+    """Embeddings of the `articles` that have one, one row per article."""
+    return np.array(
         [json.loads(article.embedding) for article in articles if article.embedding]
     )
-    kmeans = KMeans(n_clusters=n_clusters, random_state=42).fit(X)
-    return kmeans
+
+
+def cluster_embeddings(X: np.ndarray, n_clusters: int = 10) -> "KMeans":
+    from sklearn.cluster import KMeans
+
+    return KMeans(n_clusters=n_clusters, random_state=42).fit(X)
+
+
+def cluster_articles(articles: list[Article], n_clusters: int = 10) -> "KMeans":
+    return cluster_embeddings(embedding_matrix(articles), n_clusters)
+
+
+def cluster_distances(X: np.ndarray, kmeans: "KMeans") -> np.ndarray:
+    """Distance of each row of `X` to the center of its cluster in `kmeans`."""
+    return np.linalg.norm(X - kmeans.cluster_centers_[kmeans.labels_], axis=1)
 
 
 def filter_articles(
@@ -91,6 +131,8 @@ def filter_articles(
     Returns:
         List of articles sorted by relevance
     """
+    from scipy.spatial.distance import cdist
+
     random.Random(42).shuffle(articles)
     n_random = int(len(articles) * random_ratio)
     random_articles = articles[:n_random]
@@ -1,21 +1,27 @@
 import os
 
-from sqlmodel import create_engine
 from fastapi_cache import Coder
 from fastapi import Response
 from fastapi.responses import RedirectResponse
 from typing import Any
 
+from sqlalchemy import Engine
+
+from ..database import get_engine as get_db_engine
+from ..database import get_read_engine as get_db_read_engine
+
 if not os.path.exists("data"):
     os.makedirs("data")
 
 
-def get_engine():
-    return create_engine(
-        os.getenv("DATABASE_URL", "sqlite:///data/db.sqlite"),
-        connect_args={"check_same_thread": False},
-        echo=bool(os.getenv("DEBUG", False)),
-    )
+def get_engine() -> Engine:
+    # One engine (and connection pool) per process, not per request
+    return get_db_engine()
+
+
+def get_read_engine() -> Engine:
+    # For the queries that only read, they never wait for the write lock
+    return get_db_read_engine()
 
 
 class XMLCoder(Coder):
@@ -1,26 +1,40 @@
 import asyncio
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
 from pydantic.networks import HttpUrl
 from datetime import datetime, timedelta, timezone
 from fastapi import Request
 import json
 from fastapi import APIRouter, Response, Depends
-from sqlmodel import Session, select, or_
+from fastapi.concurrency import run_in_threadpool
+from sqlmodel import Session, select
 from loguru import logger
+from redis import asyncio as aioredis  # type: ignore
+from redis.exceptions import RedisError  # type: ignore
 from app.models.article import Article
+from app import activity
 from app.models.feed import (
     Feed,
-    generate_feed,
+    canonical_feed_key,
+    render_feed,
     parse_feed,
     UpstreamError,
     SSRFException,
 )
 from app.models.user import User
+from app.metrics import FEED_CREATIONS
+from app.models.counter import increment_counters
 from app.recommend import filter_articles
 from app.tasks import fetch_feed_batch, enqueue_high_priority
-from .common import get_engine
+from app.tracing import span
+from .common import get_engine, get_read_engine
 from fastapi import HTTPException
 from fastapi import BackgroundTasks
 
+from sqlalchemy import Engine
 from sqlalchemy.exc import NoResultFound
 
 router = APIRouter(
@@ -31,6 +45,254 @@ router = APIRouter(
 
 FEED_REFRESH_INTERVAL = timedelta(days=1)  # Adjust as needed
 
+# Requested feed URL -> feed id, so that polls skip the feed lookup query
+FEED_ID_CACHE_SIZE = int(os.getenv("FEED_ID_CACHE_SIZE", "10000"))
+_feed_ids: OrderedDict[str, int] = OrderedDict()
+_feed_ids_lock = threading.Lock()
+
+# Unknown feeds are fetched and stored once, however many requests ask for
+# them at the same time: by one task per canonical URL in this process, and
+# by whoever holds the Redis lock across processes
+FEED_CREATE_LOCK_KEY = "feed:create:{}"
+FEED_CREATE_LOCK_SECONDS = int(os.getenv("FEED_CREATE_LOCK_SECONDS", "30"))
+FEED_CREATE_POLL_INTERVAL = 0.2
+# Deletes the lock only if it still holds the token of who took it, not once
+# it expired and another process took it
+FEED_CREATE_UNLOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+_creating: dict[str, asyncio.Task[int]] = {}
+
+redis_conn = aioredis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379"))
+
+
+def _get_user(session: Session, user_id: str) -> User:
+    try:
+        user: User = session.exec(select(User).where(User.id == user_id)).one()
+        now = datetime.now(timezone.utc)
+        if user.is_frozen:
+            user.last_request = now
+            user.is_frozen = False
+            user.frozen_at = None
+            increment_counters(session, {"users.frozen": -1})
+            session.commit()
+            logger.info(f"Auto-unfroze user {user_id} due to feed request")
+        elif not activity.touch("user", user_id, now):
+            user.last_request = now
+            session.commit()
+    except NoResultFound:
+        logger.info(f"User {user_id} not found in database, creating new user")
+        user = User(id=user_id)
+        session.add(user)
+        increment_counters(session, {"users.total": 1})
+        session.commit()
+    return user
+
+
+def _remember_feed_id(url: str, feed_id: int) -> None:
+    with _feed_ids_lock:
+        _feed_ids[url] = feed_id
+        _feed_ids.move_to_end(url)
+        if len(_feed_ids) > FEED_ID_CACHE_SIZE:
+            _feed_ids.popitem(last=False)
+
+
+def _find_feed(session: Session, feed_url: HttpUrl) -> Feed:
+    url = str(feed_url)
+    key = canonical_feed_key(url)
+    with _feed_ids_lock:
+        feed_id = _feed_ids.get(url)
+    if feed_id is not None:
+        feed = session.get(Feed, feed_id)
+        # The feed may have been deleted or merged since
+        if feed is not None and (feed.canonical_key == key or feed.original_url == url):
+            return feed
+        with _feed_ids_lock:
+            _feed_ids.pop(url, None)
+
+    # The URL's variants (http/https, www., trailing slash...) share the
+    # canonical key. Redirected feeds are also found by the URL users
+    # subscribed with.
+    feed = (
+        session.exec(select(Feed).where(Feed.canonical_key == key)).first()
+        or session.exec(select(Feed).where(Feed.original_url == url)).first()
+    )
+    if feed is None:
+        raise NoResultFound(f"No feed for {url}")
+    _remember_feed_id(url, feed.id)  # type: ignore[arg-type]
+    return feed
+
+
+def _store_feed(session: Session, feed: Feed, requested_url: str) -> Feed:
+    # A redirect to another feed URL: remember the one users subscribe with,
+    # for _find_feed
+    redirected = canonical_feed_key(requested_url) != canonical_feed_key(feed.url)
+    if redirected:
+        feed.original_url = requested_url
+    session.add(feed)
+    increment_counters(
+        session, {"feeds.total": 1, "articles.total": len(feed.articles)}
+    )
+    try:
+        session.commit()
+    except Exception as e:
+        # might happen if the feed was created before by another thread
+        logger.warning(f"Failed to add feed {feed.url} to database: {e}")
+        session.rollback()
+        feed = session.exec(
+            select(Feed).where(Feed.canonical_key == canonical_feed_key(feed.url))
+        ).one()
+        if redirected and feed.original_url is None:
+            feed.original_url = requested_url
+    session.add(feed)
+    session.commit()
+    return feed
+
+
+def _load_feed(session: Session, feed_id: int) -> Feed:
+    # End the read transaction first, its snapshot may predate the feed
+    session.commit()
+    return session.get_one(Feed, feed_id)
+
+
+async def _stored_feed_id(engine: Engine, feed_url: HttpUrl) -> int | None:
+    with Session(engine) as session:
+        try:
+            feed = await run_in_threadpool(_find_feed, session, feed_url)
+        except NoResultFound:
+            return None
+        return feed.id
+
+
+async def _lock_feed_creation(lock: str) -> str | None:
+    """Take the lock on the creation of a feed.
+
+    Returns:
+        The token to release it with, or None if another process holds it.
+
+    Raises:
+        RedisError
+    """
+    token = secrets.token_hex(16)
+    if await redis_conn.set(lock, token, nx=True, ex=FEED_CREATE_LOCK_SECONDS):
+        return token
+    return None
+
+
+async def _unlock_feed_creation(lock: str, token: str) -> None:
+    try:
+        await redis_conn.eval(FEED_CREATE_UNLOCK_SCRIPT, 1, lock, token)
+    except RedisError as e:
+        logger.warning(f"Could not release the feed creation lock {lock}: {e}")
+
+
+async def _wait_for_feed(
+    engine: Engine, feed_url: HttpUrl, lock: str
+) -> tuple[int | None, str | None]:
+    """Wait for the process holding `lock` to store the feed.
+
+    The lock is taken over as soon as it is released without the feed being
+    stored, e.g. because its holder failed to fetch it.
+
+    Returns:
+        The feed's id once stored, or else the token of the lock once taken
+        over. Neither after the lock's lifetime, or if Redis fails.
+    """
+    deadline = time.monotonic() + FEED_CREATE_LOCK_SECONDS
+    while time.monotonic() < deadline:
+        await asyncio.sleep(FEED_CREATE_POLL_INTERVAL)
+        if (feed_id := await _stored_feed_id(engine, feed_url)) is not None:
+            return feed_id, None
+        try:
+            token = await _lock_feed_creation(lock)
+        except RedisError as e:
+            logger.warning(f"Could not lock the creation of feed {feed_url}: {e}")
+            return None, None
+        if token is not None:
+            # The holder may have stored it right before releasing the lock
+            if (feed_id := await _stored_feed_id(engine, feed_url)) is not None:
+                await _unlock_feed_creation(lock, token)
+                return feed_id, None
+            return None, token
+    return None, None
+
+
+async def _fetch_and_store_feed(engine: Engine, feed_url: HttpUrl, key: str) -> int:
+    lock = FEED_CREATE_LOCK_KEY.format(key)
+    token: str | None = None
+    try:
+        token = await _lock_feed_creation(lock)
+        held_elsewhere = token is None
+    except RedisError as e:
+        logger.warning(f"Could not lock the creation of feed {feed_url}: {e}")
+        held_elsewhere = False
+    if held_elsewhere:
+        feed_id, token = await _wait_for_feed(engine, feed_url, lock)
+        if feed_id is not None:
+            FEED_CREATIONS.labels(outcome="waited").inc()
+            return feed_id
+        if token is None:
+            logger.warning(f"Gave up waiting for feed {feed_url}, fetching it")
+
+    try:
+        parsed = await parse_feed(feed_url)
+        with Session(engine, expire_on_commit=False) as session:
+            feed = await run_in_threadpool(_store_feed, session, parsed, str(feed_url))
+        _remember_feed_id(str(feed_url), feed.id)  # type: ignore[arg-type]
+        FEED_CREATIONS.labels(outcome="fetched").inc()
+        return feed.id  # type: ignore[return-value]
+    finally:
+        if token is not None:
+            await _unlock_feed_creation(lock, token)
+
+
+async def _create_feed(engine: Engine, feed_url: HttpUrl) -> int:
+    """Fetch and store an unknown feed, once for all concurrent requests.
+
+    Returns:
+        Id of the feed.
+
+    Raises:
+        UpstreamError, SSRFException: From `parse_feed`, to every request.
+    """
+    key = canonical_feed_key(str(feed_url))
+    task = _creating.get(key)
+    if task is None:
+        task = asyncio.create_task(_fetch_and_store_feed(engine, feed_url, key))
+        _creating[key] = task
+        task.add_done_callback(lambda _: _creating.pop(key, None))
+    else:
+        FEED_CREATIONS.labels(outcome="shared").inc()
+    # A cancelled request must not cancel the fetch the others wait for
+    return await asyncio.shield(task)
+
+
+def _subscribe(session: Session, user: User, feed: Feed) -> None:
+    if feed not in user.feeds:
+        user.feeds.append(feed)
+        increment_counters(session, {"links.user_feed": 1})
+        session.commit()
+
+
+def _refreshed(session: Session, feed: Feed, previous_update: datetime) -> bool:
+    session.refresh(feed)
+    return feed.updated_at != previous_update
+
+
+def _latest_articles(engine: Engine, feed_id: int) -> list[Article]:
+    with Session(engine) as session:
+        return list(
+            session.exec(
+                select(Article)
+                .where(Article.feed_id == feed_id)
+                .order_by(Article.pub_date.desc())  # type: ignore[union-attr]
+                .limit(30)
+            ).all()
+        )
+
 
 @router.get("/{user_id}/{feed_url:path}")
 async def get_feed(
@@ -39,37 +301,30 @@ async def get_feed(
     feed_url: HttpUrl,
     background_tasks: BackgroundTasks,
     engine=Depends(get_engine),
+    read_engine=Depends(get_read_engine),
 ) -> Response:
-    with Session(engine, autoflush=False) as session:
-        try:
-            user: User = session.exec(select(User).where(User.id == user_id)).one()
-            user.last_request = datetime.now(timezone.utc)
-            if user.is_frozen:
-                user.is_frozen = False
-                user.frozen_at = None
-                logger.info(f"Auto-unfroze user {user_id} due to feed request")
-        except NoResultFound:
-            logger.info(f"User {user_id} not found in database, creating new user")
-            user = User(id=user_id)
-            session.add(user)
-            session.commit()
+    # The blocking database, Redis and numpy work runs in the threadpool, so
+    # that a slow query (e.g. waiting for the SQLite lock) doesn't stall the
+    # event loop. The session is only used by one thread at a time, and
+    # commits don't expire the loaded objects so that reading their
+    # attributes here doesn't query the database.
+    # Whether the articles must be read from the primary, because they were
+    # just written and a replica may not have them yet
+    just_written = False
+    with Session(engine, autoflush=False, expire_on_commit=False) as session:
+        with span("user"):
+            user = await run_in_threadpool(_get_user, session, user_id)
 
-        # Feed handling - look up by url or original_url (for redirected feeds)
         try:
-            feed: Feed = session.exec(
-                select(Feed).where(
-                    or_(
-                        Feed.url == str(feed_url),
-                        Feed.original_url == str(feed_url),
-                    )
-                )
-            ).one()
+            with span("feed_lookup"):
+                feed = await run_in_threadpool(_find_feed, session, feed_url)
         except NoResultFound:
             logger.info(
                 f"Feed {feed_url} not found in database, fetching from upstream"
             )
             try:
-                feed = await parse_feed(feed_url)
+                with span("feed_fetch"):
+                    feed_id = await _create_feed(engine, feed_url)
             except UpstreamError as e:
                 return Response(content=str(e), status_code=502)
             except SSRFException:
@@ -78,20 +333,11 @@ async def get_feed(
                     status_code=403,
                     detail="Access to internal network resources is not allowed",
                 )
-            session.add(feed)
-            try:
-                session.commit()
-            except Exception as e:
-                # might happen if the feed was created before by another thread
-                logger.warning(f"Failed to add feed {feed_url} to database: {e}")
-                session.rollback()
-                feed = session.exec(select(Feed).where(Feed.url == feed.url)).one()
-            session.add(feed)
-            session.commit()
+            feed = await run_in_threadpool(_load_feed, session, feed_id)
+            just_written = True
 
-        if feed not in user.feeds:
-            user.feeds.append(feed)
-            session.commit()
+        with span("subscribe"):
+            await run_in_threadpool(_subscribe, session, user, feed)
 
         # Check if feed needs refreshing
         now = datetime.now(timezone.utc)
@@ -101,30 +347,39 @@ async def get_feed(
             > FEED_REFRESH_INTERVAL
         ):
             logger.info(f"Feed {feed_url} needs refreshing")
-            job = enqueue_high_priority(fetch_feed_batch, [feed.id])
-            start = datetime.now()
-            while job.get_status(refresh=True) != "finished":
-                await asyncio.sleep(0.5)
-                if (datetime.now() - start) > timedelta(seconds=10):
-                    logger.warning(
-                        f"Feed {feed_url} refresh job took too long, returning old data"
-                    )
-                    break
-            session.refresh(feed)
-
-        articles = list(
-            session.exec(
-                select(Article)
-                .where(Article.feed_id == feed.id)
-                .order_by(Article.pub_date.desc())  # type: ignore[union-attr]
-                .limit(30)
-            ).all()
-        )
+            with span("refresh_wait"):
+                previous_update = feed.updated_at
+                await run_in_threadpool(
+                    enqueue_high_priority, fetch_feed_batch, [feed.id]
+                )
+                # Wait for the fetched articles to be stored, rather than for
+                # the job: with the write pipeline, they're stored by the
+                # writer after the job has finished
+                start = datetime.now()
+                while not await run_in_threadpool(
+                    _refreshed, session, feed, previous_update
+                ):
+                    await asyncio.sleep(0.5)
+                    if (datetime.now() - start) > timedelta(seconds=10):
+                        logger.warning(
+                            f"Feed {feed_url} refresh job took too long, returning old data"
+                        )
+                        break
+            just_written = True
 
-        if user.clusters:
-            filtered_articles = filter_articles(
-                articles=articles, cluster_centers=json.loads(user.clusters)
+        with span("articles"):
+            assert feed.id is not None
+            articles = await run_in_threadpool(
+                _latest_articles, engine if just_written else read_engine, feed.id
             )
+
+        if user.clusters:
+            with span("filter"):
+                filtered_articles = await run_in_threadpool(
+                    filter_articles,
+                    articles=articles,
+                    cluster_centers=json.loads(user.clusters),
+                )
             logger.debug(
                 f"Returning {len(filtered_articles)}/{len(articles)} articles for user {user_id}"
             )
@@ -134,6 +389,7 @@ async def get_feed(
             )
             filtered_articles = articles
 
-        custom_feed = generate_feed(feed, filtered_articles, user_id)
+        with span("render"):
+            custom_feed = render_feed(feed, filtered_articles, user_id)
 
     return Response(content=custom_feed, media_type="application/xml")
@@ -1,7 +1,15 @@
+import os
+
 from fastapi import APIRouter, Depends
+from fastapi.concurrency import run_in_threadpool
 from fastapi.requests import Request
 from fastapi.responses import RedirectResponse
+from loguru import logger
+from redis import asyncio as aioredis  # type: ignore
+from redis.exceptions import RedisError  # type: ignore
 from .common import get_engine, RedirectResponseCoder
+from app import clicks
+from app.metrics import CLICKS
 from app.tasks import enqueue_medium_priority, log_user_action
 from fastapi_cache.decorator import cache
 
@@ -10,6 +18,27 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
+# Repeated clicks of a user on an article within this window are logged once
+CLICK_DEDUP_SECONDS = int(os.getenv("CLICK_DEDUP_SECONDS", "3600"))
+CLICK_DEDUP_KEY = "click:{}:{}"
+
+redis_conn = aioredis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379"))
+
+
+async def is_first_click(user_id: str, article_id: int) -> bool:
+    try:
+        return bool(
+            await redis_conn.set(
+                CLICK_DEDUP_KEY.format(user_id, article_id),
+                1,
+                nx=True,
+                ex=CLICK_DEDUP_SECONDS,
+            )
+        )
+    except RedisError as e:
+        logger.warning(f"Could not de-duplicate click: {e}")
+        return True
+
 
 @router.get("/{user_id}/{article_id}/{link_url:path}")
 @cache(expire=300, coder=RedirectResponseCoder)
@@ -20,11 +49,32 @@ async def log_post(
     link_url: str,
     engine=Depends(get_engine),
 ):
-    """Log post, and redirect to the final post url"""
+    """Log post, and redirect to the final post url.
+
+    With click signing enabled, only clicks with a valid signature are logged,
+    anything else is just redirected.
+    """
+    signature, link_url = clicks.split_signature(link_url)
     if request.query_params:
         link_url = f"{link_url}?"
         for key, value in request.query_params.items():
             link_url = f"{link_url}&{key}={value}"
 
-    enqueue_medium_priority(log_user_action, user_id, article_id, link_url)
+    if clicks.CLICK_SIGNING_KEY is None:
+        outcome = "unsigned"
+    elif signature is None or not clicks.verify_click(
+        user_id, article_id, link_url, signature
+    ):
+        outcome = "invalid"
+    elif not await is_first_click(user_id, article_id):
+        outcome = "duplicate"
+    else:
+        outcome = "logged"
+    CLICKS.labels(outcome=outcome).inc()
+
+    if outcome in ("unsigned", "logged"):
+        # RQ has no async API, enqueue from the threadpool
+        await run_in_threadpool(
+            enqueue_medium_priority, log_user_action, user_id, article_id, link_url
+        )
     return RedirectResponse(link_url)
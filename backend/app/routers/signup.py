@@ -1,10 +1,21 @@
-from fastapi import UploadFile
+import os
+from collections.abc import Iterator
+from datetime import datetime, timezone
+from fastapi import Form, UploadFile
 from fastapi import APIRouter, Response, Depends
-from pydantic import BaseModel
+from pydantic import BaseModel, HttpUrl, ValidationError
+from redis.exceptions import RedisError  # type: ignore
+from sqlalchemy import insert
 from sqlmodel import Session, select
 from loguru import logger
+from app.database import insert_ignore
+from app.models.feed import Feed, canonical_feed_key
+from app.models.relations import UserFeedLink
 from app.models.user import User
-from .common import get_engine
+from app.models.counter import increment_counters
+from app.tasks import BATCH_SIZE, enqueue_medium_priority, fetch_feed_batch, redis_conn
+from .common import get_engine, get_read_engine
+from .feed import FEED_REFRESH_INTERVAL
 from ..constants import API_BASE_URL, ROOT_PATH
 from uuid import uuid4
 
@@ -14,6 +25,16 @@ from lxml import etree
 # from fastapi_cache.decorator import cache
 from sqlalchemy.orm.exc import NoResultFound
 
+# Feeds created by an import are stale until fetched
+NEVER_FETCHED = datetime(1970, 1, 1, tzinfo=timezone.utc)
+# Maximum number of keys in the IN clause of the feed lookups
+IMPORT_CHUNK_SIZE = 500
+# Feed outlines imported per file, the following ones are skipped
+OPML_IMPORT_MAX_FEEDS = int(os.getenv("OPML_IMPORT_MAX_FEEDS", "1000"))
+# Number of outlines skipped by the user's last import, for its progress
+OPML_SKIPPED_KEY = "opml_import:{}:skipped"
+OPML_SKIPPED_TTL = 24 * 3600
+
 router = APIRouter(
     tags=["signup"],
     responses={404: {"description": "Not found"}},
@@ -28,24 +49,13 @@ class ResgisterUserResponse(BaseModel):
 def register_user(engine=Depends(get_engine)) -> ResgisterUserResponse:
     user_id: str = uuid4().hex
     with Session(engine, autoflush=False) as session:
-        try:
-            user: User = session.exec(select(User).where(User.id == user_id)).one()
-        except NoResultFound:
-            logger.info(f"User {user_id} not found in database, creating new user")
-            user = User(id=user_id)
-            session.add(user)
-            try:
-                session.commit()
-            except Exception as e:
-                # might happen if the user was created before by another thread
-                logger.warning(f"Failed to add user {user_id} to database: {e}")
-                session.rollback()
-                user = session.exec(select(User).where(User.id == user_id)).one()
+        user = _get_or_create_user(session, user_id)
         return ResgisterUserResponse(user_id=user.id)
 
 
-def get_rss_custom_feed(rss_feed_url: str, uuid: str | None = uuid4().hex) -> str:
+def get_rss_custom_feed(rss_feed_url: str, uuid: str | None = None) -> str:
     """Get the RSS feed from the URL."""
+    uuid = uuid or uuid4().hex
     return (
         f"{API_BASE_URL}/{ROOT_PATH}/v1/feed/{uuid}/{rss_feed_url}"
         if ROOT_PATH
@@ -53,20 +63,19 @@ def get_rss_custom_feed(rss_feed_url: str, uuid: str | None = uuid4().hex) -> st
     )
 
 
+def _rss_outlines(root: etree._ElementTree) -> Iterator[etree._Element]:
+    for outline in root.findall(".//outline"):
+        if outline.get("type") == "rss" and outline.get("xmlUrl") is not None:
+            yield outline
+
+
 def get_opml_custom(opml_text: str, uuid: str | None = None) -> str:
     """Get the OPML file with custom RSS feeds."""
     tree = etree.fromstring(opml_text.encode("utf-8"))
     root = tree.getroottree()
 
-    for outline in root.findall(".//outline"):
-        if outline.get("type") != "rss":
-            continue
-        url = outline.get("xmlUrl")
-        if url is None:
-            continue
-        new_url = (
-            get_rss_custom_feed(url) if uuid is None else get_rss_custom_feed(url, uuid)
-        )
+    for outline in _rss_outlines(root):
+        new_url = get_rss_custom_feed(outline.get("xmlUrl"), uuid)
         outline.set("xmlUrl", new_url)  # Update the XML attribute with the new URL
 
     return etree.tostring(
@@ -74,27 +83,220 @@ def get_opml_custom(opml_text: str, uuid: str | None = None) -> str:
     ).decode("utf-8")
 
 
+def _is_feed_url(url: str) -> bool:
+    try:
+        return HttpUrl(url).scheme in ("http", "https")
+    except ValidationError:
+        return False
+
+
+def get_opml_feeds(
+    opml_text: str, max_feeds: int | None = None
+) -> tuple[dict[str, tuple[str, str]], int]:
+    """The feeds of an OPML file by canonical key, as (url, title).
+
+    Returns:
+        The feeds, and the number of outlines skipped: those without a valid
+        http(s) URL, and those after the first `max_feeds`
+        (OPML_IMPORT_MAX_FEEDS by default).
+    """
+    max_feeds = max_feeds or OPML_IMPORT_MAX_FEEDS
+    root = etree.fromstring(opml_text.encode("utf-8")).getroottree()
+    feeds: dict[str, tuple[str, str]] = {}
+    skipped = 0
+    for i, outline in enumerate(_rss_outlines(root)):
+        url = outline.get("xmlUrl").strip()
+        if i >= max_feeds or not _is_feed_url(url):
+            skipped += 1
+            continue
+        title = outline.get("title") or outline.get("text") or url
+        feeds.setdefault(canonical_feed_key(url), (url, title))
+    return feeds, skipped
+
+
+def _get_or_create_user(session: Session, user_id: str) -> User:
+    try:
+        return session.exec(select(User).where(User.id == user_id)).one()
+    except NoResultFound:
+        logger.info(f"User {user_id} not found in database, creating new user")
+        user = User(id=user_id)
+        session.add(user)
+        increment_counters(session, {"users.total": 1})
+        try:
+            session.commit()
+        except Exception as e:
+            # might happen if the user was created before by another thread
+            logger.warning(f"Failed to add user {user_id} to database: {e}")
+            session.rollback()
+            user = session.exec(select(User).where(User.id == user_id)).one()
+        return user
+
+
+def _find_feeds(session: Session, feeds: dict[str, tuple[str, str]]) -> dict[str, Feed]:
+    """The existing feeds among `feeds`, by canonical key.
+
+    Like the feed lookup of `get_feed`, redirected feeds are also found by
+    the URL users subscribed with.
+    """
+    found: dict[str, Feed] = {}
+    keys = list(feeds)
+    for i in range(0, len(keys), IMPORT_CHUNK_SIZE):
+        for feed in session.exec(
+            select(Feed).where(
+                Feed.canonical_key.in_(keys[i : i + IMPORT_CHUNK_SIZE])  # type: ignore[union-attr]
+            )
+        ):
+            found[feed.canonical_key] = feed  # type: ignore[index]
+
+    missing = {feeds[key][0]: key for key in keys if key not in found}
+    urls = list(missing)
+    for i in range(0, len(urls), IMPORT_CHUNK_SIZE):
+        for feed in session.exec(
+            select(Feed).where(
+                Feed.original_url.in_(urls[i : i + IMPORT_CHUNK_SIZE])  # type: ignore[union-attr]
+            )
+        ):
+            found[missing[feed.original_url]] = feed  # type: ignore[index]
+    return found
+
+
+def import_feeds(
+    session: Session, user: User, feeds: dict[str, tuple[str, str]]
+) -> list[int]:
+    """Subscribe `user` to `feeds`, creating the feeds that don't exist yet.
+
+    The new feeds are created without fetching them, as never updated, and
+    everything is inserted with one statement per table.
+
+    Returns:
+        Ids of the subscribed feeds that need fetching.
+    """
+    existing = _find_feeds(session, feeds)
+    now = datetime.now(timezone.utc)
+    new_rows = [
+        {
+            "url": url,
+            "canonical_key": key,  # Core inserts don't go through the ORM events
+            "title": title,
+            "created_at": now,
+            "updated_at": NEVER_FETCHED,
+            "consecutive_failures": 0,
+            "is_disabled": False,
+        }
+        for key, (url, title) in feeds.items()
+        if key not in existing
+    ]
+    if new_rows:
+        # Feeds created in the meantime, e.g. by another import, are skipped
+        created = session.connection().execute(
+            insert_ignore(session.get_bind(), Feed, "canonical_key").returning(
+                Feed.id  # type: ignore[arg-type]
+            ),
+            new_rows,
+        )
+        increment_counters(session, {"feeds.total": len(created.all())})
+        existing = _find_feeds(session, feeds)
+
+    subscribed = set(
+        session.exec(
+            select(UserFeedLink.feed_id).where(UserFeedLink.user_id == user.id)
+        ).all()
+    )
+    # Several URLs of the file may be the same feed
+    unique = {feed.id: feed for feed in existing.values()}
+    links = [
+        {"user_id": user.id, "feed_id": feed_id, "created_at": now}
+        for feed_id in unique
+        if feed_id not in subscribed
+    ]
+    if links:
+        session.connection().execute(insert(UserFeedLink), links)
+        increment_counters(session, {"links.user_feed": len(links)})
+    session.commit()
+
+    stale = now - FEED_REFRESH_INTERVAL
+    return [
+        feed.id  # type: ignore[misc]
+        for feed in unique.values()
+        if not feed.is_disabled and feed.updated_at.replace(tzinfo=timezone.utc) < stale
+    ]
+
+
 @router.post("/process_opml")
 def process_opml(
-    opml: UploadFile, user_id: str | None = None, engine=Depends(get_engine)
+    opml: UploadFile,
+    user_id: str | None = None,
+    form_user_id: str | None = Form(default=None, alias="user_id"),
+    engine=Depends(get_engine),
 ):
-    if user_id is None:
-        user_id = uuid4().hex
-    with Session(engine, autoflush=False) as session:
-        try:
-            user: User = session.exec(select(User).where(User.id == user_id)).one()
-        except NoResultFound:
-            logger.info(f"User {user_id} not found in database, creating new user")
-            user = User(id=user_id)
-            session.add(user)
-            try:
-                session.commit()
-            except Exception as e:
-                # might happen if the user was created before by another thread
-                logger.warning(f"Failed to add user {user_id} to database: {e}")
-                session.rollback()
-                user = session.exec(select(User).where(User.id == user_id)).one()
+    # The frontend sends the user id as a form field
+    user_id = user_id or form_user_id or uuid4().hex
     opml_text = opml.file.read().decode("utf-8")
-    opml_text = get_opml_custom(opml_text)
+    feeds, skipped = get_opml_feeds(opml_text)
+    with Session(engine, autoflush=False) as session:
+        user = _get_or_create_user(session, user_id)
+        to_fetch = import_feeds(session, user, feeds)
+    try:
+        redis_conn.set(OPML_SKIPPED_KEY.format(user_id), skipped, ex=OPML_SKIPPED_TTL)
+    except RedisError as e:
+        logger.warning(f"Could not store the skipped feeds of {user_id}: {e}")
+
+    # Fetch the feeds now, so that the reader's first polls are served from
+    # the database instead of each waiting for its own upstream fetch
+    for i in range(0, len(to_fetch), BATCH_SIZE):
+        enqueue_medium_priority(fetch_feed_batch, to_fetch[i : i + BATCH_SIZE])
+    logger.info(
+        f"Imported {len(feeds)} feeds for user {user_id}, fetching {len(to_fetch)}, "
+        f"skipped {skipped}"
+    )
+
+    opml_text = get_opml_custom(opml_text, user_id)
+    return Response(
+        content=opml_text,
+        media_type="application/xml",
+        headers={"X-User-Id": user_id},
+    )
 
-    return Response(content=opml_text, media_type="application/xml")
+
+class ImportProgressResponse(BaseModel):
+    total: int
+    ready: int
+    pending: int
+    failed: int
+    # Outlines of the last import that were not imported: invalid URLs, or
+    # past OPML_IMPORT_MAX_FEEDS
+    skipped: int
+
+
+@router.get("/process_opml/{user_id}/progress")
+def import_progress(
+    user_id: str, engine=Depends(get_read_engine)
+) -> ImportProgressResponse:
+    """How many of the user's feeds are fetched, waiting or failing, and how
+    many outlines the last import skipped."""
+    stale = datetime.now(timezone.utc) - FEED_REFRESH_INTERVAL
+    with Session(engine) as session:
+        feeds = session.exec(
+            select(Feed.updated_at, Feed.last_error, Feed.is_disabled)
+            .join(UserFeedLink, Feed.id == UserFeedLink.feed_id)  # type: ignore[arg-type]
+            .where(UserFeedLink.user_id == user_id)
+        ).all()
+    try:
+        skipped = int(redis_conn.get(OPML_SKIPPED_KEY.format(user_id)) or 0)
+    except RedisError as e:
+        logger.warning(f"Could not get the skipped feeds of {user_id}: {e}")
+        skipped = 0
+    failed = sum(1 for _, last_error, is_disabled in feeds if last_error or is_disabled)
+    ready = sum(
+        1
+        for updated_at, last_error, is_disabled in feeds
+        if not (last_error or is_disabled)
+        and updated_at.replace(tzinfo=timezone.utc) >= stale
+    )
+    return ImportProgressResponse(
+        total=len(feeds),
+        ready=ready,
+        pending=len(feeds) - ready - failed,
+        failed=failed,
+        skipped=skipped,
+    )
@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Depends
+from sqlmodel import Session
+from app.models.counter import read_stats, reconcile_counters
+from .common import get_engine, get_read_engine
+
+router = APIRouter(
+    tags=["stats"],
+    responses={404: {"description": "Not found"}},
+)
+
+
+@router.get("/")
+def get_stats(engine=Depends(get_engine), read_engine=Depends(get_read_engine)) -> dict:
+    """Return database statistics from the incrementally maintained counters.
+
+    Cheap enough to be polled by monitoring.
+    """
+    with Session(read_engine, autoflush=False) as session:
+        stats = read_stats(session)
+    if stats is None:
+        with Session(engine, autoflush=False) as session:
+            reconcile_counters(session)
+            stats = read_stats(session)
+    return stats  # type: ignore[return-value]
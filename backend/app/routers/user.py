@@ -1,17 +1,32 @@
-from fastapi import APIRouter, Response, Depends
-from sklearn.decomposition import PCA
-import plotly.express as px
+from fastapi import APIRouter, Response, Depends, Query
 from typing import Any
+import json
+import numpy as np
 from pydantic import BaseModel
-from sqlmodel import Session, select
+from redis.exceptions import RedisError  # type: ignore
+from sqlalchemy import Engine
+from sqlmodel import Session, func, select
 from loguru import logger
 from app.models.user import User
 from app.models.article import Article
-from app.constants import WEB_URL
-from .common import get_engine
-import json
-import numpy as np
-from scipy.spatial.distance import cdist
+from app.models.relations import UserArticleLink
+from app.plots import (
+    CLUSTERS_2D_EMPTY_KEY,
+    CLUSTERS_2D_KEY,
+    CLUSTERS_2D_PENDING_KEY,
+    CLUSTERS_2D_RENDER_TIMEOUT,
+    CLUSTERS_2D_VIEWED_KEY,
+    CLUSTERS_2D_VIEWED_TTL,
+    MEDIA_TYPES,
+    clusters_version,
+)
+from app.tasks import (
+    enqueue_medium_priority,
+    redis_conn,
+    render_user_clusters_2d,
+    schedule_clusters_recompute,
+)
+from .common import get_read_engine
 
 
 # from fastapi_cache.coder import PickleCoder
@@ -24,120 +39,209 @@ router = APIRouter(
 )
 
 
+CLUSTERS_PAGE_SIZE = 100
+CLUSTERS_MAX_PAGE_SIZE = 1000
+
+
 class GetUserClustersResponse(BaseModel):
     user_id: str
     clustered_articles: dict[int, list[dict[str, Any]]]
+    # Number of clustered articles across all pages
+    total: int
+    offset: int
+    limit: int
+
+
+def _assign_to_centers(
+    session: Session, user_id: str, clusters: str, offset: int, limit: int
+) -> tuple[list[tuple[str, str, str, int]], int]:
+    """Assign the user's embedded read articles to the closest of `clusters`.
+
+    For the clusters computed before the assignments were stored with them.
+
+    Returns:
+        The page of (title, description, url, cluster) rows, in the order of the
+        stored assignments, and the number of assigned articles.
+    """
+    read = session.exec(
+        select(
+            Article.id,
+            Article.title,
+            Article.description,
+            Article.url,
+            Article.embedding,
+        )  # type: ignore[call-overload]
+        .join(UserArticleLink, UserArticleLink.article_id == Article.id)  # type: ignore[arg-type]
+        .where(UserArticleLink.user_id == user_id)
+        .where(Article.embedding.is_not(None))  # type: ignore[union-attr]
+    ).all()
+    if not read:
+        return [], 0
+
+    embeddings = np.array([json.loads(row.embedding) for row in read])
+    centers = np.array(json.loads(clusters))
+    distances = np.linalg.norm(embeddings[:, None, :] - centers[None, :, :], axis=2)
+    labels = distances.argmin(axis=1)
+    closest = distances[np.arange(len(read)), labels]
+    order = sorted(range(len(read)), key=lambda i: (labels[i], closest[i], read[i].id))
+    return [
+        (read[i].title, read[i].description, read[i].url, int(labels[i]))
+        for i in order[offset : offset + limit]
+    ], len(read)
 
 
 @router.get("/user/{user_id}/clusters")
 def get_user_clusters(
-    user_id: str, engine=Depends(get_engine)
+    user_id: str,
+    offset: int = Query(default=0, ge=0),
+    limit: int = Query(default=CLUSTERS_PAGE_SIZE, ge=1, le=CLUSTERS_MAX_PAGE_SIZE),
+    engine=Depends(get_read_engine),
 ) -> GetUserClustersResponse:
+    """Return the user's read articles grouped by cluster.
+
+    The articles are assigned to their cluster when the clusters are
+    recomputed, and paginated by cluster and distance to its center. Clusters
+    without articles in the page are left out.
+    """
     with Session(engine, autoflush=False) as session:
         try:
             user: User = session.exec(select(User).where(User.id == user_id)).one()
         except NoResultFound:
             return Response(status_code=404, content=f"User '{user_id}' not found")
 
-        articles_embeddings_list = [
-            json.loads(article.embedding)
-            for article in user.articles
-            if article.embedding
-        ]
-        if not articles_embeddings_list or not user.clusters:
-            logger.warning(
-                "No embeddings found for articles. Returning articles as is."
+        assigned = (
+            select(
+                Article.title, Article.description, Article.url, UserArticleLink.cluster
+            )  # type: ignore[call-overload]
+            .join(UserArticleLink, UserArticleLink.article_id == Article.id)  # type: ignore[arg-type]
+            .where(UserArticleLink.user_id == user_id)
+            .where(UserArticleLink.cluster.is_not(None))  # type: ignore[union-attr]
+        )
+        total = session.exec(
+            select(func.count()).select_from(assigned.subquery())
+        ).one()
+        if user.clusters and total:
+            rows = session.exec(
+                assigned.order_by(
+                    UserArticleLink.cluster,  # type: ignore[arg-type]
+                    UserArticleLink.cluster_distance,  # type: ignore[arg-type]
+                    Article.id,  # type: ignore[arg-type]
+                )
+                .offset(offset)
+                .limit(limit)
+            ).all()
+        elif user.clusters:
+            # Clustered before the assignments were stored: assign them here
+            # until the clusters are recomputed
+            rows, total = _assign_to_centers(
+                session, user_id, user.clusters, offset, limit
             )
+            if total:
+                try:
+                    schedule_clusters_recompute(user_id)
+                except RedisError as e:
+                    logger.warning(f"Could not schedule the clusters of {user_id}: {e}")
+        if not user.clusters or not total:
             return Response(
                 status_code=503, content="Clusters not ready. Please try again later."
             )
-        # Calculate distance of each passed article to the closest cluster
-        articles_embeddings = np.array(articles_embeddings_list)
-        cluster_centers: list[list[float]] = json.loads(user.clusters)
-        distances = cdist(articles_embeddings, cluster_centers, metric="cosine")
-        closest_clusters = np.argmin(distances, axis=1)
-
-        # Assign articles to clusters based on the closest cluster
-        cluster_articles: list[list[Article]] = [
-            [] for _ in range(len(cluster_centers))
-        ]
-        for i, cluster in enumerate(closest_clusters):
-            cluster_articles[cluster].append(user.articles[i])
-
-        return GetUserClustersResponse(
-            user_id=user_id,
-            clustered_articles={
-                cluster_id: [
-                    article.model_dump(include={"title", "description", "url"})
-                    for article in articles
-                ]
-                for cluster_id, articles in enumerate(cluster_articles)
-            },
+
+    clustered_articles: dict[int, list[dict[str, Any]]] = {}
+    for title, description, url, cluster in rows:
+        assert cluster is not None  # only the assigned articles are selected
+        clustered_articles.setdefault(cluster, []).append(
+            {"title": title, "description": description, "url": url}
         )
+    return GetUserClustersResponse(
+        user_id=user_id,
+        clustered_articles=clustered_articles,
+        total=total,
+        offset=offset,
+        limit=limit,
+    )
 
 
-@router.get("/user/{user_id}/clusters_2d")
-def get_user_clusters_2d(user_id: str, engine=Depends(get_engine)):
-    """Return a 2D PNG image of the user's clusters.
-
-    Uses PCA for dimensionality reduction to 2D. WIP.
-    """
+def _cached_clusters_2d(engine: Engine, user_id: str, fmt: str) -> Response:
+    """Serve the rendered clusters, or enqueue their rendering."""
     with Session(engine, autoflush=False) as session:
-        try:
-            user: User = session.exec(select(User).where(User.id == user_id)).one()
-        except NoResultFound:
+        user = session.get(User, user_id)
+        if user is None:
             return Response(status_code=404, content=f"User '{user_id}' not found")
-
-        articles_embeddings_list = [
-            json.loads(article.embedding)
-            for article in user.articles
-            if article.embedding
-        ]
-        if not articles_embeddings_list or not user.clusters:
-            logger.warning(
-                "No embeddings found for articles. Returning articles as is."
-            )
+        if not user.clusters:
             return Response(
                 status_code=503, content="Clusters not ready. Please try again later."
             )
-        # Calculate distance of each passed article to the closest cluster
-        articles_embeddings = np.array(articles_embeddings_list)
-        cluster_centers: list[list[float]] = json.loads(user.clusters)
-        distances = cdist(articles_embeddings, cluster_centers, metric="cosine")
-        closest_clusters = np.argmin(distances, axis=1)
-
-        # Assign articles to clusters based on the closest cluster
-        cluster_articles: list[list[Article]] = [
-            [] for _ in range(len(cluster_centers))
-        ]
-        for i, cluster in enumerate(closest_clusters):
-            cluster_articles[cluster].append(user.articles[i])
-
-        # Get the titles of the articles to display in the legend
-        article_titles = [article.title for article in user.articles]
-
-        # PCA for dimensionality reduction to 2D
-        pca = PCA(n_components=2)
-        articles_2d = pca.fit_transform(articles_embeddings)
-
-        # Create the plot
-        fig = px.scatter(
-            x=articles_2d[:, 0],
-            y=articles_2d[:, 1],
-            color=[f"Cluster {cluster}" for cluster in closest_clusters],
-            text=article_titles,
-            labels={"color": "Cluster"},
-            title=f"Clusters of your read articles: {WEB_URL}",
-        )
+        version = clusters_version(user.clusters_updated_at)
 
-        # labels top center
-        fig.update_traces(textposition="top center")
-
-        # remove axis labels
-        fig.update_xaxes(showticklabels=False)
-        fig.update_yaxes(showticklabels=False)
+    try:
+        content = redis_conn.get(CLUSTERS_2D_KEY.format(user_id, version, fmt))
+        if content is not None:
+            return Response(content=content, media_type=MEDIA_TYPES[fmt])
+        if redis_conn.get(CLUSTERS_2D_EMPTY_KEY.format(user_id, version)):
+            return Response(
+                status_code=503,
+                content="No read articles with embeddings to plot yet.",
+            )
 
+        redis_conn.set(
+            CLUSTERS_2D_VIEWED_KEY.format(user_id), 1, ex=CLUSTERS_2D_VIEWED_TTL
+        )
+        if redis_conn.set(
+            CLUSTERS_2D_PENDING_KEY.format(user_id, version),
+            1,
+            nx=True,
+            ex=CLUSTERS_2D_RENDER_TIMEOUT,
+        ):
+            enqueue_medium_priority(render_user_clusters_2d, user_id)
+    except RedisError as e:
+        logger.warning(f"Could not get the rendered clusters of {user_id}: {e}")
         return Response(
-            content=fig.to_image(format="png", width=1000, height=1000),
-            media_type="image/png",
+            status_code=503, content="Clusters not ready. Please try again later."
         )
+    return Response(
+        status_code=202,
+        content="Rendering the clusters. Please try again in a few seconds.",
+        headers={"Retry-After": "5"},
+    )
+
+
+@router.get(
+    "/user/{user_id}/clusters_2d",
+    responses={200: {"content": {"image/png": {}}}, 202: {}},
+    response_class=Response,
+)
+def get_user_clusters_2d(user_id: str, engine=Depends(get_read_engine)):
+    """Return a 2D PNG image of the user's clusters.
+
+    Uses PCA for dimensionality reduction to 2D. The image is rendered in the
+    background: 202 means it is being rendered, retry after a few seconds. 503
+    means there is nothing to plot yet (no clusters, or no read articles with
+    embeddings).
+    """
+    return _cached_clusters_2d(engine, user_id, "png")
+
+
+class Clusters2DPoint(BaseModel):
+    x: float
+    y: float
+    cluster: int
+    title: str
+    url: str
+
+
+class GetUserClusters2DResponse(BaseModel):
+    user_id: str
+    points: list[Clusters2DPoint]
+
+
+@router.get(
+    "/user/{user_id}/clusters_2d/points",
+    responses={200: {"model": GetUserClusters2DResponse}, 202: {}},
+    response_class=Response,
+)
+def get_user_clusters_2d_points(user_id: str, engine=Depends(get_read_engine)):
+    """Return the 2D coordinates of the user's clusters, for plotting them.
+
+    Like `clusters_2d`, 202 means they are being computed.
+    """
+    return _cached_clusters_2d(engine, user_id, "json")
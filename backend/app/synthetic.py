@@ -0,0 +1,237 @@
+"""Synthetic production-scale dataset for reproducing scaling issues locally.
+
+Feeds get a power-law popularity, so a few feeds have most subscribers, and
+each feed is about one topic: its articles' embeddings are drawn around the
+topic's center, so clustering and filtering behave like with real
+embeddings. Clicks per user are heavy-tailed as well, most users read a
+few articles and a few users read a lot.
+
+Everything is written with bulk inserts, and feeds are marked as freshly
+updated, so serving them doesn't trigger upstream fetches.
+"""
+
+import json
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from loguru import logger
+from sqlalchemy import Engine, func, insert
+from sqlmodel import Session, select
+
+from .database import sync_sequences
+from .models.article import Article
+from .models.counter import reconcile_counters
+from .models.feed import Feed, canonical_feed_key
+from .models.relations import UserArticleLink, UserFeedLink
+from .models.user import User
+
+SYNTHETIC_HOST = "synthetic.example"
+N_TOPICS = 50
+N_CLUSTERS = 10
+MIN_ARTICLES_FOR_CLUSTERS = 10
+
+
+def _embedding(vector: np.ndarray) -> str:
+    return json.dumps(np.round(vector, 5).tolist())
+
+
+def _insert(session: Session, model: type, rows: list[dict]) -> None:
+    if rows:
+        session.connection().execute(insert(model), rows)
+
+
+def generate_corpus(
+    engine: Engine,
+    users: int = 1000,
+    feeds: int = 200,
+    articles_per_feed: int = 100,
+    feeds_per_user: int = 10,
+    clicks_per_user: int = 30,
+    embedding_dim: int = 1024,
+    embedded_ratio: float = 0.9,
+    history_days: int = 180,
+    seed: int = 0,
+    batch_size: int = 5000,
+) -> dict[str, int]:
+    """Add a synthetic dataset to the database.
+
+    Args:
+        engine: Database to write to. Existing rows are kept, new ids start
+            after the current maximum.
+        users: Number of users.
+        feeds: Number of feeds.
+        articles_per_feed: Articles per feed, spread over `history_days`.
+        feeds_per_user: Mean number of subscriptions per user.
+        clicks_per_user: Mean number of clicked articles per user.
+        embedding_dim: Size of the random embeddings.
+        embedded_ratio: Fraction of articles that have an embedding.
+        history_days: Age of the oldest articles and clicks.
+        seed: Seed of the random generator, the same seed gives the same data.
+        batch_size: Rows per bulk insert.
+
+    Returns:
+        Number of rows created per table.
+    """
+    rng = np.random.default_rng(seed)
+    now = datetime.now(timezone.utc)
+
+    with Session(engine) as session:
+        first_feed_id = (session.exec(select(func.max(Feed.id))).one() or 0) + 1
+        first_article_id = (session.exec(select(func.max(Article.id))).one() or 0) + 1
+
+        topics = rng.standard_normal((N_TOPICS, embedding_dim))
+        feed_topics = rng.integers(N_TOPICS, size=feeds)
+        popularity = 1.0 / np.arange(1, feeds + 1) ** 1.1
+        popularity /= popularity.sum()
+
+        feed_ids = np.arange(first_feed_id, first_feed_id + feeds)
+        _insert(
+            session,
+            Feed,
+            [
+                {
+                    "id": int(feed_id),
+                    "url": f"https://{SYNTHETIC_HOST}/{feed_id}/rss",
+                    # Core inserts don't go through the ORM events
+                    "canonical_key": canonical_feed_key(
+                        f"https://{SYNTHETIC_HOST}/{feed_id}/rss"
+                    ),
+                    "title": f"Synthetic feed {feed_id}",
+                    "description": f"Synthetic feed about topic {topic}",
+                    "logo": None,
+                    "language": "en",
+                    "created_at": now - timedelta(days=history_days),
+                    "updated_at": now,
+                    "consecutive_failures": 0,
+                    "is_disabled": False,
+                }
+                for feed_id, topic in zip(feed_ids, feed_topics)
+            ],
+        )
+
+        # Articles of feed i get ids first_article_id + i * articles_per_feed + j
+        rows = []
+        n_articles = 0
+        for index, feed_id in enumerate(feed_ids):
+            ages = np.sort(rng.uniform(0, history_days, size=articles_per_feed))
+            embedded = rng.random(articles_per_feed) < embedded_ratio
+            for j in range(articles_per_feed):
+                article_id = first_article_id + index * articles_per_feed + j
+                pub_date = now - timedelta(days=float(ages[j]))
+                embedding = None
+                if embedded[j]:
+                    embedding = _embedding(
+                        topics[feed_topics[index]]
+                        + 0.5 * rng.standard_normal(embedding_dim)
+                    )
+                rows.append(
+                    {
+                        "id": article_id,
+                        "title": f"Synthetic article {article_id}",
+                        "description": (
+                            f"<p>Synthetic article {article_id} of feed {feed_id}. "
+                            f'<a href="https://{SYNTHETIC_HOST}/{feed_id}/{article_id}/more">'
+                            "Read more</a></p>"
+                        ),
+                        "url": f"https://{SYNTHETIC_HOST}/{feed_id}/{article_id}",
+                        "comments_url": f"https://{SYNTHETIC_HOST}/{feed_id}/{article_id}/comments",
+                        "pub_date": pub_date,
+                        "updated": pub_date,
+                        "embedding": embedding,
+                        "feed_id": int(feed_id),
+                    }
+                )
+            if len(rows) >= batch_size:
+                _insert(session, Article, rows)
+                n_articles += len(rows)
+                rows = []
+        _insert(session, Article, rows)
+        n_articles += len(rows)
+
+        user_rows: list[dict] = []
+        feed_link_rows: list[dict] = []
+        article_link_rows: list[dict] = []
+        n_feed_links = n_article_links = 0
+        # Pareto(1.5) has mean 2, so the clicks average out to clicks_per_user
+        clicks = (rng.pareto(1.5, size=users) * clicks_per_user / 2).astype(int)
+        for i in range(users):
+            user_id = f"synthetic-{seed}-{i}"
+            n_feeds = int(np.clip(rng.poisson(feeds_per_user), 1, feeds))
+            subscribed = rng.choice(feeds, size=n_feeds, replace=False, p=popularity)
+            last_request = now - timedelta(days=float(rng.exponential(30)))
+
+            clicked = rng.choice(
+                n_feeds * articles_per_feed,
+                size=min(int(clicks[i]), n_feeds * articles_per_feed),
+                replace=False,
+            )
+            for position in clicked:
+                feed_index = subscribed[position // articles_per_feed]
+                article_id = (
+                    first_article_id
+                    + feed_index * articles_per_feed
+                    + position % articles_per_feed
+                )
+                article_link_rows.append(
+                    {
+                        "user_id": user_id,
+                        "article_id": int(article_id),
+                        "created_at": now
+                        - timedelta(days=float(rng.uniform(0, history_days))),
+                    }
+                )
+
+            clusters = None
+            if len(clicked) >= MIN_ARTICLES_FOR_CLUSTERS:
+                centers = topics[
+                    feed_topics[rng.choice(subscribed, size=N_CLUSTERS)]
+                ] + 0.1 * rng.standard_normal((N_CLUSTERS, embedding_dim))
+                clusters = json.dumps(np.round(centers, 5).tolist())
+
+            user_rows.append(
+                {
+                    "id": user_id,
+                    "created_at": now - timedelta(days=history_days),
+                    "last_request": last_request,
+                    "clusters": clusters,
+                    "clusters_updated_at": now if clusters else None,
+                    "is_frozen": False,
+                    "frozen_at": None,
+                }
+            )
+            feed_link_rows.extend(
+                {
+                    "user_id": user_id,
+                    "feed_id": int(feed_ids[feed_index]),
+                    "created_at": now - timedelta(days=history_days),
+                }
+                for feed_index in subscribed
+            )
+
+            if len(article_link_rows) + len(feed_link_rows) >= batch_size:
+                _insert(session, User, user_rows)
+                _insert(session, UserFeedLink, feed_link_rows)
+                _insert(session, UserArticleLink, article_link_rows)
+                n_feed_links += len(feed_link_rows)
+                n_article_links += len(article_link_rows)
+                user_rows, feed_link_rows, article_link_rows = [], [], []
+        _insert(session, User, user_rows)
+        _insert(session, UserFeedLink, feed_link_rows)
+        _insert(session, UserArticleLink, article_link_rows)
+        n_feed_links += len(feed_link_rows)
+        n_article_links += len(article_link_rows)
+
+        # Ids were chosen here, PostgreSQL's sequences must skip past them
+        sync_sequences(session.connection(), "feed", "article")
+        session.commit()
+        reconcile_counters(session)
+
+    created = {
+        "users": users,
+        "feeds": feeds,
+        "articles": n_articles,
+        "user_feed_links": n_feed_links,
+        "user_article_links": n_article_links,
+    }
+    logger.info(f"Generated synthetic corpus: {created}")
+    return created
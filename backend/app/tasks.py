@@ -2,21 +2,24 @@ import asyncio
 import os
 import json
 import time
-from functools import wraps
-from typing import Callable, TypeVar
-from sqlmodel import create_engine, Session, select, update, delete, text
-from sqlalchemy import func, event
-from sqlalchemy.engine import Connection, Engine
-from sqlite3 import OperationalError as SQLiteOperationalError
+import numpy as np
+from typing import Any, Callable
+from sqlmodel import Session, select, update, delete, text
+from sqlalchemy import bindparam, exists
+from sqlalchemy.engine import Connection
 from datetime import datetime, timezone, timedelta
 from loguru import logger
 from redis import Redis  # type: ignore
+from redis.exceptions import RedisError  # type: ignore
 from rq import Queue, Retry
 from pydantic.networks import HttpUrl
 
+from app import activity
+from app.database import get_engine, insert_ignore, is_sqlite, with_db_retry
 from app.models.article import Article
 from app.models.feed import (
     Feed,
+    canonical_feed_key,
     parse_feed,
     generate_feed,
     SSRFException,
@@ -24,63 +27,37 @@ from app.models.feed import (
 )
 from app.models.user import User
 from app.models.relations import UserArticleLink, UserFeedLink
-from app.recommend import compute_embeddings, cluster_articles, filter_articles
-
-ENGINE = create_engine(
-    os.getenv("DATABASE_URL", "sqlite:///data/db.sqlite"),
-    echo=bool(os.getenv("DEBUG", False)),
-    connect_args={"check_same_thread": False, "timeout": 30},
+from app.loopmonitor import monitor_event_loop
+from app.tracing import span, traced
+from app.writer import write, write_handler
+from app.models.counter import (
+    increment_counters,
+    read_stats,
+    reconcile_counters,
+)
+from app.plots import (
+    CLUSTERS_2D_EMPTY_KEY,
+    CLUSTERS_2D_KEY,
+    CLUSTERS_2D_PENDING_KEY,
+    CLUSTERS_2D_TTL,
+    CLUSTERS_2D_VIEWED_KEY,
+    clusters_2d_points,
+    clusters_version,
+    render_clusters_2d_png,
+)
+from app.clustering import N_CLUSTERS, fit_clusters
+from app.recommend import compute_embeddings, filter_articles
+from app.metrics import (
+    CLUSTERING_BATCH_SIZE,
+    CLUSTERING_DURATION,
+    EMBEDDED_ARTICLES,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_DURATION,
+    FEED_FETCH_DURATION,
+    FEED_NEW_ARTICLES,
 )
 
-
-@event.listens_for(Engine, "connect")
-def set_sqlite_pragma(dbapi_connection, connection_record):  # type: ignore[no-untyped-def]
-    """Configure SQLite for better concurrency."""
-    cursor = dbapi_connection.cursor()
-    cursor.execute("PRAGMA journal_mode=WAL")
-    cursor.execute("PRAGMA busy_timeout=30000")
-    cursor.close()
-
-
-T = TypeVar("T")
-
-
-def with_db_retry(
-    max_retries: int = 3,
-    base_delay: float = 0.1,
-    max_delay: float = 2.0,
-) -> Callable[[Callable[..., T]], Callable[..., T]]:
-    """Decorator to retry database operations on lock errors with exponential backoff."""
-
-    def decorator(func: Callable[..., T]) -> Callable[..., T]:
-        @wraps(func)
-        def wrapper(*args, **kwargs) -> T:  # type: ignore[no-untyped-def]
-            last_exception = None
-            for attempt in range(max_retries):
-                try:
-                    return func(*args, **kwargs)
-                except Exception as e:
-                    # Check if it's a database locked error
-                    if "database is locked" in str(e) or isinstance(
-                        e.__cause__, SQLiteOperationalError
-                    ):
-                        last_exception = e
-                        delay = min(base_delay * (2**attempt), max_delay)
-                        logger.warning(
-                            f"Database locked on attempt {attempt + 1}/{max_retries} "
-                            f"for {func.__name__}, retrying in {delay:.2f}s"
-                        )
-                        time.sleep(delay)
-                    else:
-                        raise
-            logger.error(
-                f"Database still locked after {max_retries} retries for {func.__name__}"
-            )
-            raise last_exception  # type: ignore[misc]
-
-        return wrapper
-
-    return decorator
+ENGINE = get_engine()
 
 
 redis_conn = Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379"))
@@ -88,11 +65,43 @@ low_queue = Queue("low", connection=redis_conn, default_timeout=180)
 medium_queue = Queue("medium", connection=redis_conn, default_timeout=60)
 high_queue = Queue("high", connection=redis_conn, default_timeout=20)
 gpu_queue = Queue("gpu", connection=redis_conn, default_timeout=300)
+QUEUES = [high_queue, medium_queue, low_queue, gpu_queue]
+
+# With CLUSTER_BATCHING=1, the users who read an article are marked in a Redis
+# set, and `recompute_dirty_clusters` recomputes their clusters in batches
+CLUSTER_BATCHING = bool(os.getenv("CLUSTER_BATCHING", False))
+CLUSTERS_BATCH_SIZE = int(os.getenv("CLUSTERS_BATCH_SIZE", "50"))
+CLUSTERS_DIRTY_KEY = "clusters:dirty"
+# Seconds after which a run stops starting batches, it is scheduled every minute
+CLUSTERS_RUN_TIME_BUDGET = float(os.getenv("CLUSTERS_RUN_TIME_BUDGET", "45"))
+# Maximum number of users in the IN clause of the embeddings query
+CLUSTERS_LOAD_CHUNK_SIZE = 500
 
 DORMANT_THRESHOLD_DAYS = int(os.getenv("DORMANT_THRESHOLD_DAYS", "90"))
 ARTICLE_RETENTION_DAYS = int(os.getenv("ARTICLE_RETENTION_DAYS", "180"))
 EMBEDDING_RETENTION_DAYS = int(os.getenv("EMBEDDING_RETENTION_DAYS", "30"))
 
+# Maintenance deletes run in small keyset-paginated batches so that the SQLite
+# write lock is released between batches and API writes can get through.
+MAINTENANCE_BATCH_SIZE = int(os.getenv("MAINTENANCE_BATCH_SIZE", "1000"))
+# RQ kills the scheduled jobs after this many seconds (see scheduler.py)
+SCHEDULED_JOB_TIMEOUT = 600
+# Time budget of a whole maintenance run, shared by its steps. It stays below
+# the job timeout so that an interrupted run stores its resume cursor and
+# still vacuums before RQ kills it.
+MAINTENANCE_TIME_BUDGET = min(
+    float(os.getenv("MAINTENANCE_TIME_BUDGET", "420")), SCHEDULED_JOB_TIMEOUT * 0.8
+)
+MAINTENANCE_BATCH_PAUSE = float(os.getenv("MAINTENANCE_BATCH_PAUSE", "0.05"))
+MAINTENANCE_CURSOR_KEY = "maintenance:cursor:{}"
+
+# Space is normally reclaimed with bounded incremental_vacuum steps. A full
+# VACUUM (which rewrites the file and blocks writers) only runs when the
+# fraction of free pages crosses this threshold.
+VACUUM_FREELIST_THRESHOLD = float(os.getenv("VACUUM_FREELIST_THRESHOLD", "0.3"))
+INCREMENTAL_VACUUM_PAGES = int(os.getenv("INCREMENTAL_VACUUM_PAGES", "1000"))
+AUTO_VACUUM_INCREMENTAL = 2
+
 
 def compute_article_embedding(article_id: int) -> None:
     with Session(ENGINE) as session:
@@ -102,30 +111,293 @@ def compute_article_embedding(article_id: int) -> None:
 
         try:
             compute_embeddings([article])
-            session.commit()
+            write(ENGINE, "embeddings", {"embeddings": {article_id: article.embedding}})
             logger.info(f"Computed embedding for article {article_id}")
         except Exception as e:
             logger.error(f"Error computing embedding for article {article_id}: {e}")
 
 
-@with_db_retry(max_retries=3, base_delay=0.1, max_delay=1.0)
 def recompute_user_clusters(user_id: str) -> None:
+    try:
+        recompute_clusters_batch([user_id])
+    except Exception as e:
+        logger.error(f"Error recomputing clusters for user {user_id}: {e}")
+
+
+def _load_read_embeddings(
+    session: Session, user_ids: list[str]
+) -> tuple[list[int], np.ndarray, dict[str, np.ndarray]]:
+    """Decode the embeddings of the articles read by `user_ids` once each.
+
+    Returns:
+        The ids of the articles, their embeddings as the rows of a matrix, and
+        the rows read by each user with enough of them to be clustered.
+    """
+    index: dict[int, int] = {}
+    embeddings: list[list[float]] = []
+    rows: dict[str, list[int]] = {}
+    for i in range(0, len(user_ids), CLUSTERS_LOAD_CHUNK_SIZE):
+        read = session.exec(
+            select(UserArticleLink.user_id, Article.id, Article.embedding)  # type: ignore[call-overload]
+            .join(Article, Article.id == UserArticleLink.article_id)  # type: ignore[arg-type]
+            .where(
+                UserArticleLink.user_id.in_(  # type: ignore[union-attr]
+                    user_ids[i : i + CLUSTERS_LOAD_CHUNK_SIZE]
+                )
+            )
+            .where(Article.embedding.is_not(None))  # type: ignore[union-attr]
+            .distinct()
+            .order_by(UserArticleLink.user_id, Article.id)  # type: ignore[arg-type]
+        )
+        for user_id, article_id, embedding in read:
+            # Primary keys, and embeddings selected IS NOT NULL
+            assert user_id is not None and article_id is not None
+            assert embedding is not None
+            row = index.get(article_id)
+            if row is None:
+                row = index[article_id] = len(embeddings)
+                embeddings.append(json.loads(embedding))
+            rows.setdefault(user_id, []).append(row)
+    return (
+        list(index),
+        np.array(embeddings),
+        {
+            user_id: np.array(user_rows)
+            for user_id, user_rows in rows.items()
+            if len(user_rows) >= N_CLUSTERS
+        },
+    )
+
+
+# The load and the write are retried on their own, so that a locked database
+# doesn't get the clusters fitted again
+@with_db_retry(max_retries=3, base_delay=0.1, max_delay=1.0)
+def _load_clusters_batch(
+    user_ids: list[str],
+) -> tuple[list[int], np.ndarray, dict[str, np.ndarray]]:
     with Session(ENGINE) as session:
-        user = session.get(User, user_id)
-        if not user or len(user.articles) < 10:
+        return _load_read_embeddings(session, user_ids)
+
+
+@with_db_retry(max_retries=3, base_delay=0.1, max_delay=1.0)
+def _write_clusters_batch(users: list[dict]) -> None:
+    write(ENGINE, "clusters_batch", {"users": users})
+
+
+@traced
+def recompute_clusters_batch(user_ids: list[str]) -> int:
+    """Recompute the clusters of `user_ids` and store them in one transaction.
+
+    Returns:
+        Number of users whose clusters were recomputed, only those with at
+        least N_CLUSTERS embedded read articles.
+    """
+    with span("load"):
+        article_ids, embeddings, rows_by_user = _load_clusters_batch(user_ids)
+    if not rows_by_user:
+        return 0
+    CLUSTERING_BATCH_SIZE.observe(len(rows_by_user))
+
+    with span("fit"):
+        fitted = fit_clusters(embeddings, rows_by_user)
+    at = datetime.now(timezone.utc).isoformat()
+    with span("store"):
+        _write_clusters_batch(
+            [
+                {
+                    "user_id": user_id,
+                    "clusters": json.dumps(clusters.centers.tolist()),
+                    "at": at,
+                    # The labels are in the order of the user's rows
+                    "assignments": {
+                        article_ids[row]: [int(label), float(distance)]
+                        for row, label, distance in zip(
+                            rows_by_user[user_id],
+                            clusters.labels,
+                            clusters.distances,
+                        )
+                    },
+                }
+                for user_id, clusters in fitted.items()
+            ]
+        )
+
+    for clusters in fitted.values():
+        CLUSTERING_DURATION.observe(clusters.duration)
+    logger.info(
+        f"Recomputed clusters for {len(fitted)} users from {len(article_ids)} articles"
+    )
+    return len(fitted)
+
+
+def schedule_clusters_recompute(user_id: str) -> None:
+    """Recompute the user's clusters, in the next batch with CLUSTER_BATCHING."""
+    if CLUSTER_BATCHING:
+        try:
+            redis_conn.sadd(CLUSTERS_DIRTY_KEY, user_id)
             return
+        except RedisError as e:
+            logger.warning(f"Could not mark the clusters of {user_id} dirty: {e}")
+    enqueue_medium_priority(recompute_user_clusters, user_id)
+
+
+@traced
+def recompute_dirty_clusters() -> int:
+    """Recompute the clusters of the users who read articles since the last run.
+
+    No batch is started after CLUSTERS_RUN_TIME_BUDGET seconds, so that runs end
+    long before the job timeout, which would lose the users of the batch in
+    progress. A batch that fails puts its users back in the set.
+
+    Returns:
+        Number of users whose clusters were recomputed.
+    """
+    recomputed = 0
+    start = time.monotonic()
+    # Users marked while this runs are left to the next run
+    for _ in range(0, redis_conn.scard(CLUSTERS_DIRTY_KEY), CLUSTERS_BATCH_SIZE):
+        if time.monotonic() - start >= CLUSTERS_RUN_TIME_BUDGET:
+            logger.info("Clusters time budget exhausted, the rest is left for later")
+            break
+        user_ids = [
+            user_id.decode()
+            for user_id in redis_conn.spop(CLUSTERS_DIRTY_KEY, CLUSTERS_BATCH_SIZE)
+        ]
+        if not user_ids:
+            break
+        try:
+            recomputed += recompute_clusters_batch(user_ids)
+        except Exception:
+            redis_conn.sadd(CLUSTERS_DIRTY_KEY, *user_ids)
+            raise
+    return recomputed
+
+
+@write_handler("embeddings")
+def _store_embeddings(session: Session, intent: dict) -> None:
+    stored = 0
+    for article_id, embedding in intent["embeddings"].items():
+        result = session.exec(  # type: ignore[call-overload]
+            update(Article)
+            .where(Article.id == int(article_id))  # type: ignore[arg-type]
+            .where(Article.embedding.is_(None))  # type: ignore[union-attr]
+            .values(embedding=embedding)
+        )
+        stored += result.rowcount
+    increment_counters(session, {"articles.with_embeddings": stored})
+
+
+@write_handler("clusters")
+def _store_clusters(session: Session, intent: dict) -> Callable[[], None] | None:
+    user_id = intent["user_id"]
+    user = session.get(User, user_id)
+    if user is None:
+        return None
+    user.clusters = intent["clusters"]
+    user.clusters_updated_at = datetime.fromisoformat(intent["at"])
+
+    if "assignments" in intent:
+        table = UserArticleLink.__table__  # type: ignore[attr-defined]
+        connection = session.connection()
+        # Articles read since the recomputation are assigned by the next one
+        connection.execute(
+            update(table)
+            .where(table.c.user_id == user_id)
+            .values(cluster=None, cluster_distance=None)
+        )
+        assignments = [
+            {"b_article_id": int(article_id), "b_cluster": label, "b_distance": dist}
+            for article_id, (label, dist) in intent["assignments"].items()
+        ]
+        if assignments:
+            connection.execute(
+                update(table)
+                .where(table.c.user_id == user_id)
+                .where(table.c.article_id == bindparam("b_article_id"))
+                .values(
+                    cluster=bindparam("b_cluster"),
+                    cluster_distance=bindparam("b_distance"),
+                ),
+                assignments,
+            )
+
+    def render() -> None:
+        # Only for the users who look at their clusters
+        if redis_conn.exists(CLUSTERS_2D_VIEWED_KEY.format(user_id)):
+            enqueue_low_priority(render_user_clusters_2d, user_id)
+
+    return render
+
+
+@write_handler("clusters_batch")
+def _store_clusters_batch(session: Session, intent: dict) -> Callable[[], None]:
+    callbacks = [
+        _store_clusters(session, {"kind": "clusters", **clusters})
+        for clusters in intent["users"]
+    ]
+
+    def after_commit() -> None:
+        for callback in callbacks:
+            if callback is not None:
+                callback()
+
+    return after_commit
+
+
+@traced
+def render_user_clusters_2d(user_id: str) -> bool:
+    """Render the 2D visualisation of the user's current clusters.
+
+    Returns:
+        Whether it was rendered, not if the user has no clusters or none of
+        their read articles has an embedding.
+    """
+    with Session(ENGINE) as session:
+        with span("load"):
+            user = session.get(User, user_id)
+            if user is None or not user.clusters:
+                return False
+            version = clusters_version(user.clusters_updated_at)
+            articles = list(user.articles)
 
         try:
-            cluster_centers = cluster_articles(user.articles).cluster_centers_
-            user.clusters = json.dumps(cluster_centers.tolist())
-            user.clusters_updated_at = datetime.now(timezone.utc)
-            session.commit()
-            logger.info(f"Recomputed clusters for user {user_id}")
-        except Exception as e:
-            logger.error(f"Error recomputing clusters for user {user_id}: {e}")
+            with span("project"):
+                points = clusters_2d_points(articles, json.loads(user.clusters))
+            if not points:
+                # Until the clusters change, e.g. after their embeddings expired
+                redis_conn.set(
+                    CLUSTERS_2D_EMPTY_KEY.format(user_id, version),
+                    1,
+                    ex=CLUSTERS_2D_TTL,
+                )
+                logger.info(f"No embedded read articles to plot for user {user_id}")
+                return False
+            with span("render"):
+                png = render_clusters_2d_png(points)
+            with span("store"):
+                data = {
+                    "json": json.dumps({"user_id": user_id, "points": points}),
+                    "png": png,
+                }
+                for fmt, content in data.items():
+                    redis_conn.set(
+                        CLUSTERS_2D_KEY.format(user_id, version, fmt),
+                        content,
+                        ex=CLUSTERS_2D_TTL,
+                    )
+            logger.info(f"Rendered the clusters of user {user_id}")
+            return True
+        finally:
+            redis_conn.delete(CLUSTERS_2D_PENDING_KEY.format(user_id, version))
+
+
+def flush_activity(wait: bool = False) -> dict[str, int]:
+    """Write the buffered user and article activity timestamps."""
+    return activity.flush(ENGINE, wait=wait)
 
 
 def remove_old_embeddings() -> int:
+    flush_activity(wait=True)
     with Session(ENGINE) as session:
         threshold = datetime.now(timezone.utc) - timedelta(
             days=EMBEDDING_RETENTION_DAYS
@@ -140,6 +412,7 @@ def remove_old_embeddings() -> int:
 
         result = session.exec(update_statement)  # type: ignore[call-overload]
         affected_rows = result.rowcount
+        increment_counters(session, {"articles.with_embeddings": -affected_rows})
 
         session.commit()
         logger.info(f"Removed embeddings from {affected_rows} old articles")
@@ -147,6 +420,7 @@ def remove_old_embeddings() -> int:
 
 
 def freeze_dormant_users() -> int:
+    flush_activity(wait=True)
     with Session(ENGINE) as session:
         threshold = datetime.now(timezone.utc) - timedelta(days=DORMANT_THRESHOLD_DAYS)
         now = datetime.now(timezone.utc)
@@ -160,6 +434,7 @@ def freeze_dormant_users() -> int:
 
         result = session.exec(update_statement)  # type: ignore[call-overload]
         affected_rows = result.rowcount
+        increment_counters(session, {"users.frozen": affected_rows})
 
         session.commit()
         logger.info(
@@ -175,171 +450,445 @@ def unfreeze_user(user_id: str) -> bool:
             user.is_frozen = False
             user.frozen_at = None
             user.last_request = datetime.now(timezone.utc)
+            increment_counters(session, {"users.frozen": -1})
             session.commit()
             logger.info(f"Unfroze user {user_id}")
             return True
         return False
 
 
-def cleanup_old_articles(retention_days: int | None = None) -> int:
-    if retention_days is None:
-        retention_days = ARTICLE_RETENTION_DAYS
+def _get_maintenance_cursor(name: str) -> int | str | None:
+    """Return the key a previous, interrupted run of `name` stopped at."""
+    try:
+        value = redis_conn.get(MAINTENANCE_CURSOR_KEY.format(name))
+    except RedisError as e:
+        logger.warning(f"Could not load maintenance cursor for {name}: {e}")
+        return None
+    return json.loads(value) if value is not None else None
 
-    with Session(ENGINE) as session:
-        threshold = datetime.now(timezone.utc) - timedelta(days=retention_days)
 
-        read_article_ids = select(UserArticleLink.article_id).distinct()
+def _set_maintenance_cursor(name: str, cursor: int | str | None) -> None:
+    """Persist (or clear, if `cursor` is None) the resume point of `name`."""
+    key = MAINTENANCE_CURSOR_KEY.format(name)
+    try:
+        if cursor is None:
+            redis_conn.delete(key)
+        else:
+            redis_conn.set(key, json.dumps(cursor))
+    except RedisError as e:
+        logger.warning(f"Could not store maintenance cursor for {name}: {e}")
+
+
+@with_db_retry(max_retries=3, base_delay=0.1, max_delay=2.0)
+def _delete_batch(
+    model: type,
+    key_column,  # type: ignore[no-untyped-def]
+    conditions: list,
+    cursor: int | str | None,
+    batch_size: int,
+    distinct: bool = False,
+    counter: str | None = None,
+    subset_counters: dict[str, Any] | None = None,
+) -> tuple[list, int]:
+    """Delete the next batch of rows matching `conditions`, ordered by `key_column`.
+
+    Args:
+        counter: Counter of all the rows, decremented by the rows deleted.
+        subset_counters: Counters of subsets of the rows, by the column that
+            is truthy for the rows they count. Each is decremented by the
+            deleted rows for which it was.
 
-        delete_statement = (
-            delete(Article)
-            .where(Article.updated < threshold)  # type: ignore[arg-type]
-            .where(Article.id.notin_(read_article_ids))  # type: ignore[union-attr]
-        )
+    Returns:
+        Tuple of (keys selected in this batch, number of rows deleted).
+    """
+    with Session(ENGINE) as session:
+        query = select(key_column).where(*conditions)
+        if cursor is not None:
+            query = query.where(key_column > cursor)
+        if distinct:
+            query = query.distinct()
+        keys = list(session.exec(query.order_by(key_column).limit(batch_size)).all())
+        if not keys:
+            return [], 0
+
+        # Conditions are re-checked so rows that stopped matching between the
+        # select and the delete (e.g. an article that was just read) survive.
+        statement = delete(model).where(key_column.in_(keys)).where(*conditions)
+        deltas: dict[str, int] = {}
+        if subset_counters:
+            # The columns themselves are returned: SQLite answers expressions
+            # such as `embedding IS NOT NULL` from the partial index's WHERE
+            # clause, true for every row.
+            deleted_rows = session.exec(  # type: ignore[call-overload]
+                statement.returning(*subset_counters.values())
+            ).all()
+            deleted = len(deleted_rows)
+            for i, name in enumerate(subset_counters):
+                deltas[name] = -sum(1 for row in deleted_rows if row[i])
+        else:
+            deleted = session.exec(statement).rowcount  # type: ignore[call-overload]
+        if counter is not None:
+            deltas[counter] = -deleted
+        increment_counters(session, deltas)
+        session.commit()
+        return keys, deleted
+
+
+def _delete_in_batches(
+    name: str,
+    model: type,
+    key_column,  # type: ignore[no-untyped-def]
+    conditions: list,
+    batch_size: int | None = None,
+    time_budget: float | None = None,
+    distinct: bool = False,
+    counter: str | None = None,
+    subset_counters: dict[str, Any] | None = None,
+) -> int:
+    """Delete all rows matching `conditions` in keyset-paginated batches.
+
+    Each batch is its own short transaction, followed by a short pause so that
+    other writers can take the database lock. When `time_budget` seconds have
+    elapsed the last processed key is stored, and the next run resumes from it.
 
-        result = session.exec(delete_statement)  # type: ignore[call-overload]
-        deleted_count = result.rowcount
+    Returns:
+        Number of rows deleted.
+    """
+    batch_size = batch_size or MAINTENANCE_BATCH_SIZE
+    if time_budget is None:
+        time_budget = MAINTENANCE_TIME_BUDGET
+
+    cursor = _get_maintenance_cursor(name)
+    if cursor is not None:
+        logger.info(f"Resuming {name} after key {cursor!r}")
+
+    start = time.monotonic()
+    deleted_total = 0
+    batches = 0
+    while True:
+        batch_start = time.monotonic()
+        keys, deleted = _delete_batch(
+            model,
+            key_column,
+            conditions,
+            cursor,
+            batch_size,
+            distinct,
+            counter,
+            subset_counters,
+        )
+        if not keys:
+            _set_maintenance_cursor(name, None)
+            break
 
-        session.commit()
+        batches += 1
+        deleted_total += deleted
+        cursor = keys[-1]
         logger.info(
-            f"Deleted {deleted_count} old articles (>{retention_days} days, unread)"
+            f"{name}: batch {batches} deleted {deleted} rows in "
+            f"{(time.monotonic() - batch_start) * 1000:.0f} ms"
         )
-        return deleted_count
 
+        if len(keys) < batch_size:
+            _set_maintenance_cursor(name, None)
+            break
+        if time.monotonic() - start >= time_budget:
+            _set_maintenance_cursor(name, cursor)
+            logger.warning(
+                f"{name}: time budget of {time_budget}s exhausted after {batches} "
+                f"batches, next run resumes after key {cursor!r}"
+            )
+            break
+        time.sleep(MAINTENANCE_BATCH_PAUSE)
 
-def cleanup_orphan_user_article_links() -> int:
-    with Session(ENGINE) as session:
-        existing_article_ids = select(Article.id)
+    return deleted_total
 
-        delete_statement = delete(UserArticleLink).where(
-            UserArticleLink.article_id.notin_(existing_article_ids)  # type: ignore[union-attr]
-        )
 
-        result = session.exec(delete_statement)  # type: ignore[call-overload]
-        deleted_count = result.rowcount
+def cleanup_old_articles(
+    retention_days: int | None = None,
+    batch_size: int | None = None,
+    time_budget: float | None = None,
+) -> int:
+    if retention_days is None:
+        retention_days = ARTICLE_RETENTION_DAYS
 
-        session.commit()
-        logger.info(f"Deleted {deleted_count} orphan user-article links")
-        return deleted_count
+    flush_activity(wait=True)
+    threshold = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    deleted_count = _delete_in_batches(
+        "cleanup_old_articles",
+        Article,
+        Article.id,
+        [
+            Article.updated < threshold,  # type: ignore[arg-type]
+            ~exists().where(UserArticleLink.article_id == Article.id),  # type: ignore[arg-type]
+        ],
+        batch_size=batch_size,
+        time_budget=time_budget,
+        counter="articles.total",
+        subset_counters={
+            "articles.with_embeddings": Article.embedding,
+        },
+    )
+    logger.info(
+        f"Deleted {deleted_count} old articles (>{retention_days} days, unread)"
+    )
+    return deleted_count
+
+
+def cleanup_orphan_user_article_links(
+    batch_size: int | None = None, time_budget: float | None = None
+) -> int:
+    deleted_count = _delete_in_batches(
+        "cleanup_orphan_user_article_links",
+        UserArticleLink,
+        UserArticleLink.article_id,
+        [~exists().where(Article.id == UserArticleLink.article_id)],  # type: ignore[arg-type]
+        batch_size=batch_size,
+        time_budget=time_budget,
+        distinct=True,
+        counter="links.user_article",
+    )
+    logger.info(f"Deleted {deleted_count} orphan user-article links")
+    return deleted_count
+
+
+def cleanup_orphan_user_feed_links(
+    batch_size: int | None = None, time_budget: float | None = None
+) -> int:
+    deleted_count = _delete_in_batches(
+        "cleanup_orphan_user_feed_links",
+        UserFeedLink,
+        UserFeedLink.feed_id,
+        [~exists().where(Feed.id == UserFeedLink.feed_id)],  # type: ignore[arg-type]
+        batch_size=batch_size,
+        time_budget=time_budget,
+        distinct=True,
+        counter="links.user_feed",
+    )
+    logger.info(f"Deleted {deleted_count} orphan user-feed links")
+    return deleted_count
+
+
+def cleanup_inactive_users(
+    inactive_days: int = 365,
+    batch_size: int | None = None,
+    time_budget: float | None = None,
+) -> int:
+    flush_activity(wait=True)
+    threshold = datetime.now(timezone.utc) - timedelta(days=inactive_days)
+    deleted_count = _delete_in_batches(
+        "cleanup_inactive_users",
+        User,
+        User.id,
+        [
+            User.last_request < threshold,  # type: ignore[arg-type]
+            ~exists().where(UserArticleLink.user_id == User.id),  # type: ignore[arg-type]
+            ~exists().where(UserFeedLink.user_id == User.id),  # type: ignore[arg-type]
+        ],
+        batch_size=batch_size,
+        time_budget=time_budget,
+        counter="users.total",
+        subset_counters={"users.frozen": User.is_frozen},
+    )
+    logger.info(
+        f"Deleted {deleted_count} inactive users (>{inactive_days} days, no feeds/articles)"
+    )
+    return deleted_count
+
+
+def _storage_stats(connection: Connection) -> dict:
+    if not is_sqlite(connection):
+        # PostgreSQL tracks free space per table, autovacuum reclaims it
+        block_size = int(connection.execute(text("SHOW block_size")).scalar_one())
+        size = connection.execute(
+            text("SELECT pg_database_size(current_database())")
+        ).scalar_one()
+        return {
+            "page_size": block_size,
+            "page_count": size // block_size,
+            "freelist_pages": None,
+            "auto_vacuum": None,
+            "file_size": size,
+            "wal_size": None,
+        }
 
+    def pragma(name: str) -> int:
+        return connection.execute(text(f"PRAGMA {name}")).scalar_one()
 
-def cleanup_orphan_user_feed_links() -> int:
-    with Session(ENGINE) as session:
-        existing_feed_ids = select(Feed.id)
+    stats = {
+        "page_size": pragma("page_size"),
+        "page_count": pragma("page_count"),
+        "freelist_pages": pragma("freelist_count"),
+        "auto_vacuum": pragma("auto_vacuum"),
+        "file_size": None,
+        "wal_size": None,
+    }
+    if (database := connection.engine.url.database) and os.path.exists(database):
+        stats["file_size"] = os.path.getsize(database)
+        if os.path.exists(f"{database}-wal"):
+            stats["wal_size"] = os.path.getsize(f"{database}-wal")
+    return stats
 
-        delete_statement = delete(UserFeedLink).where(
-            UserFeedLink.feed_id.notin_(existing_feed_ids)  # type: ignore[union-attr]
-        )
 
-        result = session.exec(delete_statement)  # type: ignore[call-overload]
-        deleted_count = result.rowcount
+def get_storage_stats() -> dict:
+    """Return page, freelist and file size information about the database."""
+    with ENGINE.connect() as connection:
+        return _storage_stats(connection)
 
-        session.commit()
-        logger.info(f"Deleted {deleted_count} orphan user-feed links")
-        return deleted_count
 
+def vacuum_database(full: bool = False, time_budget: float | None = None) -> dict:
+    """Reclaim free space and refresh the query planner statistics.
 
-def cleanup_inactive_users(inactive_days: int = 365) -> int:
-    with Session(ENGINE) as session:
-        threshold = datetime.now(timezone.utc) - timedelta(days=inactive_days)
+    Free pages are released with bounded `PRAGMA incremental_vacuum` steps, and
+    statistics are refreshed with `PRAGMA optimize`, both of which only hold the
+    write lock briefly. A full VACUUM only runs when requested, when the
+    freelist fragmentation exceeds VACUUM_FREELIST_THRESHOLD, or once to switch
+    an existing database to `auto_vacuum=INCREMENTAL`.
 
-        inactive_user_ids = (
-            select(User.id)
-            .where(User.last_request < threshold)  # type: ignore[arg-type]
-            .where(
-                ~User.id.in_(  # type: ignore[attr-defined]
-                    select(UserArticleLink.user_id).distinct()
-                )
+    On PostgreSQL, autovacuum already reclaims dead rows, so this runs a
+    `VACUUM (ANALYZE)`, or `VACUUM (FULL, ANALYZE)` to shrink the files when
+    `full` is set.
+
+    Returns:
+        Dict with the vacuum mode used and the freelist size before and after.
+    """
+    if time_budget is None:
+        time_budget = MAINTENANCE_TIME_BUDGET
+
+    with ENGINE.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        before = _storage_stats(connection)
+        if not is_sqlite(connection):
+            mode = "full" if full else "analyze"
+            connection.execute(
+                text("VACUUM (FULL, ANALYZE)" if full else "VACUUM (ANALYZE)")
             )
-            .where(
-                ~User.id.in_(  # type: ignore[attr-defined]
-                    select(UserFeedLink.user_id).distinct()
-                )
+            after = _storage_stats(connection)
+            logger.info(
+                f"Database vacuumed ({mode}): {before['file_size']} -> "
+                f"{after['file_size']} bytes"
             )
-        )
+            return {
+                "mode": mode,
+                "freelist_before": None,
+                "freelist_after": None,
+            }
+
+        fragmentation = before["freelist_pages"] / max(before["page_count"], 1)
+
+        if (
+            full
+            or fragmentation >= VACUUM_FREELIST_THRESHOLD
+            or before["auto_vacuum"] != AUTO_VACUUM_INCREMENTAL
+        ):
+            mode = "full"
+            logger.info(
+                f"Running full VACUUM (fragmentation {fragmentation:.1%}, "
+                f"auto_vacuum={before['auto_vacuum']})"
+            )
+            connection.execute(text("PRAGMA auto_vacuum=INCREMENTAL"))
+            connection.execute(text("VACUUM"))
+        else:
+            mode = "incremental"
+            start = time.monotonic()
+            freelist = before["freelist_pages"]
+            while freelist > 0 and time.monotonic() - start < time_budget:
+                # The sqlite3 module only steps this pragma once per execute()
+                # (freeing a single page), executescript() runs it to completion
+                connection.connection.driver_connection.executescript(  # type: ignore[union-attr]
+                    f"PRAGMA incremental_vacuum({INCREMENTAL_VACUUM_PAGES})"
+                )
+                freelist = connection.execute(
+                    text("PRAGMA freelist_count")
+                ).scalar_one()
+                if freelist > 0:
+                    time.sleep(MAINTENANCE_BATCH_PAUSE)
 
-        delete_statement = delete(User).where(
-            User.id.in_(inactive_user_ids)  # type: ignore[attr-defined]
-        )
+        connection.execute(text("PRAGMA optimize"))
+        after = _storage_stats(connection)
 
-        result = session.exec(delete_statement)  # type: ignore[call-overload]
-        deleted_count = result.rowcount
+    logger.info(
+        f"Database vacuumed ({mode}): freelist {before['freelist_pages']} -> "
+        f"{after['freelist_pages']} pages, optimized"
+    )
+    return {
+        "mode": mode,
+        "freelist_before": before["freelist_pages"],
+        "freelist_after": after["freelist_pages"],
+    }
 
-        session.commit()
-        logger.info(
-            f"Deleted {deleted_count} inactive users (>{inactive_days} days, no feeds/articles)"
-        )
-        return deleted_count
 
+def reconcile_database_stats() -> dict[str, int]:
+    """Recount every stats counter with a full scan to correct any drift.
 
-def vacuum_database() -> None:
-    connection: Connection = ENGINE.connect()
-    connection.execute(text("VACUUM"))
-    connection.execute(text("ANALYZE"))
-    connection.close()
-    logger.info("Database vacuumed and analyzed")
+    Returns:
+        The drift corrected for each counter.
+    """
+    with Session(ENGINE) as session:
+        drift = reconcile_counters(session)
+    if drifted := {name: value for name, value in drift.items() if value}:
+        logger.warning(f"Corrected stats counter drift: {drifted}")
+    else:
+        logger.info("Stats counters reconciled, no drift")
+    return drift
 
 
 def get_database_stats() -> dict:
     with Session(ENGINE) as session:
-        stats = {
-            "users": {
-                "total": session.exec(select(func.count()).select_from(User)).one(),
-                "active_30d": session.exec(
-                    select(func.count())
-                    .select_from(User)
-                    .where(
-                        User.last_request
-                        > datetime.now(timezone.utc) - timedelta(days=30)
-                    )
-                ).one(),
-                "frozen": session.exec(
-                    select(func.count())
-                    .select_from(User)
-                    .where(User.is_frozen.is_(True))  # type: ignore[attr-defined]
-                ).one(),
-            },
-            "feeds": {
-                "total": session.exec(select(func.count()).select_from(Feed)).one(),
-                "disabled": session.exec(
-                    select(func.count())
-                    .select_from(Feed)
-                    .where(Feed.is_disabled.is_(True))  # type: ignore[attr-defined]
-                ).one(),
-            },
-            "articles": {
-                "total": session.exec(select(func.count()).select_from(Article)).one(),
-                "with_embeddings": session.exec(
-                    select(func.count())
-                    .select_from(Article)
-                    .where(Article.embedding.isnot(None))  # type: ignore[union-attr]
-                ).one(),
-            },
-            "links": {
-                "user_article": session.exec(
-                    select(func.count()).select_from(UserArticleLink)
-                ).one(),
-                "user_feed": session.exec(
-                    select(func.count()).select_from(UserFeedLink)
-                ).one(),
-            },
-        }
-        return stats
+        stats = read_stats(session)
+    if stats is None:
+        logger.info("Stats counters not initialised yet, reconciling")
+        reconcile_database_stats()
+        with Session(ENGINE) as session:
+            stats = read_stats(session)
+    assert stats is not None
+    stats["storage"] = get_storage_stats()
+    return stats
+
+
+def run_full_maintenance(time_budget: float | None = None) -> dict:
+    """Run every maintenance step within a single time budget.
+
+    The batched cleanups and the vacuum are given the time left before the
+    deadline, and the steps that are reached after it are skipped until the
+    next run (the cleanups resume from their stored cursors).
+    """
+    if time_budget is None:
+        time_budget = MAINTENANCE_TIME_BUDGET
+    deadline = time.monotonic() + time_budget
 
+    def remaining() -> float:
+        return deadline - time.monotonic()
 
-def run_full_maintenance() -> dict:
     results: dict = {}
-
-    logger.info("Starting full maintenance cycle")
-
-    results["frozen_users"] = freeze_dormant_users()
-    results["removed_embeddings"] = remove_old_embeddings()
-    results["deleted_articles"] = cleanup_old_articles()
-    results["orphan_article_links"] = cleanup_orphan_user_article_links()
-    results["orphan_feed_links"] = cleanup_orphan_user_feed_links()
-
-    vacuum_database()
-    results["vacuumed"] = True
-
+    durations: dict[str, float] = {}
+
+    logger.info(f"Starting full maintenance cycle, time budget {time_budget}s")
+
+    steps: list[tuple[str, Callable[[], Any]]] = [
+        ("frozen_users", freeze_dormant_users),
+        ("removed_embeddings", remove_old_embeddings),
+        ("deleted_articles", lambda: cleanup_old_articles(time_budget=remaining())),
+        (
+            "orphan_article_links",
+            lambda: cleanup_orphan_user_article_links(time_budget=remaining()),
+        ),
+        (
+            "orphan_feed_links",
+            lambda: cleanup_orphan_user_feed_links(time_budget=remaining()),
+        ),
+        ("vacuum", lambda: vacuum_database(time_budget=remaining())),
+    ]
+    for name, step in steps:
+        if remaining() <= 0:
+            logger.warning(f"Maintenance time budget exhausted, skipping {name}")
+            results[name] = None
+            continue
+        step_start = time.monotonic()
+        results[name] = step()
+        durations[name] = round(time.monotonic() - step_start, 3)
+        logger.info(f"Maintenance step {name} took {durations[name]:.3f}s")
+
+    results["durations"] = durations
     logger.info(f"Full maintenance completed: {results}")
     return results
 
@@ -349,117 +898,231 @@ MAX_CONSECUTIVE_FAILURES = int(os.getenv("FEED_MAX_FAILURES", "5"))
 
 
 @with_db_retry(max_retries=3, base_delay=0.2, max_delay=2.0)
+@traced
 def fetch_feed_batch(feed_ids: list[int]) -> None:
     async def fetch_single_feed(feed: Feed) -> tuple[Feed | None, str | None]:
         """Fetch a single feed and return (parsed_feed, error_message)."""
+        start = time.monotonic()
         try:
-            parsed = await parse_feed(HttpUrl(feed.url))
+            with span("fetch"):
+                parsed = await parse_feed(HttpUrl(feed.url))
+            FEED_FETCH_DURATION.labels(outcome="success").observe(
+                time.monotonic() - start
+            )
             return parsed, None
         except (SSRFException, UpstreamError) as e:
             logger.warning(f"Error fetching feed {feed.id}: {e}")
+            FEED_FETCH_DURATION.labels(outcome="error").observe(
+                time.monotonic() - start
+            )
             return None, str(e)
         except Exception as e:
             logger.error(f"Unhandled error fetching feed {feed.id}: {e}")
+            FEED_FETCH_DURATION.labels(outcome="error").observe(
+                time.monotonic() - start
+            )
             return None, str(e)
 
     async def fetch_multiple_feeds(
         feeds: list[Feed],
     ) -> list[tuple[Feed | None, str | None]]:
-        return await asyncio.gather(*[fetch_single_feed(feed) for feed in feeds])
+        async with monitor_event_loop("fetch_feed_batch"):
+            return await asyncio.gather(*[fetch_single_feed(feed) for feed in feeds])
 
     with Session(ENGINE) as session:
-        feeds = list(
-            session.exec(
-                select(Feed).where(Feed.id.in_(feed_ids))  # type: ignore[union-attr]
-            ).all()
-        )
+        with span("load"):
+            feeds = list(
+                session.exec(
+                    select(Feed).where(Feed.id.in_(feed_ids))  # type: ignore[union-attr]
+                ).all()
+            )
+    with span("fetch_all"):
         results = asyncio.run(fetch_multiple_feeds(feeds))
 
-        new_articles = []
-        updated_urls = 0
-        for feed, (parsed_feed, error) in zip(feeds, results):
-            feed.updated_at = datetime.now(timezone.utc)
-
-            if parsed_feed is None:
-                # Track failure
-                feed.consecutive_failures += 1
-                feed.last_error = error
-                if feed.consecutive_failures >= MAX_CONSECUTIVE_FAILURES:
-                    feed.is_disabled = True
-                    logger.warning(
-                        f"Disabled feed {feed.id} ({feed.url}) after "
-                        f"{feed.consecutive_failures} consecutive failures: {error}"
-                    )
-                continue
+    with span("store"):
+        write(
+            ENGINE,
+            "feed_batch",
+            {
+                "fetched_at": datetime.now(timezone.utc).isoformat(),
+                "results": [
+                    _feed_result(feed, parsed_feed, error)
+                    for feed, (parsed_feed, error) in zip(feeds, results)
+                ],
+            },
+        )
 
-            # Success - reset failure tracking
-            feed.consecutive_failures = 0
-            feed.last_error = None
-
-            # Check if URL changed (redirect was followed)
-            if parsed_feed.url != feed.url:
-                # Check if new URL already exists
-                existing_feed = session.exec(
-                    select(Feed).where(Feed.url == parsed_feed.url)
-                ).first()
-                if existing_feed:
-                    logger.warning(
-                        f"Feed {feed.id} redirected to {parsed_feed.url} which already "
-                        f"exists as feed {existing_feed.id}, marking as disabled"
-                    )
-                    feed.is_disabled = True
-                    feed.last_error = f"Redirects to existing feed {existing_feed.id}"
-                    continue
-                else:
-                    logger.info(
-                        f"Updating feed {feed.id} URL: {feed.url} -> {parsed_feed.url}"
-                    )
-                    # Preserve the original URL so users can still query with it
-                    if feed.original_url is None:
-                        feed.original_url = feed.url
-                    feed.url = parsed_feed.url
-                    updated_urls += 1
-
-            for article in parsed_feed.articles:
-                existing_article = session.exec(
-                    select(Article)
-                    .where(Article.feed_id == feed.id)
-                    .where(Article.url == article.url)
-                ).first()
-                if not existing_article:
-                    article.feed = feed
-                    session.add(article)
-                    new_articles.append(article)
 
-        session.commit()
+def _isoformat(value: datetime | None) -> str | None:
+    return value.isoformat() if value is not None else None
+
+
+def _fromisoformat(value: str | None) -> datetime | None:
+    return datetime.fromisoformat(value) if value is not None else None
+
+
+def _feed_result(feed: Feed, parsed_feed: Feed | None, error: str | None) -> dict:
+    """Serialise the outcome of fetching `feed` for the feed_batch intent."""
+    if parsed_feed is None:
+        return {"feed_id": feed.id, "error": error}
+    return {
+        "feed_id": feed.id,
+        "error": None,
+        "url": parsed_feed.url,
+        "title": parsed_feed.title,
+        "description": parsed_feed.description,
+        "logo": parsed_feed.logo,
+        "language": parsed_feed.language,
+        "articles": [
+            {
+                "title": article.title,
+                "description": article.description,
+                "url": article.url,
+                "comments_url": article.comments_url,
+                "pub_date": _isoformat(article.pub_date),
+                "updated": _isoformat(article.updated),
+            }
+            for article in parsed_feed.articles
+        ],
+    }
+
+
+@write_handler("feed_batch")
+def _store_feed_batch(session: Session, intent: dict) -> Callable[[], None]:
+    fetched_at = datetime.fromisoformat(intent["fetched_at"])
+    new_article_ids: list[int] = []
+    updated_urls = 0
+    disabled_feeds = 0
+    for result in intent["results"]:
+        feed = session.get(Feed, result["feed_id"])
+        if feed is None:
+            continue
+        feed.updated_at = fetched_at
+
+        if result["error"] is not None:
+            # Track failure
+            feed.consecutive_failures += 1
+            feed.last_error = result["error"]
+            if feed.consecutive_failures >= MAX_CONSECUTIVE_FAILURES:
+                feed.is_disabled = True
+                disabled_feeds += 1
+                logger.warning(
+                    f"Disabled feed {feed.id} ({feed.url}) after "
+                    f"{feed.consecutive_failures} consecutive failures: "
+                    f"{result['error']}"
+                )
+            continue
+
+        # Success - reset failure tracking
+        feed.consecutive_failures = 0
+        feed.last_error = None
+        # Feeds imported from OPML files only have a title until fetched
+        if result.get("title"):
+            feed.title = result["title"]
+        for field in ("description", "logo", "language"):
+            if result.get(field) is not None:
+                setattr(feed, field, result[field])
+
+        # Check if URL changed (redirect was followed)
+        if result["url"] != feed.url:
+            # Check if new URL already exists, in any of its variants
+            existing_feed = session.exec(
+                select(Feed).where(
+                    Feed.canonical_key == canonical_feed_key(result["url"]),
+                    Feed.id != feed.id,
+                )
+            ).first()
+            if existing_feed:
+                logger.warning(
+                    f"Feed {feed.id} redirected to {result['url']} which already "
+                    f"exists as feed {existing_feed.id}, marking as disabled"
+                )
+                if not feed.is_disabled:
+                    disabled_feeds += 1
+                feed.is_disabled = True
+                feed.last_error = f"Redirects to existing feed {existing_feed.id}"
+                continue
+            else:
+                logger.info(
+                    f"Updating feed {feed.id} URL: {feed.url} -> {result['url']}"
+                )
+                # Preserve the original URL so users can still query with it
+                if feed.original_url is None:
+                    feed.original_url = feed.url
+                feed.url = result["url"]
+                updated_urls += 1
+
+        if not result["articles"]:
+            continue
+        with span("dedup"):
+            # Articles the feed already has are skipped by the database
+            # in the same statement, instead of one lookup per article
+            new_article_ids.extend(
+                session.scalars(
+                    insert_ignore(
+                        session.get_bind(), Article, "url", "feed_id"
+                    ).returning(Article.id),
+                    [
+                        article
+                        | {
+                            "pub_date": _fromisoformat(article["pub_date"]),
+                            "updated": _fromisoformat(article["updated"]),
+                            "feed_id": feed.id,
+                        }
+                        for article in result["articles"]
+                    ],
+                ).all()
+            )
 
-        if new_articles:
-            new_article_ids = [article.id for article in new_articles]
-            enqueue_gpu_task(compute_embeddings_batch, new_article_ids)
+    increment_counters(
+        session,
+        {"articles.total": len(new_article_ids), "feeds.disabled": disabled_feeds},
+    )
+    logger.info(
+        f"Fetched {len(intent['results'])} feeds, added {len(new_article_ids)} "
+        "new articles" + (f", updated {updated_urls} URLs" if updated_urls else "")
+    )
 
-        logger.info(
-            f"Fetched {len(feeds)} feeds, added {len(new_articles)} new articles"
-            + (f", updated {updated_urls} URLs" if updated_urls else "")
-        )
+    def after_commit() -> None:
+        FEED_NEW_ARTICLES.inc(len(new_article_ids))
+        if new_article_ids:
+            with span("enqueue"):
+                enqueue_gpu_task(compute_embeddings_batch, new_article_ids)
+
+    return after_commit
 
 
+@traced
 def compute_embeddings_batch(article_ids: list[int]) -> None:
     with Session(ENGINE) as session:
-        articles = list(
-            session.exec(
-                select(Article).where(Article.id.in_(article_ids))  # type: ignore[union-attr]
-            ).all()
-        )
-        articles_to_embed = [
-            article for article in articles if article.embedding is None
-        ]
+        with span("load"):
+            articles_to_embed = list(
+                session.exec(
+                    select(Article)
+                    .where(Article.id.in_(article_ids))  # type: ignore[union-attr]
+                    .where(Article.embedding.is_(None))  # type: ignore[union-attr]
+                ).all()
+            )
 
         if not articles_to_embed:
             return
 
         try:
-            compute_embeddings(articles_to_embed)
-            session.commit()
+            EMBEDDING_BATCH_SIZE.observe(len(articles_to_embed))
+            with span("embed"), EMBEDDING_DURATION.time():
+                compute_embeddings(articles_to_embed)
+            with span("store"):
+                write(
+                    ENGINE,
+                    "embeddings",
+                    {
+                        "embeddings": {
+                            article.id: article.embedding
+                            for article in articles_to_embed
+                        }
+                    },
+                )
+            EMBEDDED_ARTICLES.inc(len(articles_to_embed))
             logger.info(f"Computed embeddings for {len(articles_to_embed)} articles")
         except Exception as e:
             logger.error(f"Error computing embeddings for articles: {e}")
@@ -519,6 +1182,7 @@ def retry_disabled_feeds() -> int:
             feed.consecutive_failures = 0
             # Keep last_error for debugging context
 
+        increment_counters(session, {"feeds.disabled": -len(disabled_feeds_with_users)})
         session.commit()
 
         # Queue them for fetching
@@ -534,32 +1198,60 @@ def retry_disabled_feeds() -> int:
 
 @with_db_retry(max_retries=5, base_delay=0.1, max_delay=2.0)
 def log_user_action(user_id: str, article_id: int, link_url: str) -> None:
-    with Session(ENGINE) as session:
-        user = session.exec(select(User).where(User.id == user_id)).first()
-        if user is None:
-            user = User(id=user_id)
-            session.add(user)
-        else:
-            user.last_request = datetime.now(timezone.utc)
-            if user.is_frozen:
-                user.is_frozen = False
-                user.frozen_at = None
-                logger.info(f"Auto-unfroze user {user_id} due to activity")
-
-        article = session.exec(select(Article).where(Article.id == article_id)).first()
-        if article is None:
-            logger.warning(f"Article {article_id} not found")
-            return
-        article.updated = datetime.now(timezone.utc)
-        session.add(article)
+    at = datetime.now(timezone.utc)
+    touched_user = activity.touch("user", user_id, at)
+    touched_article = activity.touch("article", article_id, at)
+    write(
+        ENGINE,
+        "click",
+        {
+            "user_id": user_id,
+            "article_id": article_id,
+            "at": at.isoformat(),
+            # Whether the timestamps are left to the activity flush
+            "touched": touched_user and touched_article,
+        },
+    )
 
-        if article not in user.articles:
-            user.articles.append(article)
-            session.add(user)
-            enqueue_medium_priority(recompute_user_clusters, user.id)
 
-        session.commit()
+@write_handler("click")
+def _store_click(session: Session, intent: dict) -> Callable[[], None] | None:
+    user_id, article_id = intent["user_id"], intent["article_id"]
+    at = datetime.fromisoformat(intent["at"])
+
+    article = session.get(Article, article_id)
+    if article is None:
+        logger.warning(f"Article {article_id} not found")
+        return None
+    touched = intent.get("touched", False)
+    if not touched:
+        article.updated = at
+
+    user = session.get(User, user_id)
+    if user is None:
+        user = User(id=user_id)
+        session.add(user)
+        increment_counters(session, {"users.total": 1})
+    else:
+        if not touched or user.is_frozen:
+            user.last_request = at
+        if user.is_frozen:
+            user.is_frozen = False
+            user.frozen_at = None
+            increment_counters(session, {"users.frozen": -1})
+            logger.info(f"Auto-unfroze user {user_id} due to activity")
+
     logger.info(f"Logged action for user {user_id}, article {article_id}")
+    already_read = session.exec(
+        select(UserArticleLink)
+        .where(UserArticleLink.user_id == user_id)
+        .where(UserArticleLink.article_id == article_id)
+    ).first()
+    if already_read is not None:
+        return None
+    session.add(UserArticleLink(user_id=user_id, article_id=article_id, created_at=at))
+    increment_counters(session, {"links.user_article": 1})
+    return lambda: schedule_clusters_recompute(user_id)
 
 
 def generate_filtered_feed(feed_id: int, user_id: str) -> str | None:
@@ -0,0 +1,108 @@
+"""Lightweight stage timing for requests and worker jobs.
+
+A trace is opened per request (by the middleware in `app.main`) or per job
+(with `traced`), and code in between marks its stages with `span`. When
+TRACING is not enabled, or outside of a trace, spans do nothing.
+
+    with span("articles"):
+        articles = session.exec(...).all()
+"""
+
+import os
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import wraps
+from typing import Callable, TypeVar
+
+from loguru import logger
+
+TRACING_ENABLED = bool(os.getenv("TRACING", False))
+
+T = TypeVar("T")
+
+
+@dataclass
+class Trace:
+    name: str
+    stages: dict[str, float] = field(default_factory=dict)
+    start: float = field(default_factory=time.perf_counter)
+
+    def record(self, stage: str, duration: float) -> None:
+        # Repeated stages (e.g. one per feed in a batch) are added up
+        self.stages[stage] = self.stages.get(stage, 0.0) + duration
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def breakdown(self) -> dict[str, float]:
+        """Stage durations in milliseconds."""
+        return {
+            stage: round(duration * 1000, 1) for stage, duration in self.stages.items()
+        }
+
+    def server_timing(self) -> str:
+        """Format the stages as a `Server-Timing` header value."""
+        return ", ".join(
+            f"{stage};dur={duration}" for stage, duration in self.breakdown().items()
+        )
+
+
+_current_trace: ContextVar[Trace | None] = ContextVar("current_trace", default=None)
+
+
+@contextmanager
+def trace(name: str, log: bool = True) -> Iterator[Trace | None]:
+    """Collect the spans recorded within the block into a new trace.
+
+    Args:
+        name: Name of the traced request or job.
+        log: Log the stage breakdown when the block exits.
+
+    Yields:
+        The trace, or None if tracing is disabled.
+    """
+    if not TRACING_ENABLED:
+        yield None
+        return
+
+    current = Trace(name)
+    token = _current_trace.set(current)
+    try:
+        yield current
+    finally:
+        _current_trace.reset(token)
+        if log:
+            logger.bind(trace=name, stages=current.breakdown()).info(
+                f"Trace {name} took {current.elapsed * 1000:.1f} ms: "
+                f"{current.server_timing()}"
+            )
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Time the block as stage `name` of the current trace, if any."""
+    current = _current_trace.get()
+    if current is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        current.record(name, time.perf_counter() - start)
+
+
+def traced(func: Callable[..., T]) -> Callable[..., T]:
+    """Run each call of `func` (usually an RQ job) in its own trace."""
+
+    @wraps(func)
+    def wrapper(*args, **kwargs) -> T:  # type: ignore[no-untyped-def]
+        with trace(func.__name__):
+            return func(*args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,122 @@
+"""Execution modes of the RQ workers (see `worker.py`), set with WORKER_MODE.
+
+- fork (default): a work-horse is forked per job, as in the stock RQ worker.
+  Each job imports what it needs and initialises its state again.
+- preload: the same, but the application and the libraries the queues' jobs
+  use are imported once in the parent, and shared copy-on-write by the
+  work-horses. Nothing that can't cross a fork is initialised: no database
+  connections and no CUDA model.
+- inline: the jobs run in the worker process itself, so their warm state (the
+  embedding model, the database pool) is kept from one job to the next. Job
+  timeouts still apply, and the worker stops after a job that leaves it with
+  more than WORKER_MAX_MEMORY_MB of RSS, to be restarted by its supervisor.
+  Only for queues of trusted jobs, as a crashing job takes the worker down.
+
+Each worker service runs its own queues, so the mode is chosen per queue.
+"""
+
+import importlib
+import os
+import resource
+
+from loguru import logger
+from redis import Redis  # type: ignore
+from rq import SimpleWorker, Worker
+from rq.job import Job
+from rq.queue import Queue
+
+from app.metrics import mark_process_dead
+
+WORKER_MODES = ("fork", "preload", "inline")
+WORKER_MODE = os.getenv("WORKER_MODE", "fork")
+WORKER_MAX_MEMORY_MB = int(os.getenv("WORKER_MAX_MEMORY_MB", "0"))
+
+# Modules imported before forking by the preload mode, per queue
+PRELOAD_MODULES: dict[str, tuple[str, ...]] = {
+    "high": (),
+    "medium": ("scipy.spatial.distance", "sklearn.cluster"),
+    "low": ("sklearn.cluster", "sklearn.decomposition", "plotly.express"),
+    "gpu": ("torch", "transformers"),
+}
+
+
+def rss_mb() -> float:
+    """Current resident memory of this process, in MB."""
+    try:
+        with open("/proc/self/statm") as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except OSError:
+        # Not Linux, fall back to the peak
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def preload(queue_names: list[str]) -> list[str]:
+    """Import the application and the libraries used by the queues' jobs.
+
+    Returns:
+        Names of the modules imported.
+    """
+    modules = ["app.tasks"] + [
+        module
+        for queue_name in queue_names
+        for module in PRELOAD_MODULES.get(queue_name, ())
+    ]
+    modules = list(dict.fromkeys(modules))
+    for module in modules:
+        importlib.import_module(module)
+    logger.info(f"Preloaded {', '.join(modules)}")
+    return modules
+
+
+class ForkWorker(Worker):
+    """Fork a work-horse per job, and fold its metrics into the worker's."""
+
+    def monitor_work_horse(self, job: Job, queue: Queue) -> None:
+        pid = self.horse_pid
+        try:
+            super().monitor_work_horse(job, queue)
+        finally:
+            mark_process_dead(pid)
+
+
+class MemoryGuardWorker(SimpleWorker):
+    """Run the jobs in the worker process, up to a memory limit."""
+
+    max_memory_mb = WORKER_MAX_MEMORY_MB
+
+    def execute_job(self, job: Job, queue: Queue) -> None:
+        super().execute_job(job, queue)
+        self.check_memory()
+
+    def check_memory(self) -> bool:
+        """Request the worker to stop if it uses too much memory.
+
+        Returns:
+            Whether the worker is within the limit.
+        """
+        if not self.max_memory_mb:
+            return True
+        rss = rss_mb()
+        if rss <= self.max_memory_mb:
+            return True
+        logger.warning(
+            f"Worker uses {rss:.0f} MB, over its {self.max_memory_mb} MB limit, "
+            "stopping after this job"
+        )
+        self._stop_requested = True
+        return False
+
+
+def create_worker(
+    queue_names: list[str], connection: Redis, mode: str = WORKER_MODE
+) -> Worker:
+    """Create a worker for `queue_names` running its jobs in `mode`."""
+    if mode not in WORKER_MODES:
+        raise ValueError(f"Unknown worker mode {mode!r}, use one of {WORKER_MODES}")
+    logger.info(f"Starting {mode} worker with queues: {queue_names}")
+    if mode == "inline":
+        return MemoryGuardWorker(queue_names, connection=connection)
+    if mode == "preload":
+        preload(queue_names)
+    return ForkWorker(queue_names, connection=connection)
@@ -0,0 +1,203 @@
+"""Single-writer commit pipeline.
+
+Jobs describe what they want to store as write intents: a kind, naming a
+handler registered with `write_handler`, and a JSON payload. By default
+`write` applies an intent right away in its own transaction.
+
+With WRITE_PIPELINE=1, `write` pushes the intent to a Redis list instead, and
+the writer process (`writer.py`) applies the queued intents in order, up to
+WRITE_BATCH_SIZE per transaction. Only the writer then takes SQLite's write
+lock, so the workers only read and never go through the locked-retry backoff.
+Intents are removed from the list once committed; an intent that fails on its
+own is moved to WRITE_FAILED_KEY.
+
+The list is trimmed after the commit, so a writer stopped in between gets the
+same intents again. Queued intents carry an id, recorded in `AppliedIntent`
+in the transaction that applies them, and the ids already recorded are skipped.
+The records are kept for WRITE_APPLIED_RETENTION seconds.
+"""
+
+import json
+import os
+import time
+import uuid
+from collections.abc import Callable
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+from loguru import logger
+from redis import Redis  # type: ignore
+from sqlalchemy import Engine
+from sqlmodel import Session, delete, select
+
+from .database import get_engine, is_sqlite, with_db_retry
+from .metrics import (
+    WRITE_BATCH_SIZE,
+    WRITE_COMMIT_DURATION,
+    WRITE_INTENTS,
+    WRITE_LOCK_WAIT,
+)
+from .models.intent import AppliedIntent
+
+WRITE_PIPELINE_ENABLED = bool(os.getenv("WRITE_PIPELINE", False))
+WRITE_BATCH_SIZE_MAX = int(os.getenv("WRITE_BATCH_SIZE", "200"))
+WRITE_POLL_INTERVAL = float(os.getenv("WRITE_POLL_INTERVAL", "0.05"))
+WRITE_APPLIED_RETENTION = int(os.getenv("WRITE_APPLIED_RETENTION", "86400"))
+WRITE_QUEUE_KEY = "writes"
+WRITE_FAILED_KEY = "writes:failed"
+
+# A handler applies a payload to the session without committing, and may
+# return a callback to run once the transaction is committed (e.g. enqueue a
+# job for the rows it created)
+WriteHandler = Callable[[Session, dict[str, Any]], Callable[[], None] | None]
+HANDLERS: dict[str, WriteHandler] = {}
+
+redis_conn = Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379"))
+
+
+def write_handler(kind: str) -> Callable[[WriteHandler], WriteHandler]:
+    """Register the decorated function as the handler of `kind` intents."""
+
+    def decorator(func: WriteHandler) -> WriteHandler:
+        HANDLERS[kind] = func
+        return func
+
+    return decorator
+
+
+def write(engine: Engine, kind: str, payload: dict[str, Any]) -> None:
+    """Store `payload` with the `kind` handler, through the writer if enabled.
+
+    Args:
+        engine: Database to apply the intent to when the pipeline is disabled.
+        kind: Name of the handler.
+        payload: JSON serialisable arguments of the handler.
+    """
+    if WRITE_PIPELINE_ENABLED:
+        intent = {"id": uuid.uuid4().hex, "kind": kind, **payload}
+        redis_conn.rpush(WRITE_QUEUE_KEY, json.dumps(intent))
+        WRITE_INTENTS.labels(kind=kind, outcome="queued").inc()
+    else:
+        apply_intents(engine, [{"kind": kind, **payload}])
+
+
+def _begin_write(session: Session) -> None:
+    """Take the write lock before the handlers read anything.
+
+    SQLite can't wait for the lock when a transaction that has already read
+    tries to write (it fails with "database is locked" right away), but it
+    does wait, up to busy_timeout, for BEGIN IMMEDIATE.
+    """
+    connection = session.connection()
+    if is_sqlite(connection):
+        start = time.perf_counter()
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+        WRITE_LOCK_WAIT.observe(time.perf_counter() - start)
+
+
+def _record_applied(session: Session, intents: list[dict[str, Any]]) -> list[dict]:
+    """Record the ids of `intents` as applied, as part of the caller's transaction.
+
+    Returns:
+        The intents to apply: those without an id or not applied before.
+    """
+    ids = [intent["id"] for intent in intents if "id" in intent]
+    if not ids:
+        return intents
+
+    applied = set(
+        session.exec(
+            select(AppliedIntent.id).where(AppliedIntent.id.in_(ids))  # type: ignore[attr-defined]
+        ).all()
+    )
+    session.exec(  # type: ignore[call-overload]
+        delete(AppliedIntent).where(
+            AppliedIntent.applied_at  # type: ignore[arg-type]
+            < datetime.now(timezone.utc) - timedelta(seconds=WRITE_APPLIED_RETENTION)
+        )
+    )
+    pending = [intent for intent in intents if intent.get("id") not in applied]
+    session.add_all(
+        [AppliedIntent(id=intent["id"]) for intent in pending if "id" in intent]
+    )
+    for intent in intents:
+        if intent.get("id") in applied:
+            WRITE_INTENTS.labels(kind=intent["kind"], outcome="duplicate").inc()
+    return pending
+
+
+def apply_intents(engine: Engine, intents: list[dict[str, Any]]) -> None:
+    """Apply `intents` in order in a single transaction.
+
+    Intents with an id are applied once: those whose id was recorded by an
+    earlier transaction are skipped.
+    """
+    start = time.perf_counter()
+    with Session(engine) as session:
+        _begin_write(session)
+        pending = _record_applied(session, intents)
+        callbacks = [HANDLERS[intent["kind"]](session, intent) for intent in pending]
+        session.commit()
+    WRITE_COMMIT_DURATION.observe(time.perf_counter() - start)
+    WRITE_BATCH_SIZE.observe(len(pending))
+    for intent in pending:
+        WRITE_INTENTS.labels(kind=intent["kind"], outcome="applied").inc()
+
+    # The intents are committed at this point, a failing callback must not
+    # get them applied again
+    for callback in callbacks:
+        if callback is not None:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Write intent callback failed: {e}")
+
+
+_apply_with_retry = with_db_retry(max_retries=5, base_delay=0.1, max_delay=2.0)(
+    apply_intents
+)
+
+
+def drain(engine: Engine, batch_size: int | None = None) -> int:
+    """Apply the next batch of queued intents.
+
+    Returns:
+        Number of intents taken from the queue.
+    """
+    batch_size = batch_size or WRITE_BATCH_SIZE_MAX
+    # Only the writer removes intents, so reading and trimming the head of the
+    # list separately is safe, and an intent stays queued until committed
+    raw = redis_conn.lrange(WRITE_QUEUE_KEY, 0, batch_size - 1)
+    if not raw:
+        return 0
+
+    intents = [json.loads(item) for item in raw]
+    try:
+        _apply_with_retry(engine, intents)
+    except Exception as e:
+        logger.warning(
+            f"Write batch of {len(intents)} intents failed ({e}), applying them "
+            "one by one"
+        )
+        for item, intent in zip(raw, intents):
+            try:
+                _apply_with_retry(engine, [intent])
+            except Exception as e:
+                logger.error(f"Dropping {intent['kind']} write intent: {e}")
+                WRITE_INTENTS.labels(kind=intent["kind"], outcome="failed").inc()
+                redis_conn.rpush(WRITE_FAILED_KEY, item)
+    redis_conn.ltrim(WRITE_QUEUE_KEY, len(raw), -1)
+    return len(raw)
+
+
+def run_writer() -> None:
+    """Apply queued write intents until interrupted. Run a single instance."""
+    import app.tasks  # noqa: F401 registers the handlers
+
+    engine = get_engine()
+    logger.info(
+        f"Starting writer, up to {WRITE_BATCH_SIZE_MAX} intents per transaction"
+    )
+    while True:
+        if drain(engine) == 0:
+            time.sleep(WRITE_POLL_INTERVAL)
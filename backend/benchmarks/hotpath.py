@@ -0,0 +1,278 @@
+"""Micro-benchmarks for the parse → store → rank → render hot path.
+
+Run from the backend directory:
+
+    python -m benchmarks.hotpath --output before.json
+    python -m benchmarks.hotpath --output after.json --compare before.json
+
+Feeds are served by a local HTTP stand-in (see `benchmarks.server`), so the
+numbers don't depend on the network.
+"""
+
+import asyncio
+import json
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any
+from unittest import mock
+
+import numpy as np
+import typer
+from loguru import logger
+from pydantic.networks import HttpUrl
+from sqlmodel import Session, SQLModel
+
+from app.models.article import Article
+from app.models.feed import Feed, generate_feed, parse_feed, render_feed
+from app.recommend import cluster_articles, filter_articles
+from app.database import create_db_engine
+from app.tasks import fetch_feed_batch
+
+from .server import FIXTURES_DIR, feed_server
+
+EMBEDDING_DIM = 1024  # multilingual-e5-large-instruct
+N_CLUSTERS = 10
+
+cli = typer.Typer(help="Benchmark the feed hot path")
+
+
+def measure(
+    func: Callable[[], Any],
+    repeat: int,
+    setup: Callable[[], Any] | None = None,
+) -> dict[str, float]:
+    """Time `repeat` calls of `func`, running `setup` untimed before each one.
+
+    Returns:
+        The min, median, mean and max durations in milliseconds.
+    """
+    durations = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        durations.append((time.perf_counter() - start) * 1000)
+    return {
+        "repeat": repeat,
+        "min_ms": round(min(durations), 3),
+        "median_ms": round(statistics.median(durations), 3),
+        "mean_ms": round(statistics.fmean(durations), 3),
+        "max_ms": round(max(durations), 3),
+    }
+
+
+def random_embedding(rng: np.random.Generator) -> str:
+    return json.dumps(rng.standard_normal(EMBEDDING_DIM).tolist())
+
+
+def synthetic_articles(n: int, seed: int = 0) -> list[Article]:
+    rng = np.random.default_rng(seed)
+    now = datetime.now(timezone.utc)
+    return [
+        Article(
+            id=i + 1,
+            title=f"Article {i}",
+            description=f'<p>Article {i} <a href="https://example.com/{i}/more">more</a></p>',
+            url=f"https://example.com/{i}",
+            comments_url=f"https://example.com/{i}/comments",
+            pub_date=now - timedelta(minutes=i),
+            embedding=random_embedding(rng),
+        )
+        for i in range(n)
+    ]
+
+
+def bench_parse_feed(base_url: str, repeat: int, sizes: list[int]) -> dict:
+    urls = {
+        f"parse_feed[{path.stem}]": f"{base_url}/fixtures/{path.name}"
+        for path in sorted(FIXTURES_DIR.glob("*.xml"))
+    }
+    urls |= {
+        f"parse_feed[synthetic-{n}]": f"{base_url}/synthetic/{n}.xml" for n in sizes
+    }
+    results = {}
+    for name, url in urls.items():
+        results[name] = measure(lambda: asyncio.run(parse_feed(HttpUrl(url))), repeat)
+    return results
+
+
+def bench_fetch_feed_batch(
+    base_url: str, repeat: int, n_feeds: int, n_items: int
+) -> dict:
+    """Time fetch_feed_batch on a fresh database (every article is new) and on
+    a second run over the same feeds (every article is a duplicate)."""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "bench.sqlite"
+        engine = create_db_engine(f"sqlite:///{db_path}")
+
+        def reset_db() -> None:
+            SQLModel.metadata.drop_all(engine)
+            SQLModel.metadata.create_all(engine)
+            with Session(engine) as session:
+                session.add_all(
+                    [
+                        Feed(
+                            id=i + 1,
+                            url=f"{base_url}/synthetic/{n_items}/{i}.xml",
+                            title=f"Synthetic feed {i}",
+                        )
+                        for i in range(n_feeds)
+                    ]
+                )
+                session.commit()
+
+        feed_ids = list(range(1, n_feeds + 1))
+        with (
+            mock.patch("app.tasks.ENGINE", engine),
+            mock.patch("app.tasks.enqueue_gpu_task"),
+        ):
+            label = f"{n_feeds}x{n_items}"
+            results[f"fetch_feed_batch[new-{label}]"] = measure(
+                lambda: fetch_feed_batch(feed_ids), repeat, setup=reset_db
+            )
+            results[f"fetch_feed_batch[dedup-{label}]"] = measure(
+                lambda: fetch_feed_batch(feed_ids), repeat
+            )
+        engine.dispose()
+    return results
+
+
+def bench_filter_articles(repeat: int, sizes: list[int]) -> dict:
+    rng = np.random.default_rng(0)
+    cluster_centers = rng.standard_normal((N_CLUSTERS, EMBEDDING_DIM))
+    results = {}
+    for n in sizes:
+        articles = synthetic_articles(n)
+        # filter_articles shuffles and trims its input in place
+        results[f"filter_articles[{n}]"] = measure(
+            lambda: filter_articles(list(articles), cluster_centers), repeat
+        )
+    return results
+
+
+def bench_cluster_articles(repeat: int, sizes: list[int]) -> dict:
+    results = {}
+    for n in sizes:
+        articles = synthetic_articles(n)
+        results[f"cluster_articles[{n}]"] = measure(
+            lambda: cluster_articles(articles, n_clusters=N_CLUSTERS), repeat
+        )
+    return results
+
+
+def bench_generate_feed(repeat: int, sizes: list[int]) -> dict:
+    feed = Feed(
+        url="https://example.com/rss.xml",
+        title="Benchmark feed",
+        description="Benchmark feed",
+        language="en",
+    )
+    results = {}
+    for n in sizes:
+        articles = synthetic_articles(n)
+        for render in (generate_feed, render_feed):
+            results[f"{render.__name__}[{n}]"] = measure(
+                lambda: render(feed, articles, "benchmark"), repeat
+            )
+    return results
+
+
+def run_benchmarks(
+    repeat: int = 5,
+    feed_sizes: tuple[int, ...] = (100, 1000),
+    batch_feeds: int = 10,
+    batch_items: int = 100,
+    candidate_counts: tuple[int, ...] = (30, 300, 3000),
+    history_sizes: tuple[int, ...] = (50, 500, 5000),
+    render_sizes: tuple[int, ...] = (30, 300),
+) -> dict[str, dict[str, float]]:
+    random.seed(0)
+    results: dict[str, dict[str, float]] = {}
+    with feed_server() as base_url:
+        results |= bench_parse_feed(base_url, repeat, list(feed_sizes))
+        results |= bench_fetch_feed_batch(base_url, repeat, batch_feeds, batch_items)
+    results |= bench_filter_articles(repeat, list(candidate_counts))
+    results |= bench_cluster_articles(repeat, list(history_sizes))
+    results |= bench_generate_feed(repeat, list(render_sizes))
+    return results
+
+
+def compare(results: dict, baseline: dict) -> list[tuple[str, float, float, float]]:
+    """Pair each benchmark's median with the baseline's.
+
+    Returns:
+        (name, baseline median, median, ratio) for the benchmarks in both runs.
+    """
+    rows = []
+    for name, stats in results.items():
+        if name in baseline:
+            before = baseline[name]["median_ms"]
+            after = stats["median_ms"]
+            rows.append((name, before, after, after / before if before else 0.0))
+    return rows
+
+
+@cli.command()
+def main(
+    output: Path = typer.Option(Path("benchmark.json"), help="Where to save results"),
+    compare_to: Path | None = typer.Option(
+        None, "--compare", help="Results of a previous run to compare against"
+    ),
+    repeat: int = typer.Option(5, help="Runs per benchmark"),
+    quick: bool = typer.Option(False, help="Small sizes only, for a smoke run"),
+    log_level: str = typer.Option(
+        "WARNING", help="Log level while benchmarking (DEBUG adds per-article logs)"
+    ),
+) -> None:
+    """Run the benchmarks and save the results as JSON."""
+    logger.remove()
+    logger.add(sys.stderr, level=log_level)
+    sizes: dict[str, Any] = (
+        dict(
+            feed_sizes=(100,),
+            batch_feeds=2,
+            batch_items=20,
+            candidate_counts=(30,),
+            history_sizes=(50,),
+            render_sizes=(30,),
+        )
+        if quick
+        else {}
+    )
+    results = run_benchmarks(repeat=repeat, **sizes)
+    output.write_text(
+        json.dumps(
+            {
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "results": results,
+            },
+            indent=2,
+        )
+    )
+
+    for name, stats in results.items():
+        typer.echo(f"{name:<45} {stats['median_ms']:>10.2f} ms")
+    typer.echo(f"Saved results to {output}")
+
+    if compare_to is not None:
+        baseline = json.loads(compare_to.read_text())["results"]
+        typer.echo(f"\nCompared to {compare_to} (median):")
+        for name, before, after, ratio in compare(results, baseline):
+            typer.echo(
+                f"{name:<45} {before:>10.2f} -> {after:>10.2f} ms ({ratio:.2f}x)"
+            )
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,132 @@
+"""Import time and memory of each process type.
+
+Run from the backend directory:
+
+    python -m benchmarks.imports --output before.json
+    python -m benchmarks.imports --output after.json --compare before.json
+
+Every run imports a process type's entry module in a fresh interpreter, and
+reports how long the import took, the peak RSS after it and which of the heavy
+libraries (only needed to compute embeddings, clusters and plots) it loaded.
+"""
+
+import json
+import platform
+import statistics
+import subprocess
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+import typer
+
+BACKEND = Path(__file__).parent.parent
+
+# Entry module of each process type
+PROCESSES = {
+    "api": "app.main",
+    # The jobs of every queue are imported from app.tasks
+    "worker": "app.tasks",
+    "scheduler": "scheduler",
+    "writer": "app.writer",
+}
+HEAVY_MODULES = ("torch", "transformers", "sklearn", "scipy", "plotly", "pandas")
+
+_PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import {module}
+duration = time.perf_counter() - start
+print(json.dumps({{
+    "import_ms": duration * 1000,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "heavy_modules": [name for name in {heavy!r} if name in sys.modules],
+}}))
+"""
+
+cli = typer.Typer(help="Benchmark the import of each process type")
+
+
+def probe(module: str) -> dict:
+    """Import `module` in a new interpreter and return what it cost."""
+    result = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(module=module, heavy=HEAVY_MODULES)],
+        cwd=BACKEND,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def run_benchmarks(
+    repeat: int = 5, processes: tuple[str, ...] = tuple(PROCESSES)
+) -> dict[str, dict]:
+    results = {}
+    for name in processes:
+        runs = [probe(PROCESSES[name]) for _ in range(repeat)]
+        durations = [run["import_ms"] for run in runs]
+        results[f"import[{name}]"] = {
+            "repeat": repeat,
+            "min_ms": round(min(durations), 3),
+            "median_ms": round(statistics.median(durations), 3),
+            "max_ms": round(max(durations), 3),
+            "max_rss_mb": round(max(run["max_rss_mb"] for run in runs), 1),
+            "heavy_modules": runs[0]["heavy_modules"],
+        }
+    return results
+
+
+def compare(results: dict, baseline: dict) -> list[tuple[str, str, float, float]]:
+    """Pair each process type's median import time and RSS with the baseline's.
+
+    Returns:
+        (name, metric, baseline value, value) for the process types in both runs.
+    """
+    return [
+        (name, metric, baseline[name][metric], stats[metric])
+        for name, stats in results.items()
+        if name in baseline
+        for metric in ("median_ms", "max_rss_mb")
+    ]
+
+
+@cli.command()
+def main(
+    output: Path = typer.Option(Path("imports.json"), help="Where to save results"),
+    compare_to: Path | None = typer.Option(
+        None, "--compare", help="Results of a previous run to compare against"
+    ),
+    repeat: int = typer.Option(5, help="Imports per process type"),
+) -> None:
+    """Run the benchmarks and save the results as JSON."""
+    results = run_benchmarks(repeat=repeat)
+    output.write_text(
+        json.dumps(
+            {
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "results": results,
+            },
+            indent=2,
+        )
+    )
+
+    for name, stats in results.items():
+        heavy = ", ".join(stats["heavy_modules"]) or "-"
+        typer.echo(
+            f"{name:<20} {stats['median_ms']:>10.2f} ms {stats['max_rss_mb']:>8.1f} MB"
+            f"   heavy: {heavy}"
+        )
+    typer.echo(f"Saved results to {output}")
+
+    if compare_to is not None:
+        baseline = json.loads(compare_to.read_text())["results"]
+        typer.echo(f"\nCompared to {compare_to}:")
+        for name, metric, before, after in compare(results, baseline):
+            typer.echo(f"{name:<20} {metric:<12} {before:>10.2f} -> {after:>10.2f}")
+
+
+if __name__ == "__main__":
+    cli()
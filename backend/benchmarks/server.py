@@ -0,0 +1,108 @@
+"""Local HTTP stand-in for upstream feeds.
+
+Serves the RSS fixtures in `tests/data` at `/fixtures/<file name>` and
+synthetic feeds with `n` items at `/synthetic/<n>.xml` (or
+`/synthetic/<n>/<seed>.xml` for distinct feeds of the same size).
+"""
+
+import random
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+from xml.sax.saxutils import escape
+
+FIXTURES_DIR = Path(__file__).resolve().parent.parent / "tests" / "data"
+
+WORDS = (
+    "python rust linux kernel database sqlite postgres release security "
+    "startup funding climate energy solar battery space rocket launch "
+    "football election economy inflation market science biology physics "
+    "music film review game console privacy browser open source"
+).split()
+
+
+@lru_cache(maxsize=64)
+def synthetic_feed(n_items: int, seed: int = 0) -> bytes:
+    """Generate an RSS 2.0 feed with `n_items` items."""
+    rng = random.Random(seed)
+    now = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    items = []
+    for i in range(n_items):
+        title = " ".join(rng.choices(WORDS, k=8)).capitalize()
+        description = (
+            f"<p>{' '.join(rng.choices(WORDS, k=60))}</p>"
+            f'<p><a href="https://example.com/{seed}/{i}/more">Read more</a></p>'
+        )
+        items.append(
+            "<item>"
+            f"<title>{escape(title)}</title>"
+            f"<link>https://example.com/{seed}/{i}</link>"
+            f"<description>{escape(description)}</description>"
+            f"<comments>https://example.com/{seed}/{i}/comments</comments>"
+            f"<pubDate>{format_datetime(now - timedelta(minutes=i))}</pubDate>"
+            "</item>"
+        )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<rss version="2.0"><channel>'
+        f"<title>Synthetic feed {seed} ({n_items} items)</title>"
+        f"<link>https://example.com/{seed}</link>"
+        "<description>Synthetic feed for benchmarks</description>"
+        f"{''.join(items)}"
+        "</channel></rss>"
+    ).encode()
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        body = self._body()
+        if body is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/rss+xml; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self) -> bytes | None:
+        parts = self.path.strip("/").removesuffix(".xml").split("/")
+        if parts[0] == "fixtures" and len(parts) == 2:
+            path = FIXTURES_DIR / f"{parts[1]}.xml"
+            return path.read_bytes() if path.is_file() else None
+        if parts[0] == "synthetic" and len(parts) in (2, 3):
+            try:
+                return synthetic_feed(*(int(part) for part in parts[1:]))
+            except ValueError:
+                return None
+        return None
+
+    def log_message(self, format, *args) -> None:  # type: ignore[no-untyped-def]
+        pass
+
+
+@contextmanager
+def feed_server() -> Iterator[str]:
+    """Serve the feeds from a background thread.
+
+    The SSRF checks are disabled while the server runs, since it listens on
+    the loopback interface.
+
+    Yields:
+        The base URL of the server.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FeedHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        with mock.patch("app.models.feed.is_safe_ip", return_value=True):
+            yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
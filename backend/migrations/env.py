@@ -1,13 +1,16 @@
 from os import getenv
 from logging.config import fileConfig
 
-from sqlmodel import SQLModel, create_engine
+from sqlmodel import SQLModel
 
 from alembic import context
 
+from app.database import create_db_engine
 from app.models.article import Article  # noqa: F401
 from app.models.feed import Feed  # noqa: F401
 from app.models.user import User  # noqa: F401
+from app.models.counter import Counter  # noqa: F401
+from app.models.intent import AppliedIntent  # noqa: F401
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -61,9 +64,7 @@ def run_migrations_online() -> None:
     and associate a connection with the context.
 
     """
-    connectable = create_engine(
-        getenv("DATABASE_URL")  # type: ignore
-    )
+    connectable = create_db_engine(getenv("DATABASE_URL"))
 
     with connectable.connect() as connection:
         context.configure(connection=connection, target_metadata=target_metadata)
@@ -0,0 +1,141 @@
+"""add feed canonical key and merge duplicate feeds
+
+Revision ID: e5f6g7h8i9j0
+Revises: d4e5f6g7h8i9
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+
+from collections import defaultdict
+from typing import Sequence, Union
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+revision: str = "e5f6g7h8i9j0"
+down_revision: Union[str, None] = "d4e5f6g7h8i9"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def _canonical_feed_key(url: str) -> str:
+    """app.models.feed.canonical_feed_key as of this revision."""
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").removeprefix("www.")
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port is not None and port != DEFAULT_PORTS.get(parts.scheme.lower()):
+        host = f"{host}:{port}"
+    key = host + parts.path.rstrip("/")
+    if query := urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True))):
+        key += f"?{query}"
+    return key
+
+
+def _merge(connection: sa.Connection, duplicate: int, keeper: int) -> None:
+    """Move the subscriptions and articles of feed `duplicate` to `keeper`."""
+    params = {"duplicate": duplicate, "keeper": keeper}
+    connection.execute(
+        sa.text(
+            "DELETE FROM userfeedlink WHERE feed_id = :duplicate AND user_id IN "
+            "(SELECT user_id FROM userfeedlink WHERE feed_id = :keeper)"
+        ),
+        params,
+    )
+    connection.execute(
+        sa.text("UPDATE userfeedlink SET feed_id = :keeper WHERE feed_id = :duplicate"),
+        params,
+    )
+
+    # Articles both feeds have: keep the keeper's, with the clicks of both
+    same_article = (
+        "SELECT kept.id FROM article AS kept, article AS dup "
+        "WHERE kept.feed_id = :keeper AND dup.feed_id = :duplicate "
+        "AND kept.url = dup.url AND dup.id = userarticlelink.article_id"
+    )
+    connection.execute(
+        sa.text(
+            "DELETE FROM userarticlelink WHERE EXISTS (" + same_article + ") AND "
+            "EXISTS (SELECT 1 FROM userarticlelink AS other "
+            "WHERE other.user_id = userarticlelink.user_id "
+            "AND other.article_id = (" + same_article + "))"
+        ),
+        params,
+    )
+    connection.execute(
+        sa.text(
+            "UPDATE userarticlelink SET article_id = (" + same_article + ") "
+            "WHERE EXISTS (" + same_article + ")"
+        ),
+        params,
+    )
+    connection.execute(
+        sa.text(
+            "DELETE FROM article WHERE feed_id = :duplicate AND url IN "
+            "(SELECT url FROM article WHERE feed_id = :keeper)"
+        ),
+        params,
+    )
+    connection.execute(
+        sa.text("UPDATE article SET feed_id = :keeper WHERE feed_id = :duplicate"),
+        params,
+    )
+    # Users subscribed through the URL the duplicate was redirected from
+    connection.execute(
+        sa.text(
+            "UPDATE feed SET original_url = "
+            "(SELECT original_url FROM feed WHERE id = :duplicate) "
+            "WHERE id = :keeper AND original_url IS NULL"
+        ),
+        params,
+    )
+    connection.execute(sa.text("DELETE FROM feed WHERE id = :duplicate"), params)
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("feed", schema=None) as batch_op:
+        batch_op.add_column(
+            sa.Column(
+                "canonical_key",
+                sqlmodel.sql.sqltypes.AutoString(),  # type: ignore[attr-defined]
+                nullable=True,
+            )
+        )
+
+    connection = op.get_bind()
+    feeds = connection.execute(
+        sa.text("SELECT id, url, is_disabled FROM feed ORDER BY is_disabled, id")
+    ).all()
+    groups: defaultdict[str, list[int]] = defaultdict(list)
+    for feed_id, url, _ in feeds:
+        groups[_canonical_feed_key(url)].append(feed_id)
+
+    # The first enabled feed of each group keeps the subscribers of the others
+    for key, (keeper, *duplicates) in groups.items():
+        for duplicate in duplicates:
+            _merge(connection, duplicate, keeper)
+        connection.execute(
+            sa.text("UPDATE feed SET canonical_key = :key WHERE id = :id"),
+            {"key": key, "id": keeper},
+        )
+
+    with op.batch_alter_table("feed", schema=None) as batch_op:
+        batch_op.create_index(
+            batch_op.f("ix_feed_canonical_key"), ["canonical_key"], unique=True
+        )
+
+    # Merged feeds and articles change the stats, recount them on the next read
+    op.execute("DELETE FROM counter")
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("feed", schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f("ix_feed_canonical_key"))
+        batch_op.drop_column("canonical_key")
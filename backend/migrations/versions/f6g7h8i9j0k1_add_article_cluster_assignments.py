@@ -0,0 +1,42 @@
+"""add article cluster assignments
+
+Revision ID: f6g7h8i9j0k1
+Revises: e5f6g7h8i9j0
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "f6g7h8i9j0k1"
+down_revision: Union[str, None] = "e5f6g7h8i9j0"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Filled in by the next recomputation of each user's clusters
+    op.add_column(
+        "userarticlelink",
+        sa.Column("cluster", sa.Integer(), nullable=True),
+    )
+    op.add_column(
+        "userarticlelink",
+        sa.Column("cluster_distance", sa.Float(), nullable=True),
+    )
+    op.create_index(
+        "ix_userarticlelink_user_id_cluster",
+        "userarticlelink",
+        ["user_id", "cluster", "cluster_distance"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_userarticlelink_user_id_cluster", table_name="userarticlelink")
+    op.drop_column("userarticlelink", "cluster_distance")
+    op.drop_column("userarticlelink", "cluster")
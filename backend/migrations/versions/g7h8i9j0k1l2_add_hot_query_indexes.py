@@ -0,0 +1,66 @@
+"""add composite and partial indexes for the hot queries
+
+Revision ID: g7h8i9j0k1l2
+Revises: f6g7h8i9j0k1
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "g7h8i9j0k1l2"
+down_revision: Union[str, None] = "f6g7h8i9j0k1"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _where(condition: sa.ColumnElement) -> dict:
+    return {"sqlite_where": condition, "postgresql_where": condition}
+
+
+def upgrade() -> None:
+    # The latest articles of a feed, without sorting them
+    op.create_index(
+        "ix_article_feed_id_pub_date", "article", ["feed_id", "pub_date"], unique=False
+    )
+    op.drop_index("ix_article_feed_id", table_name="article")
+    # Expiring the embeddings, and counting them
+    op.create_index(
+        "ix_article_updated_embedded",
+        "article",
+        ["updated"],
+        unique=False,
+        **_where(sa.column("embedding").is_not(None)),
+    )
+    # The active (or dormant) users that are not frozen
+    op.create_index(
+        "ix_user_is_frozen_last_request",
+        "user",
+        ["is_frozen", "last_request"],
+        unique=False,
+    )
+    op.drop_index("ix_user_is_frozen", table_name="user")
+    # Only the few disabled feeds, so that the enabled ones are reached from
+    # their active users instead
+    op.create_index(
+        "ix_feed_disabled",
+        "feed",
+        ["id"],
+        unique=False,
+        **_where(sa.column("is_disabled").is_(True)),
+    )
+    op.drop_index("ix_feed_is_disabled", table_name="feed")
+
+
+def downgrade() -> None:
+    op.create_index("ix_feed_is_disabled", "feed", ["is_disabled"], unique=False)
+    op.drop_index("ix_feed_disabled", table_name="feed")
+    op.create_index("ix_user_is_frozen", "user", ["is_frozen"], unique=False)
+    op.drop_index("ix_user_is_frozen_last_request", table_name="user")
+    op.drop_index("ix_article_updated_embedded", table_name="article")
+    op.create_index("ix_article_feed_id", "article", ["feed_id"], unique=False)
+    op.drop_index("ix_article_feed_id_pub_date", table_name="article")
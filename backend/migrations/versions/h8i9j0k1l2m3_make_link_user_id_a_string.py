@@ -0,0 +1,47 @@
+"""make the user_id of the link tables a string
+
+Revision ID: h8i9j0k1l2m3
+Revises: g7h8i9j0k1l2
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+revision: str = "h8i9j0k1l2m3"
+down_revision: Union[str, None] = "g7h8i9j0k1l2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+LINK_TABLES = ("userfeedlink", "userarticlelink")
+
+
+def upgrade() -> None:
+    # user.id is a string: SQLite accepted the integer column referencing it,
+    # PostgreSQL refuses a foreign key between integer and varchar columns
+    for table in LINK_TABLES:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column(
+                "user_id",
+                existing_type=sa.Integer(),
+                type_=sqlmodel.sql.sqltypes.AutoString(),  # type: ignore[attr-defined]
+                existing_nullable=False,
+                postgresql_using="user_id::varchar",
+            )
+
+
+def downgrade() -> None:
+    for table in LINK_TABLES:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column(
+                "user_id",
+                existing_type=sqlmodel.sql.sqltypes.AutoString(),  # type: ignore[attr-defined]
+                type_=sa.Integer(),
+                existing_nullable=False,
+                postgresql_using="user_id::integer",
+            )
@@ -0,0 +1,39 @@
+"""add applied_intent table to apply queued write intents once
+
+Revision ID: i9j0k1l2m3n4
+Revises: h8i9j0k1l2m3
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+revision: str = "i9j0k1l2m3n4"
+down_revision: Union[str, None] = "h8i9j0k1l2m3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "appliedintent",
+        sa.Column("id", sqlmodel.sql.sqltypes.AutoString(), nullable=False),  # type: ignore[attr-defined]
+        sa.Column("applied_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        op.f("ix_appliedintent_applied_at"),
+        "appliedintent",
+        ["applied_at"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_appliedintent_applied_at"), table_name="appliedintent")
+    op.drop_table("appliedintent")
@@ -8,6 +8,11 @@ Scheduled tasks:
 - fetch_all_feeds: Every hour - fetches all active feeds
 - run_full_maintenance: Daily at 4am UTC - cleanup and optimization
 - retry_disabled_feeds: Weekly on Sunday at 3am UTC - retry failed feeds
+- reconcile_database_stats: Daily at 5am UTC - correct stats counter drift
+- flush_activity: Every minute, with ACTIVITY_WRITE_BEHIND - write the
+  buffered user and article activity timestamps
+- recompute_dirty_clusters: Every minute, with CLUSTER_BATCHING - recompute
+  the clusters of the users who read articles, in batches
 """
 
 import os
@@ -20,10 +25,16 @@ from loguru import logger
 from redis import Redis  # type: ignore[attr-defined]
 from rq import Queue
 
+from app.activity import ACTIVITY_WRITE_BEHIND
 from app.tasks import (
+    CLUSTER_BATCHING,
+    SCHEDULED_JOB_TIMEOUT,
     fetch_all_feeds,
+    flush_activity,
+    recompute_dirty_clusters,
     run_full_maintenance,
     retry_disabled_feeds,
+    reconcile_database_stats,
 )
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
@@ -68,7 +79,31 @@ def run_scheduler() -> None:
             cron="0 3 * * 0",  # Weekly on Sunday at 3am UTC
             description="Retry disabled feeds",
         ),
+        ScheduledTask(
+            func=reconcile_database_stats,
+            job_id="scheduled:reconcile_database_stats",
+            cron="0 5 * * *",  # Daily at 5am UTC, after maintenance
+            description="Reconcile database stats counters",
+        ),
     ]
+    if ACTIVITY_WRITE_BEHIND:
+        tasks.append(
+            ScheduledTask(
+                func=flush_activity,
+                job_id="scheduled:flush_activity",
+                cron="* * * * *",  # Every minute
+                description="Flush buffered activity timestamps",
+            )
+        )
+    if CLUSTER_BATCHING:
+        tasks.append(
+            ScheduledTask(
+                func=recompute_dirty_clusters,
+                job_id="scheduled:recompute_dirty_clusters",
+                cron="* * * * *",  # Every minute
+                description="Recompute the clusters of the active users",
+            )
+        )
 
     # Track next run times
     next_runs: dict[str, datetime] = {}
@@ -90,7 +125,7 @@ def run_scheduler() -> None:
                     scheduler_queue.enqueue(  # type: ignore[arg-type]
                         task["func"],
                         job_id=f"{job_id}:{now.strftime('%Y%m%d%H%M')}",
-                        job_timeout=600,  # 10 minute timeout for scheduled jobs
+                        job_timeout=SCHEDULED_JOB_TIMEOUT,
                     )
                 except Exception as e:
                     logger.error(f"Failed to enqueue {job_id}: {e}")
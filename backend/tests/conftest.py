@@ -55,16 +55,23 @@ from fastapi.testclient import TestClient  # noqa: E402
 from sqlmodel import SQLModel, Session, create_engine  # noqa: E402
 from sqlmodel.pool import StaticPool  # noqa: E402
 
+from app.database import (  # noqa: E402
+    create_db_engine,
+    create_read_engine,
+    sync_sequences,
+)
 from app.main import app, ROOT_PATH  # noqa: E402
 from app.models.article import Article  # noqa: E402
 from app.models.feed import Feed  # noqa: E402
 from app.models.user import User  # noqa: E402
-from app.routers.common import get_engine  # noqa: E402
+from app.routers.common import get_engine, get_read_engine  # noqa: E402
 
 if not os.path.exists("data"):
     os.makedirs("data")
 
 TEST_USER_ID: str = "test"
+# Runs the database tests against another backend, e.g. a PostgreSQL container
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
 
 
 @pytest.fixture
@@ -94,11 +101,20 @@ def setup_db(engine):
         session.add(user)
         session.add(feed)
         session.add(article)
+        sync_sequences(session.connection(), "feed", "article")
         session.commit()
 
 
 @pytest.fixture(scope="function")
 def engine():
+    if TEST_DATABASE_URL:
+        engine = create_db_engine(TEST_DATABASE_URL)
+        SQLModel.metadata.drop_all(engine)
+        setup_db(engine)
+        yield engine
+        engine.dispose()
+        return
+
     engine = create_engine(
         "sqlite://",
         connect_args={"check_same_thread": False},
@@ -108,9 +124,35 @@ def engine():
     yield engine
 
 
+@pytest.fixture
+def database_url(tmp_path):
+    """A file database, so that concurrent connections don't share one."""
+    url = f"sqlite:///{tmp_path}/test.db"
+    engine = create_db_engine(url)
+    setup_db(engine)
+    engine.dispose()
+    return url
+
+
+@pytest.fixture
+def file_engine(database_url):
+    """Serve the app from the file database, reads through the read-only pool."""
+    engine = create_db_engine(database_url)
+    read_engine = create_read_engine(database_url)
+    app.dependency_overrides[get_engine] = lambda: engine
+    app.dependency_overrides[get_read_engine] = lambda: read_engine
+    yield engine
+    app.dependency_overrides.pop(get_engine)
+    app.dependency_overrides.pop(get_read_engine)
+    read_engine.dispose()
+    engine.dispose()
+
+
 @pytest.fixture
 def client(engine):
     app.dependency_overrides[get_engine] = lambda: engine
+    # An in-memory database can't be opened again read-only
+    app.dependency_overrides[get_read_engine] = lambda: engine
     return TestClient(app)
 
 
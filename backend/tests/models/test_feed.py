@@ -1,10 +1,35 @@
 import pytest
 
 import re
+from datetime import datetime
+from unittest import mock
 
+import lxml.etree
+from sqlmodel import Session
+
+from app.clicks import quote_target
 from app.constants import API_BASE_URL, ROOT_PATH
 from app.models.article import Article
-from app.models.feed import Feed, generate_feed, parse_feed_articles, discover_feed_url
+from app.models.feed import (
+    Feed,
+    _item_segments,
+    canonical_feed_key,
+    discover_feed_url,
+    generate_feed,
+    parse_feed_articles,
+    render_feed,
+)
+
+
+def _canonical_feed(document: bytes) -> list:
+    """Parse a feed into comparable (tag, attributes, text) tuples, ignoring
+    the formatting whitespace and the build date."""
+    root = lxml.etree.fromstring(document)
+    return [
+        (element.tag, dict(element.attrib), (element.text or "").strip())
+        for element in root.iter()
+        if element.tag != "lastBuildDate"
+    ]
 
 
 class TestFeed:
@@ -76,6 +101,147 @@ class TestFeed:
         assert not links_without_log_url_prefix, links_without_log_url_prefix
 
 
+class TestRenderFeed:
+    @pytest.mark.parametrize(
+        "feed_string_path",
+        [
+            "news.ycombinator.com.rss.xml",
+            "theverge.com.rss.index.xml",
+        ],
+    )
+    def test_matches_generate_feed(self, feed_string_path):
+        with open(f"tests/data/{feed_string_path}", "r") as f:
+            articles = list(parse_feed_articles(f.read()))
+        for i, article in enumerate(articles):
+            article.id = i
+        feed = Feed(
+            url="https://example.com/rss.xml?a=1&b=2",
+            title="Test & <Feed>",
+            logo="https://example.com/logo.png",
+            language="en",
+        )
+
+        rendered = render_feed(feed, articles, "user")
+        generated = generate_feed(feed, articles, "user").encode()
+
+        assert rendered.startswith(b"<?xml version='1.0' encoding='UTF-8'?>")
+        assert _canonical_feed(rendered) == _canonical_feed(generated)
+
+    def test_matches_generate_feed_optional_fields(self):
+        feed = Feed(url="http://example.com/rss.xml", title="Feed", description="D")
+        articles = [
+            Article(
+                id=1,
+                title="Quotes \" and ' and \r returns",
+                url="http://example.com/a?x=1&y=<2>",
+                description='<p><a href="http://example.com/?q=a&b">a</a> &amp;</p>',
+                comments_url="http://example.com/comments?id=1",
+                pub_date=datetime(2024, 1, 2, 3, 4, 5),
+            ),
+            Article(
+                id=2, title="No extras", url="http://example.com/b", description=""
+            ),
+        ]
+
+        rendered = render_feed(feed, articles, "user")
+        generated = generate_feed(feed, articles, "user").encode()
+
+        assert _canonical_feed(rendered) == _canonical_feed(generated)
+
+    def test_matches_generate_feed_signed_clicks(self):
+        feed = Feed(url="http://example.com/rss.xml", title="Feed")
+        articles = [
+            Article(
+                id=1,
+                title="Signed",
+                url="http://example.com/signed?a=1",
+                description='<a href="http://example.com/more#x">more</a>',
+                comments_url="http://example.com/comments",
+            )
+        ]
+
+        with mock.patch("app.clicks.CLICK_SIGNING_KEY", "secret"):
+            first = render_feed(feed, articles, "first")
+            second = render_feed(feed, articles, "second")
+            generated = generate_feed(feed, articles, "second").encode()
+
+        assert _canonical_feed(second) == _canonical_feed(generated)
+        assert b"/log/first/1/" in first
+        # the signatures depend on the user
+        assert first.replace(b"/log/first/", b"/log/second/") != second
+
+    def test_targets_quoted_once_per_article(self):
+        feed = Feed(url="http://example.com/rss.xml", title="Feed")
+        articles = [
+            Article(
+                id=1,
+                title="Quoted",
+                url="http://example.com/quoted?a=1&b=2",
+                description='<a href="http://example.com/more#x">more</a>',
+                comments_url="http://example.com/comments",
+            )
+        ]
+        _item_segments.cache_clear()
+
+        with (
+            mock.patch("app.clicks.CLICK_SIGNING_KEY", "secret"),
+            mock.patch(
+                "app.models.feed.quote_target", wraps=quote_target
+            ) as quote_target_mock,
+        ):
+            render_feed(feed, articles, "first")
+            second = render_feed(feed, articles, "second")
+            generated = generate_feed(feed, articles, "second").encode()
+
+        # Only the signatures are computed for the second user
+        assert quote_target_mock.call_count == 3
+        assert _canonical_feed(second) == _canonical_feed(generated)
+        # Without a key, the targets are quoted for unsigned URLs again
+        assert _canonical_feed(render_feed(feed, articles, "second")) == (
+            _canonical_feed(generate_feed(feed, articles, "second").encode())
+        )
+
+    def test_drops_invalid_xml_characters(self):
+        feed = Feed(url="http://example.com/rss.xml", title="Feed")
+        articles = [
+            Article(
+                id=1,
+                title="Bell\x07 and nul\x00",
+                url="http://example.com/a",
+                description="Form feed\x0c",
+            )
+        ]
+
+        root = lxml.etree.fromstring(render_feed(feed, articles, "user"))
+
+        assert root.findtext("channel/item/title") == "Bell and nul"
+        assert root.findtext("channel/item/description") == "Form feed"
+
+    def test_item_cache(self):
+        feed = Feed(url="http://example.com/rss.xml", title="Feed")
+        article = Article(
+            id=1234,
+            title="Cached",
+            url="http://example.com/cached",
+            description='<a href="http://example.com/more">more</a>',
+        )
+        _item_segments.cache_clear()
+
+        first = render_feed(feed, [article], "first&user")
+        second = render_feed(feed, [article], "second")
+
+        assert _item_segments.cache_info().hits == 1
+        assert b"/log/first&amp;user/1234/" in first
+        assert b"/log/second/1234/" in second
+        assert b"first" not in second
+        assert _canonical_feed(second) == _canonical_feed(
+            generate_feed(feed, [article], "second").encode()
+        )
+
+        article.title = "Changed"
+        assert b"<title>Changed</title>" in render_feed(feed, [article], "second")
+
+
 class TestDiscoverFeedUrl:
     def test_discover_rss_feed(self):
         html = """
@@ -153,3 +319,42 @@ class TestDiscoverFeedUrl:
         html = "not valid html at all <><><"
         result = discover_feed_url(html, "https://example.com/")
         assert result is None
+
+
+class TestCanonicalFeedKey:
+    @pytest.mark.parametrize(
+        "url",
+        [
+            "https://news.ycombinator.com/rss",
+            "http://news.ycombinator.com/rss",
+            "https://www.news.ycombinator.com/rss/",
+            "https://News.YCombinator.com:443/rss#top",
+        ],
+    )
+    def test_variants(self, url):
+        assert canonical_feed_key(url) == "news.ycombinator.com/rss"
+
+    def test_query_order(self):
+        assert canonical_feed_key("https://example.com/rss?b=2&a=1") == (
+            "example.com/rss?a=1&b=2"
+        )
+
+    @pytest.mark.parametrize(
+        "url",
+        [
+            "https://example.com:8443/rss",
+            "https://example.com/feed",
+            "https://example.com/rss?a=2",
+            "https://blog.example.com/rss",
+        ],
+    )
+    def test_different_feeds(self, url):
+        assert canonical_feed_key(url) != canonical_feed_key("https://example.com/rss")
+
+    def test_kept_up_to_date(self, engine):
+        with Session(engine) as session:
+            feed = session.get(Feed, 1)
+            assert feed.canonical_key == "news.ycombinator.com/rss"
+            feed.url = "https://hnrss.org/frontpage"
+            session.commit()
+            assert feed.canonical_key == "hnrss.org/frontpage"
@@ -0,0 +1,128 @@
+import json
+from unittest import mock
+
+import numpy as np
+import pytest
+from sqlmodel import Session, select
+
+from app.main import app
+from app.models.article import Article
+from app.models.relations import UserArticleLink
+from app.models.user import User
+from app.tasks import recompute_user_clusters
+
+
+@pytest.fixture
+def read_articles(engine, test_user_id):
+    embeddings = np.random.RandomState(42).randn(12, 4)
+    with Session(engine) as session:
+        user = session.get(User, test_user_id)
+        # Read before the others, without embedding
+        user.articles.append(session.get(Article, 1))
+        for i, embedding in enumerate(embeddings):
+            user.articles.append(
+                Article(
+                    title=f"Article {i}",
+                    description="",
+                    url=f"https://example.com/{i}",
+                    feed_id=1,
+                    embedding=json.dumps(embedding.tolist()),
+                )
+            )
+        session.commit()
+
+
+@pytest.fixture
+def recomputed(engine, read_articles, test_user_id):
+    with (
+        mock.patch("app.tasks.ENGINE", engine),
+        mock.patch("app.tasks.redis_conn"),
+    ):
+        recompute_user_clusters(test_user_id)
+
+
+def _url(user_id: str) -> str:
+    return app.url_path_for("get_user_clusters", user_id=user_id)
+
+
+class TestAssignments:
+    def test_stored_at_recompute(self, engine, recomputed, test_user_id):
+        with Session(engine) as session:
+            user = session.get(User, test_user_id)
+            centers = np.array(json.loads(user.clusters))
+            links = {
+                link.article_id: link
+                for link in session.exec(select(UserArticleLink)).all()
+            }
+            for article in user.articles:
+                link = links[article.id]
+                if article.embedding is None:
+                    assert link.cluster is None
+                    assert link.cluster_distance is None
+                    continue
+                distance = np.linalg.norm(
+                    np.array(json.loads(article.embedding)) - centers[link.cluster]
+                )
+                assert link.cluster_distance == pytest.approx(distance)
+                # Its own cluster is the closest one
+                assert link.cluster == np.argmin(
+                    np.linalg.norm(
+                        np.array(json.loads(article.embedding)) - centers, axis=1
+                    )
+                )
+
+
+class TestGetUserClusters:
+    def test_paginated(self, client, recomputed, test_user_id):
+        articles = []
+        for offset in range(0, 12, 5):
+            response = client.get(
+                _url(test_user_id), params={"offset": offset, "limit": 5}
+            )
+            assert response.status_code == 200
+            body = response.json()
+            assert body["total"] == 12
+            articles += [
+                (int(cluster), article["title"])
+                for cluster, page in body["clustered_articles"].items()
+                for article in page
+            ]
+
+        assert len(articles) == 12
+        assert [cluster for cluster, _ in articles] == sorted(
+            cluster for cluster, _ in articles
+        )
+        assert "Test article" not in {title for _, title in articles}
+
+    def test_clustered_before_assignments(
+        self, client, engine, read_articles, test_user_id
+    ):
+        centers = np.random.RandomState(0).randn(3, 4)
+        with Session(engine) as session:
+            user = session.get(User, test_user_id)
+            user.clusters = json.dumps(centers.tolist())
+            session.commit()
+
+        with mock.patch("app.routers.user.schedule_clusters_recompute") as schedule:
+            response = client.get(_url(test_user_id), params={"limit": 5})
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["total"] == 12
+        assert (
+            sum(len(articles) for articles in data["clustered_articles"].values()) == 5
+        )
+        # Stored by the recomputation
+        schedule.assert_called_once_with(test_user_id)
+
+    def test_not_recomputed_yet(self, client, read_articles, test_user_id):
+        assert client.get(_url(test_user_id)).status_code == 503
+
+    def test_limit_is_bounded(self, client, recomputed, test_user_id):
+        assert (
+            client.get(_url(test_user_id), params={"limit": 10_000}).status_code == 422
+        )
+
+    def test_unknown_user(self, client):
+        response = client.get(app.url_path_for("get_user_clusters", user_id="unknown"))
+        assert response.status_code == 404
@@ -0,0 +1,167 @@
+import json
+from datetime import datetime, timezone
+from unittest import mock
+
+import pytest
+from sqlmodel import Session
+
+from app.main import app
+from app.models.article import Article
+from app.models.user import User
+from app.tasks import render_user_clusters_2d
+from app.writer import apply_intents
+
+PNG = b"\x89PNG rendered"
+
+
+class KeyRedis:
+    """The Redis string commands used by the clusters cache."""
+
+    def __init__(self) -> None:
+        self.data: dict[str, bytes] = {}
+
+    def get(self, key: str) -> bytes | None:
+        return self.data.get(key)
+
+    def set(self, key: str, value, nx: bool = False, ex: int | None = None):  # type: ignore[no-untyped-def]
+        if nx and key in self.data:
+            return None
+        self.data[key] = value if isinstance(value, bytes) else str(value).encode()
+        return True
+
+    def exists(self, key: str) -> int:
+        return int(key in self.data)
+
+    def delete(self, key: str) -> None:
+        self.data.pop(key, None)
+
+
+@pytest.fixture
+def redis_data(engine):
+    redis = KeyRedis()
+    with (
+        mock.patch("app.tasks.redis_conn", redis),
+        mock.patch("app.routers.user.redis_conn", redis),
+        mock.patch("app.tasks.ENGINE", engine),
+        mock.patch("app.tasks.render_clusters_2d_png", return_value=PNG),
+    ):
+        yield redis.data
+
+
+@pytest.fixture
+def enqueue():
+    with mock.patch("app.routers.user.enqueue_medium_priority") as enqueue:
+        yield enqueue
+
+
+@pytest.fixture
+def clusters(engine, test_user_id):
+    with Session(engine) as session:
+        user = session.get(User, test_user_id)
+        for i, embedding in enumerate([[1, 0, 0], [0.9, 0.1, 0], [0, 0, 1]]):
+            user.articles.append(
+                Article(
+                    title=f"Article {i}",
+                    description="",
+                    url=f"https://example.com/{i}",
+                    feed_id=1,
+                    embedding=json.dumps(embedding),
+                )
+            )
+        user.clusters = json.dumps([[1, 0, 0], [0, 0, 1]])
+        user.clusters_updated_at = datetime.now(timezone.utc)
+        session.commit()
+
+
+def _url(name: str, user_id: str) -> str:
+    return app.url_path_for(name, user_id=user_id)
+
+
+class TestClusters2D:
+    def test_rendered_in_background(
+        self, client, redis_data, enqueue, clusters, test_user_id
+    ):
+        response = client.get(_url("get_user_clusters_2d", test_user_id))
+        assert response.status_code == 202
+        # Enqueued once until rendered
+        assert client.get(_url("get_user_clusters_2d", test_user_id)).status_code == 202
+        enqueue.assert_called_once_with(render_user_clusters_2d, test_user_id)
+
+        assert render_user_clusters_2d(test_user_id)
+
+        response = client.get(_url("get_user_clusters_2d", test_user_id))
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "image/png"
+        assert response.content == PNG
+
+    def test_points(self, client, redis_data, enqueue, clusters, test_user_id):
+        assert (
+            client.get(_url("get_user_clusters_2d_points", test_user_id)).status_code
+            == 202
+        )
+        render_user_clusters_2d(test_user_id)
+
+        response = client.get(_url("get_user_clusters_2d_points", test_user_id))
+
+        assert response.status_code == 200
+        points = response.json()["points"]
+        # The article without embedding isn't plotted
+        assert [point["title"] for point in points] == [
+            "Article 0",
+            "Article 1",
+            "Article 2",
+        ]
+        assert [point["cluster"] for point in points] == [0, 0, 1]
+
+    def test_new_clusters_are_rendered_again(
+        self, client, engine, redis_data, enqueue, clusters, test_user_id
+    ):
+        client.get(_url("get_user_clusters_2d", test_user_id))
+        render_user_clusters_2d(test_user_id)
+
+        with mock.patch("app.tasks.enqueue_low_priority") as enqueue_render:
+            apply_intents(
+                engine,
+                [
+                    {
+                        "kind": "clusters",
+                        "user_id": test_user_id,
+                        "clusters": json.dumps([[0, 0, 1], [1, 0, 0]]),
+                        "at": datetime.now(timezone.utc).isoformat(),
+                    }
+                ],
+            )
+
+        # The user looked at the previous clusters, so the new ones are rendered
+        enqueue_render.assert_called_once_with(render_user_clusters_2d, test_user_id)
+        assert client.get(_url("get_user_clusters_2d", test_user_id)).status_code == 202
+
+    def test_no_embedded_articles(
+        self, client, engine, redis_data, enqueue, clusters, test_user_id
+    ):
+        # The embeddings of the read articles expired
+        with Session(engine) as session:
+            for article in session.get(User, test_user_id).articles:
+                article.embedding = None
+            session.commit()
+        assert client.get(_url("get_user_clusters_2d", test_user_id)).status_code == 202
+
+        assert not render_user_clusters_2d(test_user_id)
+
+        # Not enqueued again on every poll
+        assert client.get(_url("get_user_clusters_2d", test_user_id)).status_code == 503
+        assert (
+            client.get(_url("get_user_clusters_2d_points", test_user_id)).status_code
+            == 503
+        )
+        enqueue.assert_called_once()
+
+    def test_no_clusters(self, client, redis_data, enqueue, test_user_id):
+        assert client.get(_url("get_user_clusters_2d", test_user_id)).status_code == 503
+        enqueue.assert_not_called()
+
+    def test_unknown_user(self, client, redis_data):
+        response = client.get(
+            app.url_path_for("get_user_clusters_2d", user_id="unknown")
+        )
+        assert response.status_code == 404
@@ -0,0 +1,65 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+import httpx
+import numpy as np
+import pytest
+from sqlmodel import Session
+
+from app.main import app
+from app.models.feed import Feed
+from app.routers import feed as feed_router
+
+FEED_URL = quote("https://news.ycombinator.com/rss")
+SLOW_QUERY_SECONDS = 1.0
+
+
+@pytest.fixture
+def file_engine(file_engine):
+    # A fresh feed, served without fetching it
+    with Session(file_engine) as session:
+        feed = session.get(Feed, 1)
+        feed.updated_at = datetime.now(timezone.utc)
+        session.commit()
+    return file_engine
+
+
+class TestFeedConcurrency:
+    def test_slow_request_does_not_block_others(self, file_engine, monkeypatch):
+        get_user = feed_router._get_user
+
+        def slow_get_user(session, user_id):
+            if user_id == "slow":
+                # e.g. waiting for the SQLite write lock
+                time.sleep(SLOW_QUERY_SECONDS)
+            return get_user(session, user_id)
+
+        monkeypatch.setattr(feed_router, "_get_user", slow_get_user)
+
+        async def timed_get(client, user_id, delay=0.0):
+            # Latency is measured from when the request was due, so time spent
+            # waiting for a blocked event loop to start it is counted as well
+            due = time.perf_counter() + delay
+            await asyncio.sleep(delay)
+            response = await client.get(f"/v1/feed/{user_id}/{FEED_URL}")
+            assert response.status_code == 200
+            return time.perf_counter() - due
+
+        async def run():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(
+                transport=transport, base_url="http://test"
+            ) as client:
+                slow = asyncio.create_task(timed_get(client, "slow"))
+                # Fast requests keep arriving while the slow one is running
+                fast = await asyncio.gather(
+                    *(timed_get(client, "test", delay=0.05 * i) for i in range(1, 20))
+                )
+                return await slow, fast
+
+        slow, fast = asyncio.run(run())
+
+        assert slow >= SLOW_QUERY_SECONDS
+        assert np.percentile(fast, 99) < SLOW_QUERY_SECONDS / 2
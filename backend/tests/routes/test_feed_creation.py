@@ -0,0 +1,162 @@
+import asyncio
+import time
+from unittest import mock
+from urllib.parse import quote
+
+import httpx
+import pytest
+from sqlmodel import Session, select
+
+from app.main import app
+from app.models.article import Article
+from app.models.feed import Feed, UpstreamError
+from app.routers import feed as feed_router
+
+FEED_URL = "https://example.com/rss"
+
+
+def _feed(url: str = FEED_URL) -> Feed:
+    return Feed(
+        url=url,
+        title="Example",
+        articles=[
+            Article(title="New", description="New", url="https://example.com/new")
+        ],
+    )
+
+
+@pytest.fixture
+def redis_conn():
+    with mock.patch.object(
+        feed_router, "redis_conn", new=mock.AsyncMock()
+    ) as redis_conn:
+        redis_conn.set.return_value = True
+        yield redis_conn
+
+
+@pytest.fixture
+def upstream():
+    calls = []
+
+    async def parse_feed(feed_url):
+        calls.append(feed_url)
+        await asyncio.sleep(0.2)
+        return _feed()
+
+    with mock.patch.object(feed_router, "parse_feed", parse_feed):
+        yield calls
+
+
+async def _get_concurrently(user_ids, feed_url: str = FEED_URL):  # type: ignore[no-untyped-def]
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await asyncio.gather(
+            *(
+                client.get(f"/v1/feed/{user_id}/{quote(feed_url, safe='')}")
+                for user_id in user_ids
+            )
+        )
+
+
+class TestCreateFeed:
+    def test_concurrent_requests_share_one_fetch(
+        self, file_engine, redis_conn, upstream
+    ):
+        # Different variants of the URL are the same feed
+        responses = asyncio.run(_get_concurrently(["a", "b", "c"])) + asyncio.run(
+            _get_concurrently(["d"], "http://www.example.com/rss/")
+        )
+
+        assert [response.status_code for response in responses] == [200] * 4
+        assert len(upstream) == 1
+        redis_conn.set.assert_called_once()
+        # Released only if it still holds this request's token
+        (lock, token), _ = redis_conn.set.call_args
+        redis_conn.eval.assert_called_once_with(
+            feed_router.FEED_CREATE_UNLOCK_SCRIPT, 1, lock, token
+        )
+        with Session(file_engine) as session:
+            feeds = session.exec(select(Feed).where(Feed.id != 1)).all()
+            assert len(feeds) == 1
+            assert len(feeds[0].users) == 4
+
+    def test_upstream_error_for_every_request(self, file_engine, redis_conn):
+        async def parse_feed(feed_url):
+            await asyncio.sleep(0.1)
+            raise UpstreamError("Feed not found")
+
+        with mock.patch.object(feed_router, "parse_feed", parse_feed):
+            responses = asyncio.run(_get_concurrently(["a", "b"]))
+
+        assert [response.status_code for response in responses] == [502, 502]
+        # The next request tries again
+        assert feed_router._creating == {}
+
+    def test_waits_for_other_process(self, file_engine, redis_conn, upstream):
+        redis_conn.set.return_value = None
+
+        async def store_elsewhere():
+            await asyncio.sleep(0.3)
+            with Session(file_engine) as session:
+                session.add(_feed())
+                session.commit()
+
+        async def run():
+            responses, _ = await asyncio.gather(
+                _get_concurrently(["a"]), store_elsewhere()
+            )
+            return responses
+
+        with mock.patch.object(feed_router, "FEED_CREATE_POLL_INTERVAL", 0.05):
+            (response,) = asyncio.run(run())
+
+        assert response.status_code == 200
+        assert upstream == []
+        redis_conn.eval.assert_not_called()
+
+    def test_takes_over_a_released_lock(self, file_engine, redis_conn, upstream):
+        # The other process fails to fetch the feed and releases the lock
+        redis_conn.set.side_effect = [None, None, True]
+
+        with mock.patch.object(feed_router, "FEED_CREATE_POLL_INTERVAL", 0.05):
+            start = time.monotonic()
+            (response,) = asyncio.run(_get_concurrently(["a"]))
+
+        assert response.status_code == 200
+        # Without waiting for the lock to expire
+        assert time.monotonic() - start < feed_router.FEED_CREATE_LOCK_SECONDS / 2
+        assert len(upstream) == 1
+        assert redis_conn.set.call_count == 3
+        (lock, token), _ = redis_conn.set.call_args
+        redis_conn.eval.assert_called_once_with(
+            feed_router.FEED_CREATE_UNLOCK_SCRIPT, 1, lock, token
+        )
+
+    def test_redirected_feed_fetched_once(self, file_engine, redis_conn):
+        calls = []
+
+        async def parse_feed(feed_url):
+            calls.append(feed_url)
+            return _feed("https://feeds.example.org/main.xml")
+
+        with (
+            mock.patch.object(feed_router, "parse_feed", parse_feed),
+            mock.patch.dict(feed_router._feed_ids, clear=True),
+        ):
+            (first,) = asyncio.run(_get_concurrently(["a"]))
+            # From the id cache, then from the URL the feed was requested with
+            (cached,) = asyncio.run(_get_concurrently(["b"]))
+            feed_router._feed_ids.clear()
+            (stored,) = asyncio.run(_get_concurrently(["c"]))
+
+        assert [first.status_code, cached.status_code, stored.status_code] == [
+            200,
+            200,
+            200,
+        ]
+        assert len(calls) == 1
+        with Session(file_engine) as session:
+            feed = session.exec(select(Feed).where(Feed.id != 1)).one()
+            assert feed.url == "https://feeds.example.org/main.xml"
+            assert feed.original_url == FEED_URL
+            assert len(feed.users) == 3
@@ -0,0 +1,73 @@
+from unittest import mock
+from urllib.parse import quote
+
+import pytest
+from sqlalchemy.exc import NoResultFound
+from sqlmodel import Session, select
+
+from app.models.feed import Feed
+from app.routers import feed as feed_router
+
+VARIANT_URL = "http://www.news.ycombinator.com/rss/"
+
+
+@pytest.fixture(autouse=True)
+def feed_ids():
+    with mock.patch.object(feed_router, "_feed_ids", feed_router.OrderedDict()):
+        yield feed_router._feed_ids
+
+
+class TestFindFeed:
+    def test_finds_url_variant(self, engine, feed_ids):
+        with Session(engine) as session:
+            assert feed_router._find_feed(session, VARIANT_URL).id == 1
+        assert feed_ids == {VARIANT_URL: 1}
+
+    def test_finds_original_url(self, engine):
+        with Session(engine) as session:
+            feed = session.get(Feed, 1)
+            feed.original_url = feed.url
+            feed.url = "https://hnrss.org/frontpage"
+            session.commit()
+
+            found = feed_router._find_feed(session, "https://news.ycombinator.com/rss")
+            assert found.id == 1
+
+    def test_cached_id_skips_query(self, engine, feed_ids):
+        feed_ids[VARIANT_URL] = 1
+        with Session(engine) as session:
+            with mock.patch.object(session, "exec") as exec_:
+                assert feed_router._find_feed(session, VARIANT_URL).id == 1
+            exec_.assert_not_called()
+
+    def test_stale_cached_id(self, engine, feed_ids):
+        feed_ids[VARIANT_URL] = 1
+        with Session(engine) as session:
+            session.add(Feed(url="https://other.example/rss", title="Other"))
+            session.commit()
+            feed_ids["https://other.example/rss"] = 1
+
+            feed = feed_router._find_feed(session, "https://other.example/rss")
+
+        assert feed.id != 1
+        assert feed_ids["https://other.example/rss"] == feed.id
+
+    def test_unknown_feed(self, engine, feed_ids):
+        with Session(engine) as session:
+            with pytest.raises(NoResultFound):
+                feed_router._find_feed(session, "https://other.example/rss")
+        assert feed_ids == {}
+
+
+class TestGetFeed:
+    def test_url_variant_reuses_feed(self, client, engine):
+        with (
+            mock.patch.object(feed_router, "parse_feed") as parse_feed,
+            client,
+        ):
+            response = client.get(f"/v1/feed/test/{quote(VARIANT_URL, safe='')}")
+
+        assert response.status_code == 200
+        parse_feed.assert_not_called()
+        with Session(engine) as session:
+            assert len(session.exec(select(Feed)).all()) == 1
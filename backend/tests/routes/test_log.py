@@ -0,0 +1,115 @@
+from unittest import mock
+
+import pytest
+
+from app.clicks import click_url, split_signature
+
+
+def _path(url: str) -> str:
+    return url[url.index("/v1/log/") :]
+
+
+@pytest.fixture
+def signing_key():
+    with mock.patch("app.clicks.CLICK_SIGNING_KEY", "secret"):
+        yield
+
+
+@pytest.fixture
+def enqueue():
+    with mock.patch("app.routers.log.enqueue_medium_priority") as enqueue:
+        yield enqueue
+
+
+@pytest.fixture
+def redis_conn():
+    with mock.patch("app.routers.log.redis_conn", new=mock.AsyncMock()) as redis_conn:
+        redis_conn.set.return_value = True
+        yield redis_conn
+
+
+class TestLog:
+    def test_signed_click(self, client, signing_key, enqueue, redis_conn):
+        target = "https://example.com/signed?id=1&b=2#top"
+        url = click_url("test", 1, target)
+
+        with client:
+            response = client.get(_path(url), follow_redirects=False)
+
+        assert response.status_code == 307
+        assert response.headers["location"] == target
+        enqueue.assert_called_once()
+        assert enqueue.call_args.args[1:] == ("test", 1, target)
+        redis_conn.set.assert_called_once()
+
+    def test_duplicate_click(self, client, signing_key, enqueue, redis_conn):
+        redis_conn.set.return_value = None
+        url = click_url("test", 1, "https://example.com/duplicate")
+
+        with client:
+            response = client.get(_path(url), follow_redirects=False)
+
+        assert response.status_code == 307
+        enqueue.assert_not_called()
+
+    @pytest.mark.parametrize(
+        "path",
+        [
+            # forged signature
+            "/v1/log/test/1/AAAAAAAAAAAA/https://example.com/forged",
+            # unsigned
+            "/v1/log/test/1/https%3A%2F%2Fexample.com%2Funsigned",
+        ],
+    )
+    def test_invalid_click(self, client, signing_key, enqueue, redis_conn, path):
+        with client:
+            response = client.get(path, follow_redirects=False)
+
+        assert response.status_code == 307
+        assert response.headers["location"].startswith("https://example.com/")
+        enqueue.assert_not_called()
+        redis_conn.set.assert_not_called()
+
+    def test_signature_covers_user_and_article(
+        self, client, signing_key, enqueue, redis_conn
+    ):
+        url = click_url("test", 1, "https://example.com/other-user")
+
+        with client:
+            response = client.get(
+                _path(url).replace("/test/1/", "/other/1/"), follow_redirects=False
+            )
+
+        assert response.status_code == 307
+        enqueue.assert_not_called()
+
+    def test_signing_disabled(self, client, enqueue, redis_conn):
+        url = click_url("test", 1, "https://example.com/disabled")
+
+        with client:
+            response = client.get(_path(url), follow_redirects=False)
+
+        assert response.status_code == 307
+        assert response.headers["location"] == "https://example.com/disabled"
+        enqueue.assert_called_once()
+        redis_conn.set.assert_not_called()
+
+
+class TestClickUrl:
+    def test_signed_url_is_shorter(self, signing_key):
+        target = "https://www.theverge.com/news/2025/1/2/some-article-slug"
+        signed = click_url("user", 1, target)
+
+        with mock.patch("app.clicks.CLICK_SIGNING_KEY", None):
+            unsigned = click_url("user", 1, target)
+
+        assert len(signed) < len(unsigned)
+        signature, url = split_signature(_path(signed).split("/", 5)[5])
+        assert signature is not None
+        assert url == target
+
+    def test_split_unsigned(self):
+        assert split_signature("https://example.com/a") == (
+            None,
+            "https://example.com/a",
+        )
@@ -1,6 +1,59 @@
+from datetime import datetime, timezone
+from unittest import mock
+
+import pytest
+from sqlmodel import Session, select
+
 from app.main import app
+from app.models.feed import Feed
+from app.models.relations import UserFeedLink
 import uuid
 
+OPML = """<?xml version="1.0" encoding="UTF-8"?>
+<opml version="1.0">
+    <body>
+        <outline text="Hacker News" type="rss" xmlUrl="http://www.news.ycombinator.com/rss/"/>
+        <outline text="Example" title="Example feed" type="rss" xmlUrl="https://example.com/rss"/>
+        <outline text="Example again" type="rss" xmlUrl="https://example.com/rss#top"/>
+        <outline text="Not a feed" xmlUrl="https://example.com/other"/>
+    </body>
+</opml>
+"""
+
+
+class KeyRedis:
+    """The Redis string commands used by the import progress."""
+
+    def __init__(self) -> None:
+        self.data: dict[str, bytes] = {}
+
+    def get(self, key: str) -> bytes | None:
+        return self.data.get(key)
+
+    def set(self, key: str, value: int, ex: int | None = None) -> None:
+        self.data[key] = str(value).encode()
+
+
+@pytest.fixture(autouse=True)
+def redis_data():
+    redis = KeyRedis()
+    with mock.patch("app.routers.signup.redis_conn", redis):
+        yield redis.data
+
+
+@pytest.fixture
+def enqueue():
+    with mock.patch("app.routers.signup.enqueue_medium_priority") as enqueue:
+        yield enqueue
+
+
+def _import(client, opml: str = OPML, **data):  # type: ignore[no-untyped-def]
+    return client.post(
+        app.url_path_for("process_opml"),
+        files={"opml": ("test.opml", opml.encode())},
+        data=data,
+    )
+
 
 class TestSignupUser:
     def test_register_user(self, client):
@@ -16,7 +69,7 @@ class TestSignupUser:
 
 
 class TestSignupProcessOPML:
-    def test_process_opml_valid(self, client):
+    def test_process_opml_valid(self, client, enqueue):
         response = client.post(
             app.url_path_for("process_opml"),
             files={"opml": ("test.opml", open("tests/data/test.opml", "rb"))},
@@ -27,3 +80,94 @@ class TestSignupProcessOPML:
         assert "xmlUrl" in response.text
         assert "rssfilter" in response.text
         assert "ycombinator" in response.text
+
+    def test_subscribes_to_feeds(self, client, engine, enqueue):
+        response = _import(client, user_id="importer")
+
+        assert response.status_code == 200
+        assert response.text.count("/v1/feed/importer/") == 3
+        with Session(engine) as session:
+            feeds = session.exec(select(Feed).order_by(Feed.id)).all()
+            # The known feed is reused, the variants of a new one created once
+            assert [feed.canonical_key for feed in feeds] == [
+                "news.ycombinator.com/rss",
+                "example.com/rss",
+            ]
+            assert feeds[1].title == "Example feed"
+            links = session.exec(
+                select(UserFeedLink).where(UserFeedLink.user_id == "importer")
+            ).all()
+            assert sorted(link.feed_id for link in links) == [1, feeds[1].id]
+            new_feed_id = feeds[1].id
+        # Only the feed that was never fetched is fetched
+        enqueue.assert_called_once()
+        assert enqueue.call_args.args[1] == [new_feed_id]
+
+    def test_import_twice(self, client, engine, enqueue):
+        _import(client, user_id="importer")
+        _import(client, user_id="importer")
+
+        with Session(engine) as session:
+            assert len(session.exec(select(Feed)).all()) == 2
+            links = session.exec(
+                select(UserFeedLink).where(UserFeedLink.user_id == "importer")
+            ).all()
+            assert len(links) == 2
+
+    def test_progress(self, client, engine, enqueue):
+        _import(client, user_id="importer")
+        url = app.url_path_for("import_progress", user_id="importer")
+
+        assert client.get(url).json() == {
+            "total": 2,
+            "ready": 1,
+            "pending": 1,
+            "failed": 0,
+            "skipped": 0,
+        }
+
+        with Session(engine) as session:
+            feed = session.exec(
+                select(Feed).where(Feed.canonical_key == "example.com/rss")
+            ).one()
+            feed.updated_at = datetime.now(timezone.utc)
+            feed.last_error = "HTTP 404"
+            session.commit()
+        assert client.get(url).json() == {
+            "total": 2,
+            "ready": 1,
+            "pending": 0,
+            "failed": 1,
+            "skipped": 0,
+        }
+
+    def test_invalid_urls_skipped(self, client, engine, enqueue):
+        opml = OPML.replace(
+            "</body>",
+            '<outline text="Local" type="rss" xmlUrl="file:///etc/passwd"/>'
+            '<outline text="Script" type="rss" xmlUrl="javascript:alert(1)"/>'
+            '<outline text="Junk" type="rss" xmlUrl="not a url"/>'
+            "</body>",
+        )
+        _import(client, opml, user_id="importer")
+
+        with Session(engine) as session:
+            assert len(session.exec(select(Feed)).all()) == 2
+        url = app.url_path_for("import_progress", user_id="importer")
+        progress = client.get(url).json()
+        assert progress["total"] == 2
+        assert progress["skipped"] == 3
+
+    def test_feeds_per_import_capped(self, client, engine, enqueue):
+        outlines = "".join(
+            f'<outline text="{i}" type="rss" xmlUrl="https://example.com/{i}.xml"/>'
+            for i in range(5)
+        )
+        opml = f"<opml><body>{outlines}</body></opml>"
+        with mock.patch("app.routers.signup.OPML_IMPORT_MAX_FEEDS", 3):
+            _import(client, opml, user_id="importer")
+
+        url = app.url_path_for("import_progress", user_id="importer")
+        progress = client.get(url).json()
+        assert progress["total"] == 3
+        assert progress["skipped"] == 2
@@ -0,0 +1,13 @@
+from app.main import app
+
+
+class TestStats:
+    def test_get_stats(self, client):
+        response = client.get(app.url_path_for("get_stats"))
+
+        assert response.status_code == 200
+        stats = response.json()
+        assert stats["users"]["total"] == 1
+        assert stats["feeds"]["total"] == 1
+        assert stats["articles"]["total"] == 1
+        assert stats["links"]["user_feed"] == 1
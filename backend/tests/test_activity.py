@@ -0,0 +1,182 @@
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+import pytest
+from prometheus_client import REGISTRY
+from sqlmodel import Session, select
+
+from app import activity
+from app.models.article import Article
+from app.models.relations import UserArticleLink
+from app.models.user import User
+from app.routers import feed as feed_router
+from app.tasks import freeze_dormant_users, log_user_action
+
+
+class HashRedis:
+    """The Redis hash and key commands used by the activity buffer."""
+
+    def __init__(self) -> None:
+        self.data: dict[str, dict[bytes, bytes] | bytes] = {}
+
+    def hset(self, key: str, field: str, value: str) -> None:
+        self.data.setdefault(key, {})[field.encode()] = value.encode()  # type: ignore[index]
+
+    def hincrby(self, key: str, field: str, amount: int) -> None:
+        fields: dict = self.data.setdefault(key, {})  # type: ignore[assignment]
+        fields[field.encode()] = str(
+            int(fields.get(field.encode(), 0)) + amount
+        ).encode()
+
+    def hgetall(self, key: str) -> dict[bytes, bytes]:
+        return dict(self.data.get(key, {}))  # type: ignore[arg-type]
+
+    def exists(self, key: str) -> int:
+        return int(key in self.data)
+
+    def rename(self, key: str, new_key: str) -> None:
+        self.data[new_key] = self.data.pop(key)
+
+    def set(self, key: str, value: int, nx: bool = False, ex: int | None = None):  # type: ignore[no-untyped-def]
+        if nx and key in self.data:
+            return None
+        self.data[key] = str(value).encode()
+        return True
+
+    def delete(self, *keys: str) -> None:
+        for key in keys:
+            self.data.pop(key, None)
+
+
+@pytest.fixture
+def buffer(engine):
+    redis = HashRedis()
+    with (
+        mock.patch("app.activity.redis_conn", redis),
+        mock.patch("app.activity.ACTIVITY_WRITE_BEHIND", True),
+        mock.patch("app.tasks.ENGINE", engine),
+        mock.patch("app.tasks.enqueue_medium_priority"),
+    ):
+        yield redis.data
+
+
+def sample(name: str, **labels: str) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def last_request(engine, user_id: str) -> datetime:
+    with Session(engine) as session:
+        user = session.get(User, user_id)
+        assert user is not None
+        return user.last_request
+
+
+class TestTouch:
+    def test_written_directly_without_buffer(self, engine, test_user_id):
+        with Session(engine) as session:
+            feed_router._get_user(session, test_user_id)
+            assert not activity.touch("user", test_user_id, datetime(2030, 1, 1))
+            at = datetime.now(timezone.utc).replace(tzinfo=None)
+
+        assert at - last_request(engine, test_user_id) < timedelta(minutes=1)
+
+    def test_buffered(self, engine, buffer, test_user_id):
+        before = last_request(engine, test_user_id)
+        with Session(engine) as session:
+            feed_router._get_user(session, test_user_id)
+            feed_router._get_user(session, test_user_id)
+
+        assert last_request(engine, test_user_id) == before
+        assert list(buffer["activity:user"]) == [test_user_id.encode()]
+        assert buffer["activity:touches"] == {b"user": b"2"}
+
+    def test_frozen_user_unfrozen_right_away(self, engine, buffer, test_user_id):
+        with Session(engine) as session:
+            user = session.get(User, test_user_id)
+            user.is_frozen = True
+            user.frozen_at = datetime.now(timezone.utc)
+            session.commit()
+
+            user = feed_router._get_user(session, test_user_id)
+            assert not user.is_frozen
+
+        assert "activity:user" not in buffer
+
+
+class TestFlush:
+    def test_one_write_per_row(self, engine, buffer, test_user_id):
+        absorbed = sample("rssfilter_activity_absorbed_writes_total", kind="user")
+        for _ in range(3):
+            log_user_action(test_user_id, 1, "https://example.com")
+        with Session(engine) as session:
+            # The click is stored, its timestamps are left to the flush
+            assert session.exec(select(UserArticleLink)).one()
+            article_updated = session.get(Article, 1).updated
+
+        assert activity.flush(engine) == {"user": 1, "article": 1}
+
+        with Session(engine) as session:
+            assert session.get(Article, 1).updated > article_updated
+        assert (
+            sample("rssfilter_activity_absorbed_writes_total", kind="user")
+            == absorbed + 2
+        )
+        assert not any(key.startswith("activity:") for key in buffer)
+
+    def test_does_not_move_back(self, engine, buffer, test_user_id):
+        future = datetime.now(timezone.utc) + timedelta(days=1)
+        with Session(engine) as session:
+            session.get(User, test_user_id).last_request = future
+            session.commit()
+        activity.touch("user", test_user_id, datetime.now(timezone.utc))
+
+        activity.flush(engine)
+
+        assert last_request(engine, test_user_id) == future.replace(tzinfo=None)
+
+    def test_failed_flush_is_retried(self, engine, buffer, test_user_id):
+        activity.touch("user", test_user_id, datetime(2030, 1, 1))
+        with mock.patch("app.activity.write", side_effect=RuntimeError):
+            with pytest.raises(RuntimeError):
+                activity.flush(engine)
+        activity.touch("article", 1, datetime(2030, 1, 1))
+
+        assert activity.flush(engine) == {"user": 1, "article": 1}
+        assert last_request(engine, test_user_id) == datetime(2030, 1, 1)
+
+    def test_waits_for_running_flush(self, engine, buffer, test_user_id):
+        activity.touch("user", test_user_id, datetime(2030, 1, 1))
+        buffer[activity.ACTIVITY_FLUSH_LOCK_KEY] = b"1"
+
+        def finish_running_flush(seconds: float) -> None:
+            buffer.pop(activity.ACTIVITY_FLUSH_LOCK_KEY)
+
+        with mock.patch("app.activity.time.sleep", finish_running_flush):
+            assert activity.flush(engine) == {}
+            assert activity.flush(engine, wait=True) == {"user": 1, "article": 0}
+        assert last_request(engine, test_user_id) == datetime(2030, 1, 1)
+
+    def test_freeze_skipped_while_flush_running(self, engine, buffer, test_user_id):
+        with Session(engine) as session:
+            session.get(User, test_user_id).last_request = datetime(2020, 1, 1)
+            session.commit()
+        activity.touch("user", test_user_id, datetime.now(timezone.utc))
+        buffer[activity.ACTIVITY_FLUSH_LOCK_KEY] = b"1"
+
+        with (
+            mock.patch("app.activity.ACTIVITY_FLUSH_WAIT", 0),
+            pytest.raises(TimeoutError),
+        ):
+            freeze_dormant_users()
+        with Session(engine) as session:
+            assert not session.get(User, test_user_id).is_frozen
+
+    def test_freeze_sees_buffered_activity(self, engine, buffer, test_user_id):
+        with Session(engine) as session:
+            session.get(User, test_user_id).last_request = datetime(2020, 1, 1)
+            session.commit()
+        activity.touch("user", test_user_id, datetime.now(timezone.utc))
+
+        assert freeze_dormant_users() == 0
+        with Session(engine) as session:
+            assert not session.get(User, test_user_id).is_frozen
@@ -0,0 +1,55 @@
+import json
+from urllib.request import urlopen
+
+from benchmarks.hotpath import compare, measure, run_benchmarks
+from benchmarks.server import feed_server, synthetic_feed
+from app.models.feed import parse_feed_articles
+
+
+class TestBenchmarks:
+    def test_feed_server(self):
+        with feed_server() as base_url:
+            with urlopen(f"{base_url}/fixtures/news.ycombinator.com.rss.xml") as r:
+                fixture = r.read()
+            with urlopen(f"{base_url}/synthetic/5/1.xml") as r:
+                synthetic = r.read()
+
+        assert b"Hacker News" in fixture
+        assert synthetic == synthetic_feed(5, 1)
+        assert len(list(parse_feed_articles(synthetic))) == 5
+
+    def test_measure(self):
+        calls = []
+
+        stats = measure(
+            lambda: calls.append("run"), 3, setup=lambda: calls.append("setup")
+        )
+
+        assert calls == ["setup", "run"] * 3
+        assert stats["repeat"] == 3
+        assert stats["min_ms"] <= stats["median_ms"] <= stats["max_ms"]
+
+    def test_run_benchmarks(self, tmp_path):
+        results = run_benchmarks(
+            repeat=1,
+            feed_sizes=(5,),
+            batch_feeds=2,
+            batch_items=5,
+            candidate_counts=(20,),
+            history_sizes=(20,),
+            render_sizes=(5,),
+        )
+
+        assert "parse_feed[synthetic-5]" in results
+        assert "fetch_feed_batch[new-2x5]" in results
+        assert "fetch_feed_batch[dedup-2x5]" in results
+        assert "filter_articles[20]" in results
+        assert "cluster_articles[20]" in results
+        assert "generate_feed[5]" in results
+        json.dumps(results)
+
+    def test_compare(self):
+        baseline = {"a": {"median_ms": 2.0}, "b": {"median_ms": 1.0}}
+        results = {"a": {"median_ms": 1.0}, "c": {"median_ms": 1.0}}
+
+        assert compare(results, baseline) == [("a", 2.0, 1.0, 0.5)]
@@ -1,15 +1,20 @@
 import pytest
 from os import getenv
 import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
 from typer.testing import CliRunner
 from sqlmodel import Session, create_engine, select
 from app.models.article import Article
 from app.models.feed import Feed
 from app.models.user import User
+from app.models.counter import read_stats
 from app.recommend import compute_embeddings
 from unittest import mock
 from app.cli import cli
 from app.cli import SQLModel
+from app.clicks import split_signature, verify_click
 
 
 runner = CliRunner()
@@ -79,3 +84,127 @@ class TestClusters:
             assert user.clusters is not None
             assert len(json.loads(user.clusters)) == 10
             assert user.clusters_updated_at is not None
+
+
+class _StubAPI(BaseHTTPRequestHandler):
+    lock_retries = 0
+    # Whether the signature of each click is valid
+    signed_clicks: list[bool] = []
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            _StubAPI.lock_retries += 2
+            body = (
+                "# TYPE rssfilter_db_lock_retries counter\n"
+                f'rssfilter_db_lock_retries_total{{function="log_user_action"}} '
+                f"{float(_StubAPI.lock_retries)}\n"
+            ).encode()
+            self.send_response(200)
+        elif self.path.startswith("/v1/log/"):
+            _, _, _, user_id, article_id, target = self.path.split("/", 5)
+            signature, url = split_signature(unquote(target))
+            _StubAPI.signed_clicks.append(
+                signature is not None
+                and verify_click(user_id, int(article_id), url, signature)
+            )
+            body = b""
+            self.send_response(307)
+            self.send_header("Location", "https://example.com")
+        else:
+            body = b"<rss/>"
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub_api():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubAPI)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+class TestSyntheticCorpus:
+    def test_generate_corpus(self, engine):
+        result = runner.invoke(
+            cli,
+            [
+                "generate-corpus",
+                "--users=20",
+                "--feeds=5",
+                "--articles-per-feed=20",
+                "--feeds-per-user=2",
+                "--clicks-per-user=15",
+                "--embedding-dim=8",
+            ],
+        )
+
+        assert result.exit_code == 0, result.output
+        with Session(engine) as session:
+            assert len(session.exec(select(User)).all()) == 20
+            assert len(session.exec(select(Feed)).all()) == 5
+            articles = session.exec(select(Article)).all()
+            assert len(articles) == 100
+            assert all(
+                len(json.loads(a.embedding)) == 8 for a in articles if a.embedding
+            )
+            assert any(user.clusters for user in session.exec(select(User)).all())
+            assert read_stats(session)["articles"]["total"] == 100
+
+        # Another seed adds to the existing data
+        result = runner.invoke(
+            cli, ["generate-corpus", "--users=5", "--feeds=2", "--seed=1"]
+        )
+        assert result.exit_code == 0, result.output
+        with Session(engine) as session:
+            assert len(session.exec(select(Feed)).all()) == 7
+
+    def test_load_test(self, engine, stub_api):
+        runner.invoke(
+            cli, ["generate-corpus", "--users=10", "--feeds=3", "--embedding-dim=8"]
+        )
+
+        result = runner.invoke(
+            cli,
+            [
+                "load-test",
+                f"--base-url={stub_api}",
+                "--requests=50",
+                "--concurrency=5",
+                "--log-ratio=0.5",
+            ],
+        )
+
+        assert result.exit_code == 0, result.output
+        assert "50 requests" in result.output
+        assert "feed 200" in result.output
+        assert "log 307" in result.output
+        assert "'database is locked' retries: 2" in result.output
+
+    def test_load_test_signed_clicks(self, engine, stub_api):
+        runner.invoke(
+            cli, ["generate-corpus", "--users=10", "--feeds=3", "--embedding-dim=8"]
+        )
+        _StubAPI.signed_clicks = []
+
+        with mock.patch("app.clicks.CLICK_SIGNING_KEY", "secret"):
+            result = runner.invoke(
+                cli,
+                [
+                    "load-test",
+                    f"--base-url={stub_api}",
+                    "--requests=20",
+                    "--log-ratio=1",
+                ],
+            )
+
+            assert result.exit_code == 0, result.output
+            assert len(_StubAPI.signed_clicks) == 20
+            assert all(_StubAPI.signed_clicks)
@@ -0,0 +1,218 @@
+import json
+import time
+from unittest import mock
+
+import numpy as np
+import pytest
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, select
+
+from app import writer
+from app.clustering import fit_clusters
+from app.models.article import Article
+from app.models.relations import UserArticleLink
+from app.models.user import User
+from app.tasks import (
+    CLUSTERS_DIRTY_KEY,
+    _load_read_embeddings,
+    log_user_action,
+    recompute_clusters_batch,
+    recompute_dirty_clusters,
+    recompute_user_clusters,
+)
+
+
+class SetRedis:
+    """The Redis set commands used by the clusters batching."""
+
+    def __init__(self) -> None:
+        self.data: dict[str, set[bytes]] = {}
+
+    def sadd(self, key: str, *members: str) -> None:
+        self.data.setdefault(key, set()).update(member.encode() for member in members)
+
+    def scard(self, key: str) -> int:
+        return len(self.data.get(key, ()))
+
+    def spop(self, key: str, count: int) -> list[bytes]:
+        members = self.data.get(key, set())
+        return [members.pop() for _ in range(min(count, len(members)))]
+
+    def exists(self, key: str) -> int:
+        return int(key in self.data)
+
+
+@pytest.fixture
+def redis_data(engine):
+    redis = SetRedis()
+    with (
+        mock.patch("app.tasks.redis_conn", redis),
+        mock.patch("app.tasks.ENGINE", engine),
+        mock.patch("app.tasks.CLUSTER_BATCHING", True),
+        mock.patch("app.tasks.CLUSTERS_BATCH_SIZE", 2),
+    ):
+        yield redis.data
+
+
+@pytest.fixture
+def readers(engine):
+    """Users "a" and "b" read the same 12 articles, "c" only 5 of them."""
+    embeddings = np.random.RandomState(0).randn(12, 4)
+    with Session(engine) as session:
+        articles = [
+            Article(
+                title=f"Article {i}",
+                description="",
+                url=f"https://example.com/{i}",
+                feed_id=1,
+                embedding=json.dumps(embedding.tolist()),
+            )
+            for i, embedding in enumerate(embeddings)
+        ]
+        session.add(User(id="a", articles=articles))
+        session.add(User(id="b", articles=articles))
+        session.add(User(id="c", articles=articles[:5]))
+        session.commit()
+    return ["a", "b", "c"]
+
+
+def _assigned(engine, user_id: str) -> list[tuple[int | None, int | None]]:
+    with Session(engine) as session:
+        return [
+            (link.article_id, link.cluster)
+            for link in session.exec(
+                select(UserArticleLink)
+                .where(UserArticleLink.user_id == user_id)
+                .order_by(UserArticleLink.article_id)  # type: ignore[arg-type]
+            ).all()
+        ]
+
+
+class TestFitClusters:
+    def test_process_pool_matches_inline(self):
+        embeddings = np.random.RandomState(0).randn(30, 4)
+        rows_by_user = {
+            "a": np.arange(0, 20),
+            "b": np.arange(10, 30),
+            "c": np.arange(0, 30, 2),
+        }
+
+        inline = fit_clusters(embeddings, rows_by_user, processes=1)
+        pooled = fit_clusters(embeddings, rows_by_user, processes=2)
+
+        assert list(pooled) == ["a", "b", "c"]
+        for user_id in rows_by_user:
+            np.testing.assert_allclose(pooled[user_id].centers, inline[user_id].centers)
+            np.testing.assert_array_equal(
+                pooled[user_id].labels, inline[user_id].labels
+            )
+            assert len(pooled[user_id].distances) == len(rows_by_user[user_id])
+
+
+class TestRecomputeClustersBatch:
+    def test_shared_articles_decoded_once(self, engine, readers):
+        with Session(engine) as session:
+            article_ids, embeddings, rows_by_user = _load_read_embeddings(
+                session, readers
+            )
+
+        assert embeddings.shape == (12, 4)
+        assert len(article_ids) == 12
+        # Too few articles to be clustered
+        assert list(rows_by_user) == ["a", "b"]
+        np.testing.assert_array_equal(rows_by_user["a"], rows_by_user["b"])
+
+    def test_stored_in_one_transaction(self, engine, redis_data, readers):
+        with mock.patch("app.writer.apply_intents") as apply_intents:
+            assert recompute_clusters_batch(readers) == 2
+        _, intents = apply_intents.call_args.args
+        assert [intent["kind"] for intent in intents] == ["clusters_batch"]
+        assert [user["user_id"] for user in intents[0]["users"]] == ["a", "b"]
+
+        assert recompute_clusters_batch(readers) == 2
+        with Session(engine) as session:
+            users = {user.id: user for user in session.exec(select(User)).all()}
+            assert len(json.loads(users["a"].clusters)) == 10
+            assert users["a"].clusters == users["b"].clusters
+            assert users["c"].clusters is None
+        assert all(cluster is not None for _, cluster in _assigned(engine, "a"))
+        assert all(cluster is None for _, cluster in _assigned(engine, "c"))
+
+    def test_locked_write_does_not_fit_again(self, engine, redis_data, readers):
+        apply_intents = writer.apply_intents
+        attempts = []
+
+        def locked_once(*args):  # type: ignore[no-untyped-def]
+            attempts.append(args)
+            if len(attempts) == 1:
+                raise OperationalError("UPDATE", {}, Exception("database is locked"))
+            return apply_intents(*args)
+
+        with (
+            mock.patch("app.writer.apply_intents", side_effect=locked_once),
+            mock.patch("app.tasks.fit_clusters", wraps=fit_clusters) as fit,
+            mock.patch("app.database.time.sleep"),
+        ):
+            assert recompute_clusters_batch(readers) == 2
+
+        fit.assert_called_once()
+        assert len(attempts) == 2
+        assert all(cluster is not None for _, cluster in _assigned(engine, "a"))
+
+    def test_single_user(self, engine, redis_data, readers):
+        recompute_user_clusters("a")
+
+        assert all(cluster is not None for _, cluster in _assigned(engine, "a"))
+        assert all(cluster is None for _, cluster in _assigned(engine, "b"))
+
+
+class TestDirtyClusters:
+    def test_clicks_recomputed_in_batches(
+        self, engine, redis_data, readers, test_user_id
+    ):
+        with mock.patch("app.tasks.enqueue_medium_priority") as enqueue:
+            log_user_action(test_user_id, 1, "https://example.com")
+        enqueue.assert_not_called()
+        redis_data[CLUSTERS_DIRTY_KEY].update({b"a", b"b", b"c"})
+
+        with mock.patch(
+            "app.tasks.recompute_clusters_batch", side_effect=lambda ids: len(ids)
+        ) as batch:
+            assert recompute_dirty_clusters() == 4
+
+        assert batch.call_count == 2
+        assert sorted(
+            user_id for call in batch.call_args_list for user_id in call.args[0]
+        ) == ["a", "b", "c", test_user_id]
+        assert redis_data[CLUSTERS_DIRTY_KEY] == set()
+
+    def test_failed_write_marked_again(self, engine, redis_data, readers):
+        redis_data[CLUSTERS_DIRTY_KEY] = {b"a", b"b"}
+
+        with mock.patch("app.tasks.write", side_effect=RuntimeError):
+            with pytest.raises(RuntimeError):
+                recompute_dirty_clusters()
+
+        assert redis_data[CLUSTERS_DIRTY_KEY] == {b"a", b"b"}
+        assert all(cluster is None for _, cluster in _assigned(engine, "a"))
+
+    def test_run_stops_after_its_time_budget(self, engine, redis_data):
+        redis_data[CLUSTERS_DIRTY_KEY] = {b"a", b"b", b"c", b"d", b"e"}
+
+        with (
+            mock.patch("app.tasks.CLUSTERS_RUN_TIME_BUDGET", 0.05),
+            mock.patch(
+                "app.tasks.recompute_clusters_batch",
+                side_effect=lambda ids: time.sleep(0.05) or len(ids),
+            ) as batch,
+        ):
+            assert recompute_dirty_clusters() == 2
+
+        batch.assert_called_once()
+        assert len(redis_data[CLUSTERS_DIRTY_KEY]) == 3
+
+    def test_single_user_job_logs_errors(self, engine, redis_data, readers):
+        with mock.patch("app.tasks.write", side_effect=RuntimeError):
+            recompute_user_clusters("a")
+
+        assert all(cluster is None for _, cluster in _assigned(engine, "a"))
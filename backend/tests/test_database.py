@@ -0,0 +1,29 @@
+import pytest
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, select
+
+from app.database import create_db_engine, create_read_engine
+from app.models.user import User
+
+
+class TestReadEngine:
+    def test_reads(self, database_url, test_user_id):
+        engine = create_read_engine(database_url)
+        with Session(engine) as session:
+            assert session.get(User, test_user_id) is not None
+
+    def test_cannot_write(self, database_url):
+        engine = create_read_engine(database_url)
+        with Session(engine) as session:
+            session.add(User(id="new"))
+            with pytest.raises(OperationalError, match="readonly"):
+                session.commit()
+
+    def test_sees_committed_writes(self, database_url):
+        engine = create_db_engine(database_url)
+        read_engine = create_read_engine(database_url)
+        with Session(engine) as session:
+            session.add(User(id="new"))
+            session.commit()
+        with Session(read_engine) as session:
+            assert session.exec(select(User).where(User.id == "new")).first()
@@ -0,0 +1,29 @@
+import pytest
+
+from benchmarks.imports import PROCESSES, compare, probe, run_benchmarks
+
+
+class TestImports:
+    @pytest.mark.parametrize("process", PROCESSES)
+    def test_heavy_modules_imported_lazily(self, process):
+        # In a new interpreter, as the tests themselves import everything
+        assert probe(PROCESSES[process])["heavy_modules"] == []
+
+    def test_run_benchmarks(self):
+        results = run_benchmarks(repeat=1, processes=("writer",))
+
+        stats = results["import[writer]"]
+        assert stats["min_ms"] <= stats["median_ms"] <= stats["max_ms"]
+        assert stats["max_rss_mb"] > 0
+
+    def test_compare(self):
+        baseline = {"import[api]": {"median_ms": 2.0, "max_rss_mb": 300.0}}
+        results = {
+            "import[api]": {"median_ms": 1.0, "max_rss_mb": 100.0},
+            "import[writer]": {"median_ms": 1.0, "max_rss_mb": 50.0},
+        }
+
+        assert compare(results, baseline) == [
+            ("import[api]", "median_ms", 2.0, 1.0),
+            ("import[api]", "max_rss_mb", 300.0, 100.0),
+        ]
@@ -0,0 +1,62 @@
+import asyncio
+import threading
+import time
+from unittest import mock
+
+from prometheus_client import REGISTRY
+
+from app.loopmonitor import monitor_event_loop
+
+
+def blocking_parse():
+    time.sleep(0.3)
+
+
+def _sample(name, loop):
+    return REGISTRY.get_sample_value(name, {"loop": loop}) or 0.0
+
+
+class TestLoopMonitor:
+    def test_disabled(self):
+        async def run():
+            async with monitor_event_loop("disabled"):
+                return threading.active_count()
+
+        before = threading.active_count()
+        with mock.patch("app.loopmonitor.LOOP_MONITOR_ENABLED", False):
+            assert asyncio.run(run()) == before
+
+    def test_reports_blocking_call(self):
+        async def run():
+            async with monitor_event_loop("test"):
+                await asyncio.sleep(0.05)
+                blocking_parse()
+                await asyncio.sleep(0.05)
+
+        stalls = _sample("rssfilter_event_loop_stalls_total", "test")
+        with (
+            mock.patch("app.loopmonitor.LOOP_MONITOR_ENABLED", True),
+            mock.patch("app.loopmonitor.LOOP_STALL_THRESHOLD_MS", 100),
+            mock.patch("app.loopmonitor.logger") as logger,
+        ):
+            asyncio.run(run())
+
+        assert _sample("rssfilter_event_loop_stalls_total", "test") == stalls + 1
+        assert _sample("rssfilter_event_loop_lag_seconds_count", "test")
+        message = logger.bind.return_value.warning.call_args.args[0]
+        assert "Event loop test blocked" in message
+        assert "blocking_parse" in message
+
+    def test_no_stall(self):
+        async def run():
+            async with monitor_event_loop("idle"):
+                await asyncio.sleep(0.3)
+
+        with (
+            mock.patch("app.loopmonitor.LOOP_MONITOR_ENABLED", True),
+            mock.patch("app.loopmonitor.LOOP_STALL_THRESHOLD_MS", 100),
+            mock.patch("app.loopmonitor.logger") as logger,
+        ):
+            asyncio.run(run())
+
+        logger.bind.assert_not_called()
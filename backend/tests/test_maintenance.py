@@ -1,28 +1,22 @@
-import sys
+import time
 from datetime import datetime, timedelta, timezone
 from unittest import mock
 
-sys.modules["torch"] = mock.MagicMock()
-sys.modules["transformers"] = mock.MagicMock()
+import pytest
+from sqlmodel import Session, delete, select
 
-import pytest  # noqa: E402
-from sqlmodel import Session, create_engine, select  # noqa: E402
-
-from app.cli import SQLModel  # noqa: E402
-from app.models.article import Article  # noqa: E402
-from app.models.feed import Feed  # noqa: E402
-from app.models.user import User  # noqa: E402
+from app.cli import SQLModel
+from app.database import create_db_engine
+from app.models.article import Article
+from app.models.feed import Feed
+from app.models.user import User
+from app.models.relations import UserArticleLink, UserFeedLink
 
 
 @pytest.fixture
 def engine(tmpdir):
     with mock.patch(
-        "app.tasks.ENGINE",
-        create_engine(
-            f"sqlite:///{tmpdir}/test.db",
-            echo=False,
-            connect_args={"check_same_thread": False},
-        ),
+        "app.tasks.ENGINE", create_db_engine(f"sqlite:///{tmpdir}/test.db")
     ) as engine:
         SQLModel.metadata.create_all(engine)
         yield engine
@@ -187,6 +181,185 @@ class TestCleanupOldArticles:
             articles = session.exec(select(Article)).all()
             assert len(articles) == 1
 
+    def test_cleanup_in_batches(self, engine):
+        from app.tasks import cleanup_old_articles
+
+        old_date = datetime.now(timezone.utc) - timedelta(days=200)
+
+        with Session(engine) as session:
+            feed = Feed(id=1, url="https://example.com/feed", title="Test Feed")
+            session.add(feed)
+            for i in range(1, 6):
+                session.add(
+                    Article(
+                        id=i,
+                        title=f"Old Article {i}",
+                        description="Old description",
+                        url=f"https://example.com/old/{i}",
+                        feed=feed,
+                        updated=old_date,
+                    )
+                )
+            session.commit()
+
+        with mock.patch("app.tasks.MAINTENANCE_BATCH_PAUSE", 0):
+            count = cleanup_old_articles(180, batch_size=2)
+
+        assert count == 5
+        with Session(engine) as session:
+            assert session.exec(select(Article)).all() == []
+
+    def test_cleanup_resumes_after_time_budget(self, engine):
+        from app.tasks import cleanup_old_articles
+
+        old_date = datetime.now(timezone.utc) - timedelta(days=200)
+
+        with Session(engine) as session:
+            feed = Feed(id=1, url="https://example.com/feed", title="Test Feed")
+            session.add(feed)
+            for i in range(1, 6):
+                session.add(
+                    Article(
+                        id=i,
+                        title=f"Old Article {i}",
+                        description="Old description",
+                        url=f"https://example.com/old/{i}",
+                        feed=feed,
+                        updated=old_date,
+                    )
+                )
+            session.commit()
+
+        cursors: dict[str, bytes] = {}
+        redis_mock = mock.MagicMock()
+        redis_mock.get.side_effect = cursors.get
+        redis_mock.set.side_effect = cursors.__setitem__
+        redis_mock.delete.side_effect = lambda key: cursors.pop(key, None)
+
+        with mock.patch("app.tasks.redis_conn", redis_mock):
+            count = cleanup_old_articles(180, batch_size=2, time_budget=0)
+            assert count == 2
+            assert cursors == {"maintenance:cursor:cleanup_old_articles": "2"}
+
+            count = cleanup_old_articles(180, batch_size=10, time_budget=0)
+            assert count == 3
+            assert cursors == {}
+
+        with Session(engine) as session:
+            assert session.exec(select(Article)).all() == []
+
+
+class TestCleanupOrphanLinks:
+    def test_cleanup_orphan_user_article_links(self, engine):
+        from app.tasks import cleanup_orphan_user_article_links
+
+        with Session(engine) as session:
+            feed = Feed(id=1, url="https://example.com/feed", title="Test Feed")
+            article = Article(
+                id=1,
+                title="Article",
+                description="Description",
+                url="https://example.com/article",
+                feed=feed,
+            )
+            session.add(feed)
+            session.add(article)
+            session.add(UserArticleLink(user_id="reader", article_id=1))
+            session.add(UserArticleLink(user_id="reader", article_id=2))
+            session.add(UserArticleLink(user_id="other", article_id=2))
+            session.commit()
+
+        count = cleanup_orphan_user_article_links(batch_size=1)
+
+        assert count == 2
+        with Session(engine) as session:
+            links = session.exec(select(UserArticleLink)).all()
+            assert [link.article_id for link in links] == [1]
+
+    def test_cleanup_orphan_user_feed_links(self, engine):
+        from app.tasks import cleanup_orphan_user_feed_links
+
+        with Session(engine) as session:
+            session.add(Feed(id=1, url="https://example.com/feed", title="Feed"))
+            session.add(UserFeedLink(user_id="reader", feed_id=1))
+            session.add(UserFeedLink(user_id="reader", feed_id=2))
+            session.commit()
+
+        count = cleanup_orphan_user_feed_links()
+
+        assert count == 1
+        with Session(engine) as session:
+            links = session.exec(select(UserFeedLink)).all()
+            assert [link.feed_id for link in links] == [1]
+
+
+class TestCleanupInactiveUsers:
+    def test_cleanup_inactive_users(self, engine):
+        from app.tasks import cleanup_inactive_users
+
+        old_date = datetime.now(timezone.utc) - timedelta(days=400)
+
+        with Session(engine) as session:
+            session.add(User(id="inactive", last_request=old_date))
+            session.add(User(id="subscribed", last_request=old_date))
+            session.add(User(id="recent"))
+            session.add(Feed(id=1, url="https://example.com/feed", title="Feed"))
+            session.add(UserFeedLink(user_id="subscribed", feed_id=1))
+            session.commit()
+
+        count = cleanup_inactive_users(365)
+
+        assert count == 1
+        with Session(engine) as session:
+            assert session.get(User, "inactive") is None
+            assert session.get(User, "subscribed") is not None
+            assert session.get(User, "recent") is not None
+
+
+class TestCleanupCounters:
+    def test_counters_match_after_cleanup(self, engine):
+        from app.models.counter import count_exact, read_stats, reconcile_counters
+        from app.tasks import cleanup_inactive_users, cleanup_old_articles
+
+        old_date = datetime.now(timezone.utc) - timedelta(days=400)
+        with Session(engine) as session:
+            session.add(User(id="frozen", last_request=old_date, is_frozen=True))
+            session.add(User(id="inactive", last_request=old_date))
+            session.add(User(id="recent", is_frozen=True))
+            feed = Feed(id=1, url="https://example.com/feed", title="Test Feed")
+            session.add(feed)
+            for i, embedding in enumerate(["[0.1]", None, "[0.2]"], start=1):
+                session.add(
+                    Article(
+                        id=i,
+                        title=f"Old Article {i}",
+                        description="",
+                        url=f"https://example.com/old/{i}",
+                        feed=feed,
+                        updated=old_date,
+                        embedding=embedding,
+                    )
+                )
+            session.commit()
+            reconcile_counters(session)
+
+        with mock.patch("app.tasks.MAINTENANCE_BATCH_PAUSE", 0):
+            assert cleanup_inactive_users(365, batch_size=1) == 2
+            assert cleanup_old_articles(180, batch_size=2) == 3
+
+        with Session(engine) as session:
+            stats = read_stats(session)
+            exact = count_exact(session)
+        assert stats is not None
+        assert {
+            f"{group}.{name}": value
+            for group, values in stats.items()
+            for name, value in values.items()
+            if name != "active_30d"
+        } == exact
+        assert exact["users.frozen"] == 1
+        assert exact["articles.with_embeddings"] == 0
+
 
 class TestRemoveOldEmbeddings:
     def test_remove_old_embeddings(self, engine):
@@ -269,6 +442,150 @@ class TestGetDatabaseStats:
         assert stats["articles"]["total"] == 1
         assert stats["articles"]["with_embeddings"] == 1
 
+    def test_stats_counters_are_maintained_incrementally(self, engine):
+        from app.tasks import (
+            freeze_dormant_users,
+            get_database_stats,
+            reconcile_database_stats,
+        )
+
+        old_date = datetime.now(timezone.utc) - timedelta(days=100)
+
+        with Session(engine) as session:
+            session.add(User(id="dormant", last_request=old_date))
+            session.commit()
+
+        reconcile_database_stats()
+        freeze_dormant_users()
+
+        with mock.patch("app.models.counter.count_exact") as count_exact:
+            stats = get_database_stats()
+            count_exact.assert_not_called()
+
+        assert stats["users"]["total"] == 1
+        assert stats["users"]["frozen"] == 1
+
+    def test_reconcile_corrects_drift(self, engine):
+        from app.models.counter import Counter
+        from app.tasks import get_database_stats, reconcile_database_stats
+
+        with Session(engine) as session:
+            session.add(User(id="test_stats"))
+            session.commit()
+
+        reconcile_database_stats()
+        with Session(engine) as session:
+            counter = session.get(Counter, "users.total")
+            counter.value = 42
+            session.commit()
+
+        drift = reconcile_database_stats()
+
+        assert drift["users.total"] == -41
+        assert get_database_stats()["users"]["total"] == 1
+
+
+class TestVacuumDatabase:
+    def _create_and_delete_articles(self, engine, count=500):
+        with Session(engine) as session:
+            feed = Feed(id=1, url="https://example.com/feed", title="Test Feed")
+            session.add(feed)
+            for i in range(1, count + 1):
+                session.add(
+                    Article(
+                        id=i,
+                        title=f"Article {i}",
+                        description="x" * 1000,
+                        url=f"https://example.com/{i}",
+                        feed=feed,
+                    )
+                )
+            session.commit()
+            session.exec(delete(Article))
+            session.commit()
+
+    def test_vacuum_incremental(self, engine):
+        from app.tasks import get_storage_stats, vacuum_database
+
+        self._create_and_delete_articles(engine)
+        assert get_storage_stats()["freelist_pages"] > 0
+
+        with mock.patch("app.tasks.VACUUM_FREELIST_THRESHOLD", 1.0):
+            result = vacuum_database()
+
+        assert result["mode"] == "incremental"
+        assert result["freelist_before"] > 0
+        assert result["freelist_after"] == 0
+
+    def test_vacuum_full_above_fragmentation_threshold(self, engine):
+        from app.tasks import vacuum_database
+
+        self._create_and_delete_articles(engine)
+
+        with mock.patch("app.tasks.VACUUM_FREELIST_THRESHOLD", 0.1):
+            result = vacuum_database()
+
+        assert result["mode"] == "full"
+        assert result["freelist_after"] == 0
+
+    def test_storage_stats(self, engine):
+        from app.tasks import get_storage_stats
+
+        stats = get_storage_stats()
+
+        assert stats["auto_vacuum"] == 2
+        assert stats["page_count"] > 0
+        assert stats["file_size"] > 0
+        assert stats["wal_size"] is not None
+
+
+class TestRunFullMaintenance:
+    def test_steps_share_one_time_budget(self, engine):
+        from app.tasks import run_full_maintenance
+
+        budgets: list[float] = []
+
+        def cleanup(time_budget: float) -> int:
+            budgets.append(time_budget)
+            return 0
+
+        with (
+            mock.patch("app.tasks.cleanup_old_articles", side_effect=cleanup),
+            mock.patch(
+                "app.tasks.cleanup_orphan_user_article_links", side_effect=cleanup
+            ),
+            mock.patch("app.tasks.cleanup_orphan_user_feed_links", side_effect=cleanup),
+            mock.patch("app.tasks.vacuum_database", side_effect=cleanup),
+        ):
+            results = run_full_maintenance(time_budget=60)
+
+        assert len(budgets) == 4
+        assert budgets == sorted(budgets, reverse=True)
+        assert all(0 < budget <= 60 for budget in budgets)
+        assert results["vacuum"] == 0
+
+    def test_steps_skipped_after_the_deadline(self, engine):
+        from app.tasks import run_full_maintenance
+
+        with (
+            mock.patch(
+                "app.tasks.cleanup_old_articles",
+                side_effect=lambda time_budget: time.sleep(0.05) or 1,
+            ),
+            mock.patch("app.tasks.vacuum_database") as vacuum,
+        ):
+            results = run_full_maintenance(time_budget=0.01)
+
+        assert results["deleted_articles"] == 1
+        assert results["orphan_article_links"] is None
+        assert results["vacuum"] is None
+        vacuum.assert_not_called()
+
+    def test_budget_below_job_timeout(self):
+        from app.tasks import MAINTENANCE_TIME_BUDGET, SCHEDULED_JOB_TIMEOUT
+
+        assert MAINTENANCE_TIME_BUDGET < SCHEDULED_JOB_TIMEOUT
+
 
 class TestLogUserActionUnfreeze:
     def test_log_user_action_unfreezes_user(self, engine):
@@ -304,3 +621,75 @@ class TestLogUserActionUnfreeze:
                 user = session.get(User, "frozen_reader")
                 assert user.is_frozen is False
                 assert user.frozen_at is None
+
+
+class TestFetchFeedBatch:
+    def test_skips_existing_articles(self, engine):
+        from app.tasks import fetch_feed_batch
+
+        url = "https://example.com/feed"
+        with Session(engine) as session:
+            session.add(Feed(id=1, url=url, title="Test Feed"))
+            session.add(
+                Article(
+                    title="Old",
+                    description="Old",
+                    url="https://example.com/old",
+                    feed_id=1,
+                )
+            )
+            session.commit()
+
+        async def parse_feed(_):
+            return Feed(
+                url=url,
+                title="Test Feed",
+                articles=[
+                    Article(
+                        title=name, description=name, url=f"https://example.com/{name}"
+                    )
+                    for name in ("old", "new", "new")
+                ],
+            )
+
+        with (
+            mock.patch("app.tasks.parse_feed", parse_feed),
+            mock.patch("app.tasks.enqueue_gpu_task") as enqueue,
+        ):
+            fetch_feed_batch([1])
+            fetch_feed_batch([1])
+
+        with Session(engine) as session:
+            urls = session.exec(select(Article.url).order_by(Article.id)).all()
+            assert urls == ["https://example.com/old", "https://example.com/new"]
+        # Only the first fetch found a new article
+        enqueue.assert_called_once()
+        assert len(enqueue.call_args.args[1]) == 1
+
+    def test_fills_in_feed_metadata(self, engine):
+        from app.tasks import fetch_feed_batch
+
+        url = "https://example.com/feed"
+        with Session(engine) as session:
+            session.add(Feed(id=1, url=url, title=url))
+            session.commit()
+
+        async def parse_feed(_):
+            return Feed(
+                url=url,
+                title="Example",
+                description="An example feed",
+                language="en",
+                articles=[],
+            )
+
+        with mock.patch("app.tasks.parse_feed", parse_feed):
+            fetch_feed_batch([1])
+
+        with Session(engine) as session:
+            feed = session.get(Feed, 1)
+            assert (feed.title, feed.description, feed.language) == (
+                "Example",
+                "An example feed",
+                "en",
+            )
@@ -0,0 +1,104 @@
+import os
+import subprocess
+import sys
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+import pytest
+
+from app.main import app
+from app.metrics import (
+    QueueCollector,
+    clear_multiprocess_dir,
+    generate_metrics,
+    mark_process_dead,
+)
+
+# Records a sample in a counter and a histogram, like a work-horse
+_RECORD = """
+from prometheus_client import Counter, Histogram
+Counter("rssfilter_test_jobs", "Jobs").inc()
+Histogram("rssfilter_test_job_duration_seconds", "Duration").observe(0.2)
+"""
+
+
+@pytest.fixture
+def multiproc_dir(tmp_path):
+    with mock.patch("app.metrics.PROMETHEUS_MULTIPROC_DIR", str(tmp_path)):
+        yield tmp_path
+
+
+def record_in_process(directory) -> int:  # type: ignore[no-untyped-def]
+    """Record samples in a new process, and return its pid once it exited."""
+    process = subprocess.Popen(
+        [sys.executable, "-c", _RECORD],
+        env={**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(directory)},
+    )
+    assert process.wait() == 0
+    return process.pid
+
+
+class TestMetrics:
+    def test_metrics_endpoint_reports_request_latency(self, client):
+        client.get(app.url_path_for("get_stats"))
+
+        response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert (
+            'rssfilter_http_request_duration_seconds_count{method="GET",'
+            'route="/v1/stats/",status="200"}'
+        ) in response.text
+
+    def test_queue_collector(self):
+        queue = mock.MagicMock()
+        queue.name = "high"
+        queue.count = 3
+        queue.get_job_ids.return_value = ["job"]
+        queue.fetch_job.return_value.enqueued_at = datetime.now(
+            timezone.utc
+        ) - timedelta(seconds=60)
+
+        with mock.patch("app.tasks.QUEUES", [queue]):
+            depth, oldest_age = QueueCollector().collect()
+
+        assert depth.samples[0].labels == {"queue": "high"}
+        assert depth.samples[0].value == 3
+        assert 60 <= oldest_age.samples[0].value < 70
+
+    def test_queue_collector_empty_queue(self):
+        queue = mock.MagicMock()
+        queue.name = "low"
+        queue.count = 0
+        queue.get_job_ids.return_value = []
+
+        with mock.patch("app.tasks.QUEUES", [queue]):
+            _, oldest_age = QueueCollector().collect()
+
+        assert oldest_age.samples[0].value == 0
+
+
+class TestMultiprocessFiles:
+    def test_dead_processes_folded(self, multiproc_dir):
+        pids = [record_in_process(multiproc_dir) for _ in range(3)]
+        assert len(list(multiproc_dir.iterdir())) == 6
+
+        for pid in pids:
+            mark_process_dead(pid)
+
+        assert sorted(path.name for path in multiproc_dir.iterdir()) == [
+            f"counter_dead-{os.getpid()}.db",
+            f"histogram_dead-{os.getpid()}.db",
+        ]
+        text = generate_metrics().decode()
+        assert "rssfilter_test_jobs_total 3.0" in text
+        assert "rssfilter_test_job_duration_seconds_count 3.0" in text
+        assert 'rssfilter_test_job_duration_seconds_bucket{le="0.25"} 3.0' in text
+
+    def test_cleared_on_start(self, multiproc_dir):
+        record_in_process(multiproc_dir)
+
+        clear_multiprocess_dir()
+
+        assert list(multiproc_dir.iterdir()) == []
@@ -0,0 +1,181 @@
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import create_engine, text
+
+BACKEND = Path(__file__).parent.parent
+
+
+@pytest.fixture
+def migrate(tmp_path, monkeypatch):
+    """Upgrade a new SQLite database to the given revision."""
+    url = f"sqlite:///{tmp_path}/db.sqlite"
+    monkeypatch.setenv("DATABASE_URL", url)
+    monkeypatch.chdir(BACKEND)
+    config = Config(str(BACKEND / "alembic.ini"))
+    engine = create_engine(url)
+
+    def upgrade(revision: str):  # type: ignore[no-untyped-def]
+        command.upgrade(config, revision)
+        return engine
+
+    yield upgrade
+    engine.dispose()
+
+
+class TestCanonicalKeyMigration:
+    def test_merges_duplicate_feeds(self, migrate):
+        engine = migrate("d4e5f6g7h8i9")
+        now = datetime(2026, 1, 1)
+        with engine.begin() as connection:
+            for feed_id, url, original_url, disabled in [
+                (1, "https://example.com/rss", None, False),
+                (2, "http://www.example.com/rss/", "https://old.example/rss", False),
+                (3, "https://example.com/rss#top", None, True),
+                (4, "https://other.example/feed", None, False),
+            ]:
+                connection.execute(
+                    text(
+                        "INSERT INTO feed (id, url, original_url, title, created_at, "
+                        "updated_at, consecutive_failures, is_disabled) "
+                        "VALUES (:id, :url, :original_url, 'Feed', :now, :now, 0, "
+                        ":disabled)"
+                    ),
+                    {
+                        "id": feed_id,
+                        "url": url,
+                        "original_url": original_url,
+                        "now": now,
+                        "disabled": disabled,
+                    },
+                )
+            for user_id in ("a", "b"):
+                connection.execute(
+                    text(
+                        "INSERT INTO user (id, created_at, last_request, is_frozen) "
+                        "VALUES (:id, :now, :now, 0)"
+                    ),
+                    {"id": user_id, "now": now},
+                )
+            for user_id, feed_id in [("a", 1), ("a", 2), ("b", 2), ("b", 3)]:
+                connection.execute(
+                    text(
+                        "INSERT INTO userfeedlink (user_id, feed_id, created_at) "
+                        "VALUES (:user_id, :feed_id, :now)"
+                    ),
+                    {"user_id": user_id, "feed_id": feed_id, "now": now},
+                )
+            for article_id, feed_id, url in [
+                (1, 1, "https://example.com/1"),
+                (2, 2, "https://example.com/1"),
+                (3, 2, "https://example.com/2"),
+            ]:
+                connection.execute(
+                    text(
+                        "INSERT INTO article (id, title, description, url, pub_date, "
+                        "updated, feed_id) "
+                        "VALUES (:id, 'Article', '', :url, :now, :now, :feed_id)"
+                    ),
+                    {"id": article_id, "url": url, "now": now, "feed_id": feed_id},
+                )
+            # b read the same article in both feeds
+            for article_id in (1, 2):
+                connection.execute(
+                    text(
+                        "INSERT INTO userarticlelink (user_id, article_id, "
+                        "created_at) VALUES ('b', :article_id, :now)"
+                    ),
+                    {"article_id": article_id, "now": now},
+                )
+
+        migrate("e5f6g7h8i9j0")
+
+        with engine.connect() as connection:
+            feeds = connection.execute(
+                text("SELECT id, canonical_key, original_url FROM feed ORDER BY id")
+            ).all()
+            assert feeds == [
+                (1, "example.com/rss", "https://old.example/rss"),
+                (4, "other.example/feed", None),
+            ]
+            subscriptions = connection.execute(
+                text("SELECT user_id, feed_id FROM userfeedlink ORDER BY user_id")
+            ).all()
+            assert subscriptions == [("a", 1), ("b", 1)]
+            articles = connection.execute(
+                text("SELECT id, feed_id FROM article ORDER BY id")
+            ).all()
+            assert articles == [(1, 1), (3, 1)]
+            clicks = connection.execute(
+                text("SELECT user_id, article_id FROM userarticlelink")
+            ).all()
+            assert clicks == [("b", 1)]
+
+
+class TestClusterAssignmentsMigration:
+    def test_adds_nullable_columns(self, migrate):
+        engine = migrate("e5f6g7h8i9j0")
+        now = datetime(2026, 1, 1)
+        with engine.begin() as connection:
+            connection.execute(
+                text(
+                    "INSERT INTO userarticlelink (user_id, article_id, created_at) "
+                    "VALUES ('a', 1, :now)"
+                ),
+                {"now": now},
+            )
+
+        migrate("f6g7h8i9j0k1")
+
+        with engine.connect() as connection:
+            assert connection.execute(
+                text("SELECT cluster, cluster_distance FROM userarticlelink")
+            ).all() == [(None, None)]
+            indexes = connection.execute(
+                text("PRAGMA index_list('userarticlelink')")
+            ).all()
+            assert "ix_userarticlelink_user_id_cluster" in {row[1] for row in indexes}
+
+
+class TestLinkUserIdMigration:
+    def test_makes_user_id_a_string(self, migrate):
+        engine = migrate("g7h8i9j0k1l2")
+        now = datetime(2026, 1, 1)
+        with engine.begin() as connection:
+            connection.execute(
+                text(
+                    "INSERT INTO userfeedlink (user_id, feed_id, created_at) "
+                    "VALUES ('a', 1, :now)"
+                ),
+                {"now": now},
+            )
+            connection.execute(
+                text(
+                    "INSERT INTO userarticlelink (user_id, article_id, created_at) "
+                    "VALUES ('b', 1, :now)"
+                ),
+                {"now": now},
+            )
+
+        migrate("h8i9j0k1l2m3")
+
+        with engine.connect() as connection:
+            for table, user_id in [("userfeedlink", "a"), ("userarticlelink", "b")]:
+                columns = {
+                    row[1]: row[2]
+                    for row in connection.execute(text(f"PRAGMA table_info('{table}')"))
+                }
+                assert columns["user_id"] == "VARCHAR"
+                assert (
+                    connection.execute(
+                        text(f"SELECT user_id FROM {table}")
+                    ).scalar_one()
+                    == user_id
+                )
+            indexes = connection.execute(
+                text("PRAGMA index_list('userarticlelink')")
+            ).all()
+            assert "ix_userarticlelink_user_id_cluster" in {row[1] for row in indexes}
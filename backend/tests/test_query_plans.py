@@ -0,0 +1,135 @@
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from unittest import mock
+
+import pytest
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import Engine, event, text
+from sqlmodel import Session
+
+from app.database import create_db_engine
+from app.models.counter import count_exact
+from app.routers.feed import _latest_articles
+from app.tasks import (
+    fetch_all_feeds,
+    freeze_dormant_users,
+    remove_old_embeddings,
+    retry_disabled_feeds,
+)
+
+BACKEND = Path(__file__).parent.parent
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    """A SQLite database with the schema of the migrations, as in production."""
+    url = f"sqlite:///{tmp_path}/db.sqlite"
+    monkeypatch.setenv("DATABASE_URL", url)
+    monkeypatch.chdir(BACKEND)
+    command.upgrade(Config(str(BACKEND / "alembic.ini")), "head")
+    engine = create_db_engine(url)
+    with mock.patch("app.tasks.ENGINE", engine):
+        yield engine
+    engine.dispose()
+
+
+@contextmanager
+def statements(engine: Engine, keyword: str) -> Iterator[list]:
+    """Collect the statements run on `engine` that contain `keyword`."""
+    captured: list = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):  # type: ignore[no-untyped-def]
+        if keyword in statement and not statement.startswith("EXPLAIN"):
+            captured.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield captured
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def query_plan(engine: Engine, statement: str, parameters) -> str:  # type: ignore[no-untyped-def]
+    with engine.connect() as connection:
+        rows = connection.exec_driver_sql(
+            f"EXPLAIN QUERY PLAN {statement}", parameters
+        ).all()
+    return "\n".join(row[-1] for row in rows)
+
+
+def single_plan(engine: Engine, captured: list) -> str:
+    assert len(captured) == 1, captured
+    return query_plan(engine, *captured[0])
+
+
+class TestQueryPlans:
+    def test_latest_articles_of_a_feed(self, engine):
+        with statements(engine, "ORDER BY article.pub_date DESC") as captured:
+            _latest_articles(engine, 1)
+
+        plan = single_plan(engine, captured)
+        assert "USING INDEX ix_article_feed_id_pub_date (feed_id=?)" in plan
+        assert "TEMP B-TREE" not in plan
+
+    def test_remove_old_embeddings(self, engine):
+        with statements(engine, "UPDATE article SET embedding") as captured:
+            remove_old_embeddings()
+
+        assert "USING INDEX ix_article_updated_embedded (updated<?)" in single_plan(
+            engine, captured
+        )
+
+    def test_freeze_dormant_users(self, engine):
+        with statements(engine, "UPDATE user SET is_frozen") as captured:
+            freeze_dormant_users()
+
+        assert (
+            "USING INDEX ix_user_is_frozen_last_request (is_frozen=? AND last_request<?)"
+            in single_plan(engine, captured)
+        )
+
+    @pytest.mark.parametrize("job", [fetch_all_feeds, retry_disabled_feeds])
+    def test_feeds_of_active_users(self, engine, job):
+        with statements(engine, "JOIN userfeedlink") as captured:
+            job()
+
+        plan = single_plan(engine, captured).splitlines()
+        # From the active users to their feeds, never a scan of all the feeds
+        assert "ix_user_is_frozen_last_request" in plan[0]
+        assert "userfeedlink" in plan[1]
+        assert "feed USING INTEGER PRIMARY KEY" in plan[2]
+
+    def test_filtered_counters(self, engine):
+        with statements(engine, "WHERE") as captured:
+            with Session(engine) as session:
+                count_exact(session)
+
+        plans = {
+            statement.rsplit("WHERE", 1)[1].strip(): query_plan(
+                engine, statement, parameters
+            )
+            for statement, parameters in captured
+        }
+        assert "ix_user_is_frozen_last_request" in plans["user.is_frozen IS 1"]
+        assert "ix_feed_disabled" in plans["feed.is_disabled IS 1"]
+        assert "ix_article_updated_embedded" in plans["article.embedding IS NOT NULL"]
+
+
+class TestIndexesMigration:
+    def test_downgrade(self, engine):
+        config = Config(str(BACKEND / "alembic.ini"))
+        command.downgrade(config, "f6g7h8i9j0k1")
+
+        with engine.connect() as connection:
+            indexes = {
+                row[0]
+                for row in connection.execute(
+                    text("SELECT name FROM sqlite_master WHERE type = 'index'")
+                )
+            }
+        assert {"ix_article_feed_id", "ix_user_is_frozen", "ix_feed_is_disabled"} <= (
+            indexes
+        )
+        assert "ix_article_feed_id_pub_date" not in indexes
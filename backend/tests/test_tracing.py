@@ -0,0 +1,73 @@
+from datetime import datetime, timezone
+from unittest import mock
+from urllib.parse import quote
+
+from sqlmodel import Session
+
+from app.main import app
+from app.models.feed import Feed
+from app.tracing import span, trace, traced
+
+
+class TestTracing:
+    def test_disabled(self):
+        with mock.patch("app.tracing.TRACING_ENABLED", False):
+            with trace("job") as current:
+                with span("stage"):
+                    pass
+
+        assert current is None
+
+    def test_span_outside_trace(self):
+        with span("stage"):
+            pass
+
+    def test_records_stages(self):
+        with mock.patch("app.tracing.TRACING_ENABLED", True):
+            with trace("job", log=False) as current:
+                with span("load"):
+                    pass
+                for _ in range(3):
+                    with span("fetch"):
+                        pass
+
+        assert list(current.stages) == ["load", "fetch"]
+        assert current.server_timing().startswith("load;dur=")
+
+    def test_traced(self):
+        @traced
+        def job(value):
+            with span("work"):
+                pass
+            return value
+
+        with (
+            mock.patch("app.tracing.TRACING_ENABLED", True),
+            mock.patch("app.tracing.logger") as logger,
+        ):
+            assert job(42) == 42
+
+        logger.bind.assert_called_once()
+        assert logger.bind.call_args.kwargs["trace"] == "job"
+        assert "work" in logger.bind.call_args.kwargs["stages"]
+
+    def test_server_timing_header(self, client, engine, test_user_id):
+        with Session(engine) as session:
+            feed = session.get(Feed, 1)
+            feed.updated_at = datetime.now(timezone.utc)
+            session.add(feed)
+            session.commit()
+
+        with mock.patch("app.tracing.TRACING_ENABLED", True):
+            response = client.get(
+                app.url_path_for(
+                    "get_feed",
+                    feed_url=quote("https://news.ycombinator.com/rss"),
+                    user_id=test_user_id,
+                )
+            )
+
+        assert response.status_code == 200
+        server_timing = response.headers["Server-Timing"]
+        for stage in ("user", "feed_lookup", "articles", "render"):
+            assert f"{stage};dur=" in server_timing
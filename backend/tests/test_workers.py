@@ -0,0 +1,110 @@
+import sys
+from unittest import mock
+
+import pytest
+from redis import Redis  # type: ignore
+from rq import SimpleWorker, Worker
+
+from app import recommend
+from app.models.article import Article
+from app.workers import (
+    ForkWorker,
+    MemoryGuardWorker,
+    create_worker,
+    preload,
+    rss_mb,
+)
+
+connection = Redis.from_url("redis://localhost:6379")
+
+
+@pytest.fixture(autouse=True)
+def client_name():
+    # The only commands sent when creating a worker
+    with (
+        mock.patch.object(connection, "client_setname"),
+        mock.patch.object(connection, "client_list", return_value=[]),
+    ):
+        yield
+
+
+@pytest.fixture
+def uncached_model():
+    recommend.load_model.cache_clear()
+    yield
+    recommend.load_model.cache_clear()
+
+
+class TestCreateWorker:
+    def test_fork(self):
+        worker = create_worker(["high"], connection, mode="fork")
+
+        assert type(worker) is ForkWorker
+        assert worker.queue_names() == ["high"]
+
+    def test_preload(self):
+        with mock.patch("app.workers.preload") as preload:
+            worker = create_worker(["low"], connection, mode="preload")
+
+        preload.assert_called_once_with(["low"])
+        assert type(worker) is ForkWorker
+
+    def test_inline(self):
+        worker = create_worker(["gpu"], connection, mode="inline")
+
+        assert isinstance(worker, SimpleWorker)
+
+    def test_unknown_mode(self):
+        with pytest.raises(ValueError):
+            create_worker(["high"], connection, mode="threads")
+
+
+class TestForkWorker:
+    def test_work_horse_metrics_folded_when_it_exits(self):
+        worker = ForkWorker(["high"], connection=connection)
+        worker._horse_pid = 1234
+
+        with (
+            mock.patch.object(Worker, "monitor_work_horse") as monitor,
+            mock.patch("app.workers.mark_process_dead") as mark_process_dead,
+        ):
+            worker.monitor_work_horse(mock.Mock(), mock.Mock())
+
+        monitor.assert_called_once()
+        mark_process_dead.assert_called_once_with(1234)
+
+
+class TestPreload:
+    def test_imports_the_queues_modules(self):
+        modules = preload(["medium", "low"])
+
+        assert modules[0] == "app.tasks"
+        assert modules.count("sklearn.cluster") == 1
+        assert all(module in sys.modules for module in modules)
+
+
+class TestMemoryGuard:
+    def test_stops_over_the_limit(self):
+        worker = MemoryGuardWorker(["gpu"], connection=connection)
+        worker.max_memory_mb = 1
+
+        assert not worker.check_memory()
+        assert worker._stop_requested
+
+    def test_keeps_working_under_the_limit(self):
+        worker = MemoryGuardWorker(["gpu"], connection=connection)
+        worker.max_memory_mb = int(rss_mb()) + 1024
+
+        assert worker.check_memory()
+        assert not worker._stop_requested
+
+
+class TestModelCache:
+    def test_loaded_once_per_process(self, uncached_model):
+        from transformers import AutoModel
+
+        loads = AutoModel.from_pretrained.call_count
+        for i in range(2):
+            recommend.compute_embeddings([Article(title=f"Article {i}")])
+
+        assert AutoModel.from_pretrained.call_count == loads + 1
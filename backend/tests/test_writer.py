@@ -0,0 +1,153 @@
+import json
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+import pytest
+from prometheus_client import REGISTRY
+from sqlmodel import Session, select
+
+from app import writer
+from app.models.counter import Counter, increment_counters
+from app.models.intent import AppliedIntent
+from app.models.relations import UserArticleLink
+from app.models.user import User
+from app.tasks import log_user_action
+
+
+class ListRedis:
+    """The Redis list commands used by the writer."""
+
+    def __init__(self) -> None:
+        self.lists: dict[str, list[bytes]] = {}
+
+    def rpush(self, key: str, value: str | bytes) -> None:
+        if isinstance(value, str):
+            value = value.encode()
+        self.lists.setdefault(key, []).append(value)
+
+    def lrange(self, key: str, start: int, end: int) -> list[bytes]:
+        return self.lists.get(key, [])[start : end + 1]
+
+    def ltrim(self, key: str, start: int, end: int) -> None:
+        items = self.lists.get(key, [])
+        self.lists[key] = items[start:] if end == -1 else items[start : end + 1]
+
+
+@pytest.fixture
+def redis_lists():
+    redis = ListRedis()
+    with mock.patch("app.writer.redis_conn", redis):
+        yield redis.lists
+
+
+@pytest.fixture
+def pipeline(redis_lists):
+    with (
+        mock.patch("app.writer.WRITE_PIPELINE_ENABLED", True),
+        mock.patch("app.tasks.ENGINE", None),  # the jobs must not write
+    ):
+        yield redis_lists
+
+
+@pytest.fixture
+def enqueue():
+    with mock.patch("app.tasks.enqueue_medium_priority") as enqueue:
+        yield enqueue
+
+
+def sample(name: str) -> float:
+    return REGISTRY.get_sample_value(name) or 0.0
+
+
+class TestWrite:
+    def test_applied_right_away_without_pipeline(self, engine, enqueue):
+        with mock.patch("app.tasks.ENGINE", engine):
+            log_user_action("reader", 1, "https://example.com")
+
+        with Session(engine) as session:
+            assert session.get(User, "reader") is not None
+            assert session.exec(select(UserArticleLink)).one().article_id == 1
+        enqueue.assert_called_once()
+
+    def test_queued_with_pipeline(self, engine, pipeline, enqueue):
+        log_user_action("reader", 1, "https://example.com")
+
+        intent = json.loads(pipeline[writer.WRITE_QUEUE_KEY][0])
+        assert intent["kind"] == "click"
+        assert intent["user_id"] == "reader"
+        with Session(engine) as session:
+            assert session.get(User, "reader") is None
+        enqueue.assert_not_called()
+
+
+class TestDrain:
+    def test_batch_in_one_transaction(self, engine, pipeline, enqueue):
+        batches = sample("rssfilter_write_batch_size_count")
+        for user_id in ("a", "b", "c"):
+            log_user_action(user_id, 1, "https://example.com")
+        # A second click on the same article is stored once
+        log_user_action("a", 1, "https://example.com")
+
+        assert writer.drain(engine) == 4
+        assert writer.drain(engine) == 0
+
+        assert sample("rssfilter_write_batch_size_count") == batches + 1
+        assert pipeline[writer.WRITE_QUEUE_KEY] == []
+        with Session(engine) as session:
+            links = session.exec(select(UserArticleLink)).all()
+            assert sorted(link.user_id for link in links) == ["a", "b", "c"]
+        # Clusters are recomputed once the clicks are committed
+        assert enqueue.call_count == 3
+
+    def test_failing_intent_is_set_aside(self, engine, pipeline, enqueue):
+        log_user_action("a", 1, "https://example.com")
+        pipeline[writer.WRITE_QUEUE_KEY].append(b'{"kind": "unknown"}')
+        log_user_action("b", 1, "https://example.com")
+
+        assert writer.drain(engine) == 3
+
+        assert pipeline[writer.WRITE_QUEUE_KEY] == []
+        assert pipeline[writer.WRITE_FAILED_KEY] == [b'{"kind": "unknown"}']
+        with Session(engine) as session:
+            assert len(session.exec(select(UserArticleLink)).all()) == 2
+
+    def test_redelivered_intents_applied_once(self, engine, pipeline):
+        def count(session: Session, intent: dict) -> None:
+            increment_counters(session, {"users.total": 1})
+
+        with Session(engine) as session:
+            session.add(Counter(name="users.total", value=0))
+            session.commit()
+        with mock.patch.dict(writer.HANDLERS, {"count": count}):
+            writer.write(engine, "count", {})
+            writer.write(engine, "count", {})
+            # The writer stops between the commit and the trim
+            with mock.patch("app.writer.redis_conn.ltrim", side_effect=ConnectionError):
+                with pytest.raises(ConnectionError):
+                    writer.drain(engine)
+            writer.write(engine, "count", {})
+
+            assert writer.drain(engine) == 3
+
+        assert pipeline[writer.WRITE_QUEUE_KEY] == []
+        with Session(engine) as session:
+            assert session.get(Counter, "users.total").value == 3
+            assert len(session.exec(select(AppliedIntent)).all()) == 3
+
+    def test_old_applied_ids_removed(self, engine, pipeline, enqueue):
+        old = datetime.now(timezone.utc) - timedelta(
+            seconds=writer.WRITE_APPLIED_RETENTION + 60
+        )
+        with Session(engine) as session:
+            session.add(AppliedIntent(id="old", applied_at=old))
+            session.add(AppliedIntent(id="recent"))
+            session.commit()
+        log_user_action("a", 1, "https://example.com")
+
+        writer.drain(engine)
+
+        with Session(engine) as session:
+            ids = set(session.exec(select(AppliedIntent.id)).all())
+        assert "old" not in ids
+        assert "recent" in ids
+        assert len(ids) == 2
@@ -1,17 +1,28 @@
 #!/usr/bin/env python
+"""RQ worker for the queues given as arguments.
+
+WORKER_MODE selects how the jobs run: forked per job (default), forked from a
+parent that preloaded the application, or inline (see app/workers.py).
+"""
+
 from sys import argv
 from redis import Redis  # type: ignore
-from rq import Worker
 
-# Preload libraries
 import os
-from loguru import logger
+
+from app.metrics import clear_multiprocess_dir, start_metrics_server
+from app.workers import create_worker
 
 
 queue_names: list[str] = argv[1:]
-logger.info(f"Starting worker with queues: {queue_names}")
 
-w = Worker(
+# Work-horses are forked per job, so PROMETHEUS_MULTIPROC_DIR must be set for
+# their samples to be visible here
+clear_multiprocess_dir()
+if (metrics_port := os.getenv("METRICS_PORT")) is not None:
+    start_metrics_server(int(metrics_port))
+
+w = create_worker(
     queue_names,
     connection=Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379")),
 )
@@ -0,0 +1,16 @@
+#!/usr/bin/env python
+"""Writer process applying the queued write intents (see app/writer.py).
+
+Only run it, as a single instance, when WRITE_PIPELINE is enabled.
+"""
+
+import os
+
+from app.metrics import clear_multiprocess_dir, start_metrics_server
+from app.writer import run_writer
+
+if __name__ == "__main__":
+    clear_multiprocess_dir()
+    if (metrics_port := os.getenv("METRICS_PORT")) is not None:
+        start_metrics_server(int(metrics_port))
+    run_writer()
@@ -51,11 +51,31 @@ async function handleOpmlUpload() {
         
         const customOpmlDownloadDiv = document.getElementById('customOpmlDownload');
         customOpmlDownloadDiv.appendChild(customOpmlUrl);
+        showImportProgress(userId, customOpmlDownloadDiv);
     } else {
         alert('Failed to process OPML file.');
     }
 }
 
+// Shows how many of the imported feeds have been fetched, until all are done
+async function showImportProgress(userId, container) {
+    const progress = document.createElement('p');
+    container.appendChild(progress);
+    while (true) {
+        const response = await fetch(`${apiBaseUrl}/v1/signup/process_opml/${userId}/progress`);
+        if (response.status !== 200) {
+            return;
+        }
+        const data = await response.json();
+        progress.innerText = `Feeds ready: ${data.ready} of ${data.total}` +
+            (data.failed ? ` (${data.failed} failed)` : '');
+        if (data.pending === 0) {
+            return;
+        }
+        await new Promise(resolve => setTimeout(resolve, 2000));
+    }
+}
+
 // Helper function to register user and return user ID
 async function registerUser() {
     const response = await fetch(`${apiBaseUrl}/v1/signup/user`, { method: 'POST' });